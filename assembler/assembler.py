@@ -1,9 +1,65 @@
 # RISC-V 32IM Assembler
 # File: assembler/assembler.py
+#
+# Library use: assemble(source) returns the words, symbol table and
+# diagnostics without touching the console, or the filesystem other than for
+# .include, and calls in several threads at once keep their diagnostics
+# apart. main() is the command-line wrapper; argparse and the image writers
+# are imported lazily.
 
-import argparse
+import contextvars
 import re
 import os  # Added for directory creation
+import sys
+from array import array
+from collections import namedtuple
+
+# A message about one source line (1-based, None for the whole program).
+# severity is 'info', 'warning' or 'error'; code is a short stable identifier
+# such as 'imm-range', 'unknown-instruction' or 'directive-ignored'.
+Diagnostic = namedtuple('Diagnostic', 'line severity code message')
+
+SEVERITY_LABELS = {'info': 'Info', 'warning': 'Warning', 'error': 'Error'}
+
+
+class _AssemblyState:
+    """Per-call state read by report(), kept in a context variable so that
+    assemble() calls in different threads never mix their diagnostics."""
+    __slots__ = ('diagnostics', 'line', 'context')
+
+    def __init__(self, diagnostics=None):
+        self.diagnostics = diagnostics  # List collecting Diagnostic records, or None to print them
+        self.line = None  # Source line being encoded, for messages raised by the encoders
+        self.context = None  # Where in a macro/.rept/include that line came from (see preprocessor.py)
+
+
+_state = contextvars.ContextVar('assembler_state', default=None)
+
+
+def _current_state():
+    """The state of the running assemble() call, or a printing one outside of it."""
+    state = _state.get()
+    if state is None:
+        state = _AssemblyState()
+        _state.set(state)
+    return state
+
+
+def format_diagnostic(diagnostic):
+    location = f"line {diagnostic.line}: " if diagnostic.line is not None else ""
+    return f"{SEVERITY_LABELS[diagnostic.severity]}: {location}{diagnostic.message}"
+
+
+def report(severity, code, message, line=None):
+    """Records a diagnostic, or prints it when no assemble() call is collecting them."""
+    state = _current_state()
+    if line is None and state.context:
+        message = f"{message} ({state.context})"
+    diagnostic = Diagnostic(line if line is not None else state.line, severity, code, message)
+    if state.diagnostics is None:
+        print(format_diagnostic(diagnostic))
+    else:
+        state.diagnostics.append(diagnostic)
 
 # Instruction type formats and opcodes (incomplete, expand as needed)
 # For RV32I + M extension
@@ -82,10 +138,30 @@ FUNCT3_SH = 0b001
 FUNCT3_SW = 0b010
 
 
+# Register lookup table: numeric names (x0-x31) plus ABI names.
+# Built once at import time so register decoding is a single dict lookup.
+REGISTER_MAP = {f"x{i}": i for i in range(32)}
+REGISTER_MAP.update({
+    'zero': 0, 'ra': 1, 'sp': 2, 'gp': 3, 'tp': 4,
+    't0': 5, 't1': 6, 't2': 7,
+    's0': 8, 'fp': 8, 's1': 9,
+    'a0': 10, 'a1': 11, 'a2': 12, 'a3': 13, 'a4': 14, 'a5': 15, 'a6': 16, 'a7': 17,
+    's2': 18, 's3': 19, 's4': 20, 's5': 21, 's6': 22, 's7': 23, 's8': 24, 's9': 25, 's10': 26, 's11': 27,
+    't3': 28, 't4': 29, 't5': 30, 't6': 31
+})
+
+
 def register_to_int(reg_str):
     """Converts a register string like 'x10' or 'a0' to its integer number."""
+    reg = REGISTER_MAP.get(reg_str)
+    if reg is not None:
+        return reg
     reg_str = reg_str.lower()
+    reg = REGISTER_MAP.get(reg_str)
+    if reg is not None:
+        return reg
     if reg_str.startswith('x'):
+        # Accept spellings such as 'x05' that are not in the table
         try:
             val = int(reg_str[1:])
             if not (0 <= val <= 31):
@@ -93,17 +169,6 @@ def register_to_int(reg_str):
             return val
         except ValueError:
             raise ValueError(f"Invalid register number: {reg_str}")
-
-    abi_map = {
-        'zero': 0, 'ra': 1, 'sp': 2, 'gp': 3, 'tp': 4,
-        't0': 5, 't1': 6, 't2': 7,
-        's0': 8, 'fp': 8, 's1': 9,
-        'a0': 10, 'a1': 11, 'a2': 12, 'a3': 13, 'a4': 14, 'a5': 15, 'a6': 16, 'a7': 17,
-        's2': 18, 's3': 19, 's4': 20, 's5': 21, 's6': 22, 's7': 23, 's8': 24, 's9': 25, 's10': 26, 's11': 27,
-        't3': 28, 't4': 29, 't5': 30, 't6': 31
-    }
-    if reg_str in abi_map:
-        return abi_map[reg_str]
     raise ValueError(f"Unknown register: {reg_str}")
 
 
@@ -117,14 +182,20 @@ def parse_immediate(imm_str, labels=None, current_address=0, is_branch_or_jal=Fa
             return offset
         return label_address
     try:
-        if imm_str.lower().startswith('0x'):
-            return int(imm_str, 16)
-        elif imm_str.lower().startswith('0b'):
-            return int(imm_str, 2)
-        else:
-            return int(imm_str)
+        return int(imm_str)  # Plain decimal is by far the most common form
     except ValueError:
-        raise ValueError(f"Invalid immediate value: {imm_str}")
+        pass
+    try:
+        sign = -1 if imm_str[:1] == '-' else 1
+        digits = imm_str.lstrip('+-')
+        prefix = digits[:2].lower()
+        if prefix == '0x':
+            return sign * int(digits, 16)
+        elif prefix == '0b':
+            return sign * int(digits, 2)
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid immediate value: {imm_str}")
 
 
 def assemble_r_type(rd, rs1, rs2, funct3, funct7, opcode):
@@ -141,8 +212,8 @@ def assemble_i_type(rd, rs1, imm_str, funct3, opcode, labels=None, current_addre
     imm_val = parse_immediate(
         imm_str, labels, current_address, is_branch_or_jal=False)
     if not (-2048 <= imm_val <= 2047):  # 12-bit signed
-        print(
-            f"Warning: I-type immediate {imm_val} for {rd},{rs1},{imm_str} out of 12-bit signed range.")
+        report('warning', 'imm-range',
+               f"I-type immediate {imm_val} for {rd},{rs1},{imm_str} out of 12-bit signed range.")
     return ((imm_val & 0xFFF) << 20) | (rs1_int << 15) | \
            (funct3 << 12) | (rd_int << 7) | opcode
 
@@ -153,8 +224,7 @@ def assemble_s_type(rs1, rs2, imm_str, funct3, opcode, labels=None, current_addr
     imm_val = parse_immediate(
         imm_str, labels, current_address, is_branch_or_jal=False)
     if not (-2048 <= imm_val <= 2047):  # 12-bit signed
-        print(
-            f"Warning: S-type immediate {imm_val} out of 12-bit signed range.")
+        report('warning', 'imm-range', f"S-type immediate {imm_val} out of 12-bit signed range.")
     imm11_5 = (imm_val >> 5) & 0x7F
     imm4_0 = imm_val & 0x1F
     return (imm11_5 << 25) | (rs2_int << 20) | (rs1_int << 15) | \
@@ -186,12 +256,14 @@ def assemble_j_type(rd, label_str, labels, current_address):
     """Assembles a J-type instruction (JAL)."""
     rd_int = register_to_int(rd)
     
-    # Calculate the offset to the label
-    if label_str not in labels:
-        raise ValueError(f"Undefined label: {label_str}")
-    
-    target_address = labels[label_str]
-    offset = target_address - current_address
+    # Calculate the offset to the label; a number is the offset itself, as for branches
+    if label_str in labels:
+        offset = labels[label_str] - current_address
+    else:
+        try:
+            offset = parse_immediate(label_str)
+        except ValueError:
+            raise ValueError(f"Undefined label: {label_str}") from None
     
     # J-type immediate encoding: imm[20|10:1|11|19:12]
     # The immediate is 21 bits, but bit 0 is always 0 (instructions are 4-byte aligned)
@@ -219,273 +291,987 @@ def assemble_u_type(rd, imm_str, opcode, labels=None, current_address=0):
     
     # U-type immediate is 20 bits, placed in bits [31:12]
     # The lower 12 bits are automatically zero
-    if imm_val < 0 or imm_val > 0xFFFFF:  # 20-bit unsigned range
+    if imm_val < -0x80000 or imm_val > 0xFFFFF:  # 20-bit signed or unsigned range
         raise ValueError(f"U-type immediate out of range: {imm_val}")
     
     # Assemble: imm[31:12] | rd[11:7] | opcode[6:0]
-    machine_code = (imm_val << 12) | (rd_int << 7) | opcode
+    machine_code = ((imm_val & 0xFFFFF) << 12) | (rd_int << 7) | opcode
     return machine_code
 
 
-def assemble_line(line_content, labels, current_address):
-    """Assembles a single line of assembly code."""
-    # Improved parsing for instructions like lw x5, 0(x6)
-    match = re.match(r"([a-zA-Z.]+)\s*([^#]*)", line_content)
+# Operand layouts understood by the table-driven encoder
+FMT_R = 'R'          # op rd, rs1, rs2
+FMT_I = 'I'          # op rd, rs1, imm
+FMT_SHIFT = 'SHIFT'  # op rd, rs1, shamt
+FMT_LOAD = 'LOAD'    # op rd, offset(rs1)
+FMT_S = 'S'          # op rs2, offset(rs1)
+FMT_B = 'B'          # op rs1, rs2, label
+FMT_U = 'U'          # op rd, imm
+FMT_J = 'J'          # op rd, label
+FMT_NONE = 'NONE'    # op (no operands, e.g. nop)
+
+# Number of (split) operands expected for each layout
+FORMAT_OPERAND_COUNT = {
+    FMT_R: 3, FMT_I: 3, FMT_SHIFT: 3, FMT_LOAD: 3, FMT_S: 3,
+    FMT_B: 3, FMT_U: 2, FMT_J: 2, FMT_NONE: 0,
+}
+
+InstructionSpec = namedtuple('InstructionSpec', 'fmt opcode funct3 funct7')
+
+# Declarative opcode table: mnemonic -> (format, opcode, funct3, funct7)
+INSTRUCTION_TABLE = {
+    # R-type
+    'add': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_ADD, FUNCT7_ADD),
+    'sub': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_SUB, FUNCT7_SUB),
+    'and': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_AND, FUNCT7_ADD),
+    'or': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_OR, FUNCT7_ADD),
+    'xor': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_XOR, FUNCT7_ADD),
+    'sll': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_SLL, FUNCT7_ADD),
+    'srl': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_SRL, FUNCT7_ADD),
+    'sra': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_SRA, FUNCT7_SRA),
+    'slt': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_SLT, FUNCT7_ADD),
+    'sltu': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_SLTU, FUNCT7_ADD),
+    # M-extension R-type
+    'mul': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_MUL, FUNCT7_MULDIV),
+    'div': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_DIV, FUNCT7_MULDIV),
+    'divu': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_DIVU, FUNCT7_MULDIV),
+    'rem': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_REM, FUNCT7_MULDIV),
+    'remu': InstructionSpec(FMT_R, OPCODE_OP, FUNCT3_REMU, FUNCT7_MULDIV),
+    # I-type arithmetic/logic
+    'addi': InstructionSpec(FMT_I, OPCODE_IMM, FUNCT3_ADDI, 0),
+    'andi': InstructionSpec(FMT_I, OPCODE_IMM, FUNCT3_ANDI, 0),
+    'ori': InstructionSpec(FMT_I, OPCODE_IMM, FUNCT3_ORI, 0),
+    'xori': InstructionSpec(FMT_I, OPCODE_IMM, FUNCT3_XORI, 0),
+    'slti': InstructionSpec(FMT_I, OPCODE_IMM, FUNCT3_SLTI, 0),
+    'sltiu': InstructionSpec(FMT_I, OPCODE_IMM, FUNCT3_SLTIU, 0),
+    'jalr': InstructionSpec(FMT_I, OPCODE_JALR, 0b000, 0),
+    # I-type shifts (funct7 goes into imm[11:5])
+    'slli': InstructionSpec(FMT_SHIFT, OPCODE_IMM, FUNCT3_SLLI, FUNCT7_SLLI),
+    'srli': InstructionSpec(FMT_SHIFT, OPCODE_IMM, FUNCT3_SRLI, FUNCT7_SRLI),
+    'srai': InstructionSpec(FMT_SHIFT, OPCODE_IMM, FUNCT3_SRAI, FUNCT7_SRAI),
+    # Loads and stores
+    'lw': InstructionSpec(FMT_LOAD, OPCODE_LOAD, FUNCT3_LW, 0),
+    'sw': InstructionSpec(FMT_S, OPCODE_STORE, FUNCT3_SW, 0),
+    # Branches
+    'beq': InstructionSpec(FMT_B, OPCODE_BRANCH, FUNCT3_BEQ, 0),
+    'bne': InstructionSpec(FMT_B, OPCODE_BRANCH, FUNCT3_BNE, 0),
+    'blt': InstructionSpec(FMT_B, OPCODE_BRANCH, FUNCT3_BLT, 0),
+    'bge': InstructionSpec(FMT_B, OPCODE_BRANCH, FUNCT3_BGE, 0),
+    'bltu': InstructionSpec(FMT_B, OPCODE_BRANCH, FUNCT3_BLTU, 0),
+    'bgeu': InstructionSpec(FMT_B, OPCODE_BRANCH, FUNCT3_BGEU, 0),
+    # U-type and J-type
+    'lui': InstructionSpec(FMT_U, OPCODE_LUI, 0, 0),
+    'auipc': InstructionSpec(FMT_U, OPCODE_AUIPC, 0, 0),
+    'jal': InstructionSpec(FMT_J, OPCODE_JAL, 0, 0),
+    # nop == addi x0, x0, 0
+    'nop': InstructionSpec(FMT_NONE, OPCODE_IMM, FUNCT3_ADDI, 0),
+}
+
+# Precompiled parsers
+INSTRUCTION_RE = re.compile(r"([a-zA-Z.]+)\s*([^#]*)")
+LABEL_RE = re.compile(r"^\s*([a-zA-Z_][a-zA-Z0-9_]*):\s*(.*)")
+LINE_REF_RE = re.compile(r'\bline (\d+)')  # Source line quoted in an error message
+
+
+def split_operands(args_str):
+    """Splits an operand string, expanding 'offset(reg)' into offset and reg."""
+    args = []
+    if not args_str:
+        return args
+    for arg in args_str.split(','):
+        arg = arg.strip()
+        if '(' in arg and arg.endswith(')'):  # For "offset(reg)" format
+            offset, base_reg = arg.split('(', 1)
+            args.append(offset.strip())
+            args.append(base_reg[:-1].strip())  # Remove ')' and strip
+        else:
+            args.append(arg)
+    return args
+
+
+def _encode_r(spec, args, labels, current_address):
+    return assemble_r_type(args[0], args[1], args[2], spec.funct3, spec.funct7, spec.opcode)
+
+
+def _encode_i(spec, args, labels, current_address):
+    return assemble_i_type(args[0], args[1], args[2], spec.funct3, spec.opcode, labels, current_address)
+
+
+def _encode_shift(spec, args, labels, current_address):
+    shamt = parse_immediate(args[2]) & 0x1F  # shamt is 5 bits for RV32I
+    imm_val = (spec.funct7 << 5) | shamt
+    return (imm_val << 20) | (register_to_int(args[1]) << 15) | \
+           (spec.funct3 << 12) | (register_to_int(args[0]) << 7) | spec.opcode
+
+
+def _encode_load(spec, args, labels, current_address):
+    # lw rd, offset(rs1) -> args: rd, offset, rs1
+    return assemble_i_type(args[0], args[2], args[1], spec.funct3, spec.opcode, labels, current_address)
+
+
+def _encode_s(spec, args, labels, current_address):
+    # sw rs2, offset(rs1) -> args: rs2, offset, rs1
+    return assemble_s_type(args[2], args[0], args[1], spec.funct3, spec.opcode, labels, current_address)
+
+
+def _encode_b(spec, args, labels, current_address):
+    return assemble_b_type(args[0], args[1], args[2], spec.funct3, spec.opcode, labels, current_address)
+
+
+def _encode_u(spec, args, labels, current_address):
+    return assemble_u_type(args[0], args[1], spec.opcode, labels, current_address)
+
+
+def _encode_j(spec, args, labels, current_address):
+    return assemble_j_type(args[0], args[1], labels, current_address)
+
+
+def _encode_none(spec, args, labels, current_address):
+    return (spec.funct3 << 12) | spec.opcode
+
+
+FORMAT_ENCODERS = {
+    FMT_R: _encode_r,
+    FMT_I: _encode_i,
+    FMT_SHIFT: _encode_shift,
+    FMT_LOAD: _encode_load,
+    FMT_S: _encode_s,
+    FMT_B: _encode_b,
+    FMT_U: _encode_u,
+    FMT_J: _encode_j,
+    FMT_NONE: _encode_none,
+}
+
+
+def encode_instruction(instr, args, labels, current_address):
+    """Encodes a lowercase mnemonic and its split operands into a 32-bit word.
+
+    Returns None if the mnemonic is not in INSTRUCTION_TABLE.
+    """
+    spec = INSTRUCTION_TABLE.get(instr)
+    if spec is None:
+        return None
+    expected = FORMAT_OPERAND_COUNT[spec.fmt]
+    if len(args) != expected:
+        raise ValueError(
+            f"'{instr}' expects {expected} operands, got {len(args)}: {args}")
+    return FORMAT_ENCODERS[spec.fmt](spec, args, labels, current_address)
+
+
+def _signed32(value):
+    value &= 0xFFFFFFFF
+    return value - (1 << 32) if value & 0x80000000 else value
+
+
+def li_sequence(rd, value):
+    """Shortest sequence loading a 32-bit constant: addi, lui, or lui+addi.
+
+    addi sign-extends its immediate, so when bit 11 of the constant is set the
+    upper part is rounded up by one (the +0x800) to compensate.
+    """
+    if not -0x80000000 <= value <= 0xFFFFFFFF:
+        raise ValueError(f"Constant {value} does not fit in 32 bits")
+    value = _signed32(value)
+    if -2048 <= value <= 2047:
+        return [('addi', [rd, 'x0', str(value)])]
+    upper = ((value + 0x800) >> 12) & 0xFFFFF
+    lower = _signed32(value - (upper << 12))
+    if lower == 0:
+        return [('lui', [rd, str(upper)])]
+    return [('lui', [rd, str(upper)]), ('addi', [rd, rd, str(lower)])]
+
+
+def _far_jump(rd, link, label, labels, current_address):
+    """jal when the target is within +-1 MiB, else auipc+jalr through `link`."""
+    offset = parse_immediate(label, labels, current_address, is_branch_or_jal=True)
+    if -1048576 <= offset <= 1048574:
+        return [('jal', [rd, label])]
+    upper = ((offset + 0x800) >> 12) & 0xFFFFF
+    return [('auipc', [link, str(upper)]), ('jalr', [rd, link, str(_signed32(offset - (upper << 12)))])]
+
+
+def _swap_branch(real):
+    return lambda args, labels, address: [(real, [args[1], args[0], args[2]])]
+
+
+def _zero_branch(real, zero_first=False):
+    if zero_first:
+        return lambda args, labels, address: [(real, ['x0', args[0], args[1]])]
+    return lambda args, labels, address: [(real, [args[0], 'x0', args[1]])]
+
+
+# Pseudo-instructions, keyed by (mnemonic, operand count) so that the short
+# forms of jal/jalr can coexist with the real instructions. Each entry maps
+# (args, labels, current_address) to a list of (real mnemonic, args).
+PSEUDO_INSTRUCTIONS = {
+    ('li', 2): lambda args, labels, address: li_sequence(args[0], parse_immediate(args[1], labels)),
+    # Data memory is separate from instruction memory, so addresses are loaded as absolute constants
+    ('la', 2): lambda args, labels, address: li_sequence(args[0], parse_immediate(args[1], labels)),
+    ('mv', 2): lambda args, labels, address: [('addi', [args[0], args[1], '0'])],
+    ('not', 2): lambda args, labels, address: [('xori', [args[0], args[1], '-1'])],
+    ('neg', 2): lambda args, labels, address: [('sub', [args[0], 'x0', args[1]])],
+    ('seqz', 2): lambda args, labels, address: [('sltiu', [args[0], args[1], '1'])],
+    ('snez', 2): lambda args, labels, address: [('sltu', [args[0], 'x0', args[1]])],
+    ('sltz', 2): lambda args, labels, address: [('slt', [args[0], args[1], 'x0'])],
+    ('sgtz', 2): lambda args, labels, address: [('slt', [args[0], 'x0', args[1]])],
+    ('j', 1): lambda args, labels, address: [('jal', ['x0', args[0]])],
+    ('jal', 1): lambda args, labels, address: [('jal', ['x1', args[0]])],
+    ('jr', 1): lambda args, labels, address: [('jalr', ['x0', args[0], '0'])],
+    ('jalr', 1): lambda args, labels, address: [('jalr', ['x1', args[0], '0'])],
+    ('ret', 0): lambda args, labels, address: [('jalr', ['x0', 'x1', '0'])],
+    ('call', 1): lambda args, labels, address: _far_jump('x1', 'x1', args[0], labels, address),
+    ('tail', 1): lambda args, labels, address: _far_jump('x0', 'x6', args[0], labels, address),
+    ('beqz', 2): _zero_branch('beq'),
+    ('bnez', 2): _zero_branch('bne'),
+    ('bltz', 2): _zero_branch('blt'),
+    ('bgez', 2): _zero_branch('bge'),
+    ('blez', 2): _zero_branch('bge', zero_first=True),
+    ('bgtz', 2): _zero_branch('blt', zero_first=True),
+    ('bgt', 3): _swap_branch('blt'),
+    ('ble', 3): _swap_branch('bge'),
+    ('bgtu', 3): _swap_branch('bltu'),
+    ('bleu', 3): _swap_branch('bgeu'),
+}
+
+# Pseudo-instructions whose expansion length depends on a value or a label
+VARIABLE_SIZE_PSEUDOS = frozenset(('li', 'la', 'call', 'tail'))
+MAX_PSEUDO_WORDS = 2
+
+# Conditional branch -> branch with the opposite condition, used for relaxation
+INVERTED_BRANCHES = {'beq': 'bne', 'bne': 'beq', 'blt': 'bge', 'bge': 'blt',
+                     'bltu': 'bgeu', 'bgeu': 'bltu'}
+BRANCH_MNEMONICS = frozenset(INVERTED_BRANCHES) | frozenset(
+    name for name, _ in PSEUDO_INSTRUCTIONS if name.startswith('b'))
+
+
+def relax_branch(instr, args, labels, current_address):
+    """Rewrites a conditional branch whose label is out of the B-type range (-4096..4094).
+
+    The branch becomes the inverted condition skipping over a `jal x0, label`,
+    which reaches +-1 MiB. Branches to numeric offsets or unknown labels are left alone.
+    """
+    if len(args) != 3 or not labels or labels.get(args[2]) is None:
+        return [(instr, args)]
+    offset = labels[args[2]] - current_address
+    if -4096 <= offset <= 4094:
+        return [(instr, args)]
+    return [(INVERTED_BRANCHES[instr], [args[0], args[1], '8']), ('jal', ['x0', args[2]])]
+
+
+def expand_line(instr, args, labels, current_address):
+    """Returns the real instructions [(mnemonic, args)] for one source instruction."""
+    pseudo = PSEUDO_INSTRUCTIONS.get((instr, len(args)))
+    if pseudo is None:
+        expansion = [(instr, args)]
+    else:
+        expansion = pseudo(args, labels or {}, current_address)
+    if len(expansion) == 1 and expansion[0][0] in INVERTED_BRANCHES:
+        return relax_branch(*expansion[0], labels, current_address)
+    return expansion
+
+
+def line_size(line_text, labels, current_address):
+    """Number of words a (cleaned) instruction line occupies at `current_address`.
+
+    Labels that are not known yet make variable-size pseudo-instructions
+    assume their longest expansion; branches to them assume they are in range.
+    """
+    match = INSTRUCTION_RE.match(line_text)
+    if not match:
+        return 1
+    instr = match.group(1).lower()
+    args = split_operands(match.group(2).strip())
+    if instr in BRANCH_MNEMONICS:
+        try:
+            return len(expand_line(instr, args, labels, current_address))
+        except ValueError:
+            return 1
+    if instr not in VARIABLE_SIZE_PSEUDOS or (instr, len(args)) not in PSEUDO_INSTRUCTIONS:
+        return 1
+    try:
+        return len(expand_line(instr, args, labels, current_address))
+    except ValueError:
+        return MAX_PSEUDO_WORDS
+
+
+def is_variable_size(line_text):
+    """Cheap check for lines whose size must be recomputed during layout."""
+    instr = line_text.split(maxsplit=1)[0].lower()
+    return instr in VARIABLE_SIZE_PSEUDOS or instr in BRANCH_MNEMONICS
+
+
+def is_relaxed_branch(line_text, size):
+    """True if a conditional branch line was laid out as a relaxed branch+jal pair."""
+    return size > 1 and line_text.split(maxsplit=1)[0].lower() in BRANCH_MNEMONICS
+
+
+def assemble_line_words(line_content, labels, current_address):
+    """Assembles one line into a list of '%08x' words; pseudo-instructions may need several."""
+    match = INSTRUCTION_RE.match(line_content)
     if not match:
         if line_content and not line_content.isspace():  # Non-empty, non-comment line that doesn't match
-            print(
-                f"Warning: Could not parse instruction part of line: {line_content}")
+            report('warning', 'parse', f"Could not parse instruction part of line: {line_content}")
         return None  # Skip if truly empty or unparsable
 
     instr = match.group(1).lower()
-    args_str = match.group(2).strip()
 
-    # Argument parsing robustly handling spaces around commas and parentheses
-    args = []
-    if args_str:
-        # Split by comma, then process load/store format "offset(reg)"
-        raw_args = [a.strip() for a in args_str.split(',')]
-        for arg in raw_args:
-            if '(' in arg and arg.endswith(')'):  # For "offset(reg)" format
-                offset, base_reg = arg.split('(', 1)
-                args.append(offset.strip())
-                args.append(base_reg[:-1].strip())  # Remove ')' and strip
-            else:
-                args.append(arg)
-
-    machine_code = None
-
-    # Handle pseudo-instructions and directives first
+    # Handle directives first
     if instr.startswith('.'):  # like .globl, .data, .text etc.
-        print(f"Info: Directive '{instr}' encountered, currently ignored.")
+        report('info', 'directive-ignored', f"Directive '{instr}' encountered, currently ignored.")
         return None  # Ignored for now
 
-    if instr == 'nop':
-        machine_code = assemble_i_type(
-            'x0', 'x0', '0', FUNCT3_ADDI, OPCODE_IMM, labels, current_address)
-    elif instr == 'addi':
-        machine_code = assemble_i_type(
-            args[0], args[1], args[2], FUNCT3_ADDI, OPCODE_IMM, labels, current_address)
-    elif instr == 'andi':
-        machine_code = assemble_i_type(
-            args[0], args[1], args[2], FUNCT3_ANDI, OPCODE_IMM, labels, current_address)
-    elif instr == 'ori':
-        machine_code = assemble_i_type(
-            args[0], args[1], args[2], FUNCT3_ORI, OPCODE_IMM, labels, current_address)
-    elif instr == 'xori':
-        machine_code = assemble_i_type(
-            args[0], args[1], args[2], FUNCT3_XORI, OPCODE_IMM, labels, current_address)
-    elif instr == 'slti':
-        machine_code = assemble_i_type(
-            args[0], args[1], args[2], FUNCT3_SLTI, OPCODE_IMM, labels, current_address)
-    elif instr == 'sltiu':
-        machine_code = assemble_i_type(
-            args[0], args[1], args[2], FUNCT3_SLTIU, OPCODE_IMM, labels, current_address)
-    elif instr == 'add':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_ADD, FUNCT7_ADD, OPCODE_OP)
-    elif instr == 'sub':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_SUB, FUNCT7_SUB, OPCODE_OP)
-    elif instr == 'and':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_AND, FUNCT7_ADD, OPCODE_OP)
-    elif instr == 'or':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_OR, FUNCT7_ADD, OPCODE_OP)
-    elif instr == 'xor':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_XOR, FUNCT7_ADD, OPCODE_OP)
-    elif instr == 'sll':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_SLL, FUNCT7_ADD, OPCODE_OP)
-    elif instr == 'srl':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_SRL, FUNCT7_ADD, OPCODE_OP)
-    elif instr == 'sra':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_SRA, FUNCT7_SUB, OPCODE_OP)
-    elif instr == 'slt':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_SLT, FUNCT7_ADD, OPCODE_OP)
-    elif instr == 'sltu':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_SLTU, FUNCT7_ADD, OPCODE_OP)
-    elif instr == 'mul':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_MUL, FUNCT7_MULDIV, OPCODE_OP)
-    elif instr == 'div':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_DIV, FUNCT7_MULDIV, OPCODE_OP)
-    elif instr == 'divu':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_DIVU, FUNCT7_MULDIV, OPCODE_OP)
-    elif instr == 'rem':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_REM, FUNCT7_MULDIV, OPCODE_OP)
-    elif instr == 'remu':
-        machine_code = assemble_r_type(
-            args[0], args[1], args[2], FUNCT3_REMU, FUNCT7_MULDIV, OPCODE_OP)
-    elif instr == 'lw':  # lw rd, offset(rs1) -> args: rd, offset, rs1
-        machine_code = assemble_i_type(
-            args[0], args[2], args[1], FUNCT3_LW, OPCODE_LOAD, labels, current_address)
-    elif instr == 'sw':  # sw rs2, offset(rs1) -> args: rs2, offset, rs1
-        machine_code = assemble_s_type(
-            args[2], args[0], args[1], FUNCT3_SW, OPCODE_STORE, labels, current_address)
-    elif instr == 'beq':  # beq rs1, rs2, label -> args: rs1, rs2, label
-        machine_code = assemble_b_type(
-            args[0], args[1], args[2], FUNCT3_BEQ, OPCODE_BRANCH, labels, current_address)
-    elif instr == 'bne':  # bne rs1, rs2, label -> args: rs1, rs2, label
-        machine_code = assemble_b_type(
-            args[0], args[1], args[2], FUNCT3_BNE, OPCODE_BRANCH, labels, current_address)
-    elif instr == 'blt':  # blt rs1, rs2, label -> args: rs1, rs2, label
-        machine_code = assemble_b_type(
-            args[0], args[1], args[2], FUNCT3_BLT, OPCODE_BRANCH, labels, current_address)
-    elif instr == 'bge':  # bge rs1, rs2, label -> args: rs1, rs2, label
-        machine_code = assemble_b_type(
-            args[0], args[1], args[2], FUNCT3_BGE, OPCODE_BRANCH, labels, current_address)
-    elif instr == 'bltu':  # bltu rs1, rs2, label -> args: rs1, rs2, label
-        machine_code = assemble_b_type(
-            args[0], args[1], args[2], FUNCT3_BLTU, OPCODE_BRANCH, labels, current_address)
-    elif instr == 'bgeu':  # bgeu rs1, rs2, label -> args: rs1, rs2, label
-        machine_code = assemble_b_type(
-            args[0], args[1], args[2], FUNCT3_BGEU, OPCODE_BRANCH, labels, current_address)
-    elif instr == 'jal':  # jal rd, label -> args: rd, label
-        machine_code = assemble_j_type(
-            args[0], args[1], labels, current_address)
-    elif instr == 'jalr':  # jalr rd, rs1, offset -> args: rd, rs1, offset
-        machine_code = assemble_i_type(
-            args[0], args[1], args[2], 0b000, OPCODE_JALR, labels, current_address)
-    # Add more instructions here...
-    # SLLI, SRLI, SRAI (I-type, but shamt is in imm field)
-    elif instr == 'slli':  # slli rd, rs1, shamt
-        shamt = int(args[2]) & 0x1F  # shamt is 5 bits for RV32I
-        # For RV32I, funct7 for SLLI is 0000000
-        imm_val_for_slli = (FUNCT7_SLLI << 5) | shamt
-        machine_code = assemble_i_type(args[0], args[1], str(
-            imm_val_for_slli), FUNCT3_SLLI, OPCODE_IMM, labels, current_address)
-    elif instr == 'srli':  # srli rd, rs1, shamt
-        shamt = int(args[2]) & 0x1F
-        # For RV32I, funct7 for SRLI is 0000000
-        imm_val_for_srli = (FUNCT7_SRLI << 5) | shamt
-        machine_code = assemble_i_type(args[0], args[1], str(
-            imm_val_for_srli), FUNCT3_SRLI, OPCODE_IMM, labels, current_address)
-    elif instr == 'srai':  # srai rd, rs1, shamt
-        shamt = int(args[2]) & 0x1F
-        # For RV32I, funct7 for SRAI is 0100000
-        imm_val_for_srai = (FUNCT7_SRAI << 5) | shamt
-        machine_code = assemble_i_type(args[0], args[1], str(
-            imm_val_for_srai), FUNCT3_SRAI, OPCODE_IMM, labels, current_address)
-    # U-type instructions
-    elif instr == 'lui':  # lui rd, imm -> args: rd, imm
-        machine_code = assemble_u_type(args[0], args[1], OPCODE_LUI, labels, current_address)
-    elif instr == 'auipc':  # auipc rd, imm -> args: rd, imm
-        machine_code = assemble_u_type(args[0], args[1], OPCODE_AUIPC, labels, current_address)
-
-    if machine_code is not None:
-        return f"{machine_code:08x}"
+    args = split_operands(match.group(2).strip())
+    words = []
+    for index, (real_instr, real_args) in enumerate(expand_line(instr, args, labels, current_address)):
+        machine_code = encode_instruction(real_instr, real_args, labels, current_address + 4 * index)
+        if machine_code is None:
+            report('warning', 'unknown-instruction',
+                   f"Instruction not implemented or unknown: {instr} with args {args}")
+            return None
+        words.append(f"{machine_code:08x}")
+    return words
+
+
+def assemble_line(line_content, labels, current_address):
+    """Assembles a single line of assembly code.
+
+    Pseudo-instructions expanding to several words return them one per line.
+    """
+    words = assemble_line_words(line_content, labels, current_address)
+    return "\n".join(words) if words else None
+
+
+# Directives recognised (and skipped) by the first pass
+KNOWN_DIRECTIVES = ('.globl', '.global', '.text', '.data', '.align',
+                    '.word', '.byte', '.half', '.space', '.string', '.asciz',
+                    '.section', '.rodata', '.bss', '.zero', '.ascii', '.balign')
+
+# Directives handled by preprocessor.py before the first pass
+PREPROCESSOR_RE = re.compile(r'^[ \t]*(?:[A-Za-z_]\w*:[ \t]*)?\.(?:macro|endm|rept|irp|endr|equ|set|include)\b',
+                             re.IGNORECASE | re.MULTILINE)
+
+# Section switches; .rodata and .bss are laid out in the data section
+SECTION_DIRECTIVES = {'.text': 'text', '.data': 'data', '.rodata': 'data', '.bss': 'data'}
+# Directives that reserve space in the current section
+# Largest section (and .space/.align amount) accepted: far beyond the 4 KiB
+# memories of the CPU, small enough to lay out in memory
+MAX_SECTION_BYTES = 1 << 24
+MAX_ALIGN_EXPONENT = MAX_SECTION_BYTES.bit_length() - 1
+
+DATA_DIRECTIVES = ('.word', '.half', '.byte', '.space', '.zero',
+                   '.string', '.asciz', '.ascii', '.align', '.balign')
+DATA_SIZES = {'.word': 4, '.half': 2, '.byte': 1}
+STRING_DIRECTIVES = ('.string', '.asciz', '.ascii')
+STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+NOP_HEX = '00000013'
+
+# Result of assembling a whole program: text words ('%08x' strings), the label
+# table, the data section as an array('I') starting at data_base, and the text
+# address and word count of every source line (1-based) that produced words,
+# the number of conditional branches relaxed into a branch+jal pair, and the
+# names of the labels that belong to the text section (in definition order)
+AssembledProgram = namedtuple('AssembledProgram',
+                              'text labels data data_base line_addresses line_sizes relaxed text_labels')
+
+
+def clean_line(line_content):
+    """Strips comments and surrounding whitespace from a source line."""
+    line = line_content.strip()
+    if '#' in line:  # Remove comments
+        line = line.split('#', 1)[0].strip()
+    return line
+
+
+def is_known_directive(line):
+    """Returns True if the (cleaned, non-empty) line starts with a known directive."""
+    return line.split(maxsplit=1)[0].lower() in KNOWN_DIRECTIVES
+
+
+def strip_comment_quoted(line_content):
+    """Like clean_line, but a '#' inside a string literal does not start a comment."""
+    line = line_content.strip()
+    in_string = escaped = False
+    for i, char in enumerate(line):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = in_string
+        elif char == '"':
+            in_string = not in_string
+        elif char == '#' and not in_string:
+            return line[:i].strip()
+    return line
+
+
+def section_of(directive, operands, line_num):
+    """Returns the section ('text' or 'data') selected by a section directive."""
+    if directive == '.section':
+        directive = operands.split(',', 1)[0].strip().lower()
+    if directive not in SECTION_DIRECTIVES:
+        raise ValueError(f"Unknown section '{directive}' at line {line_num}")
+    return SECTION_DIRECTIVES[directive]
+
+
+def parse_strings(operands, line_num):
+    """Parses the comma-separated string literals of .string/.ascii into UTF-8 bytes."""
+    literals = STRING_RE.findall(operands)
+    if not literals or STRING_RE.sub('', operands).replace(',', '').strip():
+        raise ValueError(f"Invalid string literal '{operands}' at line {line_num}")
+    import ast  # Only needed for string directives
+    return [ast.literal_eval(literal).encode('utf-8') for literal in literals]
+
+
+def parse_space(directive, operands, line_num):
+    """Byte count of a .space/.zero directive."""
+    count = parse_immediate(operands.split(',')[0])
+    if count < 0:
+        raise ValueError(f"Negative size in '{directive}' at line {line_num}")
+    if count > MAX_SECTION_BYTES:
+        raise ValueError(f"Size {count} in '{directive}' exceeds {MAX_SECTION_BYTES} bytes at line {line_num}")
+    return count
+
+
+def parse_alignment(directive, operands, line_num):
+    """Alignment in bytes of .align n (2**n bytes, as in the GNU assembler for RISC-V) or .balign n."""
+    amount = parse_immediate(operands)
+    if directive == '.align':
+        if not 0 <= amount <= MAX_ALIGN_EXPONENT:
+            raise ValueError(f"Invalid alignment in '{directive}' at line {line_num} "
+                             f"(expected 0 to {MAX_ALIGN_EXPONENT})")
+        return 1 << amount
+    if not 1 <= amount <= MAX_SECTION_BYTES:
+        raise ValueError(f"Invalid alignment in '{directive}' at line {line_num} "
+                         f"(expected 1 to {MAX_SECTION_BYTES})")
+    return amount
+
+
+def emit_data(directive, operands, data, data_base, fixups, line_num):
+    """Lays out one data directive at the end of `data` (a bytearray starting at data_base).
+
+    .word/.half/.byte values may reference labels, so they are recorded in
+    `fixups` as (offset, size, expression, line_num) and filled in by the
+    second pass. Returns the number of padding bytes inserted for alignment.
+    """
+    padding = 0
+    if directive in DATA_SIZES:
+        size = DATA_SIZES[directive]
+        padding = -(data_base + len(data)) % size  # Natural alignment
+        data.extend(bytes(padding))
+        for expr in operands.split(','):
+            fixups.append((len(data), size, expr.strip(), line_num))
+            data.extend(bytes(size))
+    elif directive in ('.space', '.zero'):
+        parts = operands.split(',')
+        count = parse_space(directive, operands, line_num)
+        fill = parse_immediate(parts[1]) & 0xFF if len(parts) > 1 else 0
+        data.extend(bytes((fill,)) * count)
+    elif directive in STRING_DIRECTIVES:
+        for text in parse_strings(operands, line_num):
+            data.extend(text if directive == '.ascii' else text + b'\0')
     else:
-        if not instr.startswith('.'):  # Avoid warning for known ignored directives
-            print(
-                f"Warning: Instruction not implemented or unknown: {instr} with args {args}")
-        return None
+        padding = -(data_base + len(data)) % parse_alignment(directive, operands, line_num)
+        data.extend(bytes(padding))
+    if len(data) > MAX_SECTION_BYTES:
+        raise ValueError(f"Data section exceeds {MAX_SECTION_BYTES} bytes at line {line_num}")
+    return padding
 
 
-def main():
-    parser = argparse.ArgumentParser(description="RISC-V 32IM Assembler")
-    parser.add_argument("input_file", help="Input assembly file (.asm)")
-    parser.add_argument("-o", "--output_file", help="Output HEX file (.hex)")
-    args = parser.parse_args()
+def resolve_data(data, fixups, labels):
+    """Second pass over the data section: fills in .word/.half/.byte values."""
+    for offset, size, expr, line_num in fixups:
+        try:
+            value = parse_immediate(expr, labels)
+        except ValueError as e:
+            raise ValueError(f"{e} at line {line_num}") from None
+        bits = 8 * size
+        if not -(1 << (bits - 1)) <= value < (1 << bits):
+            raise ValueError(f"Value {value} does not fit in {size} byte(s) at line {line_num}")
+        data[offset:offset + size] = (value & ((1 << bits) - 1)).to_bytes(size, 'little')
+    data.extend(bytes(-len(data) % 4))  # Whole words for the data-memory image
+    words = array('I')
+    words.frombytes(bytes(data))
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return words
 
-    if not args.output_file:
-        args.output_file = args.input_file.rsplit('.', 1)[0] + ".hex"
 
-    # Ensure output directory exists
-    output_dir = os.path.dirname(args.output_file)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def assemble_to_words(line_text, labels, address, original_num, size=1, context=None):
+    """Assembles one instruction line into exactly `size` words.
+
+    Expansions shorter than the size reserved during layout are padded with
+    NOPs; failures produce placeholder words.
+    """
+    state = _current_state()
+    state.line = original_num
+    state.context = context
+    try:
+        words = assemble_line_words(line_text, labels, address)
+        if words:
+            if len(words) > size:
+                if is_relaxed_branch(line_text, len(words)):
+                    raise ValueError("branch target out of range and no room was reserved to relax it "
+                                     "(forward branches are not relaxed in streaming mode)")
+                raise ValueError(f"expands to {len(words)} words, {size} reserved")
+            return words + [NOP_HEX] * (size - len(words))
+        # If assemble_line_words returned None for a non-directive
+        if line_text and not is_known_directive(line_text):
+            report('error', 'placeholder', f"Failed to assemble '{line_text}'. Outputting placeholder.")
+            # Placeholder for error
+            return ["deadbeef"] * size
+    except Exception as e:
+        report('error', 'encoding', f"'{line_text}': {e}")
+        # Different placeholder for critical error
+        return ["fa11fa11"] * size
+    finally:
+        state.line = state.context = None
+    return []
+
+
+MAX_LAYOUT_PASSES = 64
+
+
+def layout_text(items, text_labels, labels):
+    """Assigns text addresses to the first-pass items and their labels.
+
+    Variable-size lines start at their shortest expansion and only ever grow,
+    so the iteration converges; alignment padding is recomputed on every pass.
+    Conditional branches are variable-size too: one whose label ends up out
+    of range is relaxed into two words (see relax_branch), which may push
+    further branches out of range on the next pass.
+    Returns the number of relaxed branches.
+    """
+    variable = [item for item in items if 'line' in item and is_variable_size(item['line'])]
+    for _ in range(MAX_LAYOUT_PASSES):
+        address = 0
+        for item in items:
+            item['address'] = address
+            if 'align' in item:
+                item['size'] = (-address % item['align']) // 4
+            address += 4 * item['size']
+        if address > MAX_SECTION_BYTES:
+            raise ValueError(f"Text section exceeds {MAX_SECTION_BYTES} bytes")
+        for label, index in text_labels:
+            labels[label] = items[index]['address'] if index < len(items) else address
+        changed = False
+        relaxed = 0
+        for item in variable:
+            size = line_size(item['line'], labels, item['address'])
+            if size > item['size']:
+                item['size'] = size
+                changed = True
+            relaxed += is_relaxed_branch(item['line'], size)
+        if not changed:
+            return relaxed
+    raise ValueError(f"Text layout did not converge after {MAX_LAYOUT_PASSES} passes")
 
-    lines = []
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+
+def needs_preprocessing(lines):
+    """True if the source uses .macro/.rept/.irp/.equ/.set/.include."""
+    return PREPROCESSOR_RE.search(''.join(lines)) is not None
+
+
+def assemble_program(lines, data_base=0, source_path=None, include_dirs=()):
+    """Two-pass assembly of a list of source lines held in memory.
+
+    Instructions go to the text section starting at address 0; .data/.rodata/.bss
+    contents are laid out from `data_base` in the separate data memory.
+    Sources using macros, repetitions, constants or includes are expanded
+    first (preprocessor.py); .include paths are relative to `source_path`,
+    then to `include_dirs`. Line numbers always refer to `lines`.
+    Returns an AssembledProgram.
+    """
+    line_numbers = contexts = None
+    if needs_preprocessing(lines):
+        import preprocessor  # preprocessor imports this module
+        lines, line_numbers, contexts = preprocessor.preprocess(lines, source_path, include_dirs)
 
     labels = {}
-    # Stores {'line': str, 'address': int, 'original_num': int} or {'label_name': str, 'address': int}
-    cleaned_lines_and_labels = []
-    current_address = 0
-    known_directives = ['.globl', '.global', '.text', '.data', '.align',
-                        '.word', '.byte', '.half', '.space', '.string', '.asciz']
+    # Stores {'line': str, 'original_num': int, 'size': words}; .word in the
+    # text section stores its expression under 'word' and .align its
+    # alignment under 'align'. Addresses are assigned by layout_text.
+    cleaned_lines = []
+    text_labels = []  # (label, index of the first item after it)
+    section = 'text'
+    data = bytearray()
+    data_fixups = []
+    data_labels = []  # Data labels not yet followed by any data, moved by alignment
 
     # First pass: identify labels, clean lines, handle directives
-    for line_num, line_content in enumerate(lines):
-        line = line_content.strip()
-        if '#' in line:  # Remove comments
-            line = line.split('#', 1)[0].strip()
+    context = None
+    try:
+        for index, line_content in enumerate(lines):
+            line_num = index + 1 if line_numbers is None else line_numbers[index]
+            if contexts is not None:
+                context = contexts[index]
+            line = clean_line(line_content)
+            if not line:  # Skip empty lines
+                continue
+
+            # Check for labels: "label_name:"
+            label_match = LABEL_RE.match(line)
+            if label_match:
+                label, rest_of_line = label_match.groups()
+                if label in labels:
+                    raise ValueError(
+                        f"Duplicate label '{label}' at line {line_num}")
+                if section == 'text':
+                    labels[label] = None  # Placeholder until layout_text
+                    text_labels.append((label, len(cleaned_lines)))
+                else:
+                    labels[label] = data_base + len(data)
+                    data_labels.append(label)
+                line = rest_of_line.strip()  # Continue processing the rest of the line
+
+            if not line:  # If line was only a label or became empty
+                continue
+
+            # Directives: section switches and data layout; the rest is ignored
+            if line.startswith('.'):
+                directive, _, operands = line.partition(' ')
+                directive = directive.lower()
+                if directive in STRING_DIRECTIVES:
+                    operands = LABEL_RE.sub(r'\2', strip_comment_quoted(line_content)).partition(' ')[2]
+                operands = operands.strip()
+                if directive in SECTION_DIRECTIVES or directive == '.section':
+                    section = section_of(directive, operands, line_num)
+                    continue
+                if directive in DATA_DIRECTIVES:
+                    if section == 'data':
+                        padding = emit_data(directive, operands, data, data_base, data_fixups, line_num)
+                        for label in data_labels:
+                            labels[label] += padding
+                        data_labels = []
+                        continue
+                    _emit_text_data(directive, operands, cleaned_lines, line_num)
+                    continue
+            if is_known_directive(line):
+                report('info', 'directive-ignored', f"Directive '{line}' ignored.", line_num)
+                continue  # Skip to next line
+            if section == 'data':
+                raise ValueError(f"Instruction '{line}' in the data section at line {line_num}")
+
+            # If it's an instruction (or what's left of a line with a label)
+            item = {'line': line, 'original_num': line_num, 'size': 1}
+            if context:
+                item['context'] = context
+            cleaned_lines.append(item)
+    except ValueError as e:
+        message = str(e)
+        if not LINE_REF_RE.search(message):
+            message = f"{message} at line {line_num}"  # E.g. an unparsable directive operand
+        if context:
+            message = f"{message} ({context})"
+        raise ValueError(message) from None
+
+    relaxed = layout_text(cleaned_lines, text_labels, labels)
+
+    # Second pass: assemble instructions
+    output_hex_lines = []
+    line_addresses = {}
+    line_sizes = {}
+    for item in cleaned_lines:
+        if 'word' in item:
+            try:
+                value = parse_immediate(item['word'], labels)
+            except ValueError as e:
+                raise ValueError(f"{e} at line {item['original_num']}") from None
+            words = [f"{value & 0xFFFFFFFF:08x}"] * item['size']  # .space emits several zero words
+        elif 'align' in item:
+            words = [NOP_HEX] * item['size']
+        else:
+            words = assemble_to_words(item['line'], labels, item['address'], item['original_num'], item['size'],
+                                      item.get('context'))
+        if words:
+            line_addresses.setdefault(item['original_num'], item['address'])
+            line_sizes[item['original_num']] = line_sizes.get(item['original_num'], 0) + len(words)
+            output_hex_lines.extend(words)
+
+    data_words = resolve_data(data, data_fixups, labels)
+    if relaxed:
+        report('info', 'branch-relaxed', f"Relaxed {relaxed} out-of-range branch(es) into branch+jal pairs.")
+    return AssembledProgram(output_hex_lines, labels, data_words, data_base,
+                            line_addresses, line_sizes, relaxed, [label for label, _ in text_labels])
+
+
+def _emit_text_data(directive, operands, cleaned_lines, line_num):
+    """Handles a data directive in the text section, where only whole words fit.
+
+    .word emits its values, .space/.zero emit zero words and .align/.balign pad
+    with NOPs (sized by layout_text).
+    """
+    if directive == '.word':
+        for expr in operands.split(','):
+            cleaned_lines.append({'word': expr.strip(), 'original_num': line_num, 'size': 1})
+    elif directive in ('.space', '.zero'):
+        count = parse_space(directive, operands, line_num)
+        if count % 4:
+            raise ValueError(f"'{directive}' in the text section must be a multiple of 4 bytes at line {line_num}")
+        if count:
+            cleaned_lines.append({'word': '0', 'original_num': line_num, 'size': count // 4})
+    elif directive in ('.align', '.balign'):
+        alignment = parse_alignment(directive, operands, line_num)
+        cleaned_lines.append({'align': alignment, 'original_num': line_num, 'size': 0})
+    else:
+        raise ValueError(f"'{directive}' is only supported in the data section (line {line_num})")
 
-        if not line:  # Skip empty lines
+
+def assemble_lines(lines):
+    """Two-pass assembly of a list of source lines held in memory.
+
+    Returns (hex_words, labels) where hex_words is a list of '%08x' strings
+    for the text section; see assemble_program for the data section.
+    """
+    program = assemble_program(lines)
+    return program.text, program.labels
+
+
+# Result of assemble(): text words as an array('I'), the symbol table, the
+# data section (see AssembledProgram) and the list of Diagnostic records
+class AssemblyResult(namedtuple('AssemblyResult', 'words symbols data data_base diagnostics relaxed')):
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """True if no error was reported (no placeholder words in the image)."""
+        return not any(d.severity == 'error' for d in self.diagnostics)
+
+
+def assemble(source, data_base=0, source_path=None, include_dirs=()):
+    """Assembles `source` (a string or a list of lines) without any console I/O.
+
+    The filesystem is only read for .include (see assemble_program). Errors
+    that stop the assembly (duplicate labels, bad directives, ...) are
+    returned as an 'error' diagnostic with an empty image instead of raised.
+    Returns an AssemblyResult.
+    """
+    lines = source.splitlines(True) if isinstance(source, str) else source
+    diagnostics = []
+    token = _state.set(_AssemblyState(diagnostics))
+    try:
+        program = assemble_program(lines, data_base, source_path, include_dirs)
+    except (ValueError, OverflowError, RecursionError, OSError) as e:
+        line = LINE_REF_RE.search(str(e))
+        diagnostics.append(Diagnostic(int(line.group(1)) if line else None, 'error', 'fatal', str(e)))
+        return AssemblyResult(array('I'), {}, array('I'), data_base, diagnostics, 0)
+    finally:
+        _state.reset(token)
+    words = array('I', [int(word, 16) for word in program.text])
+    return AssemblyResult(words, program.labels, program.data, data_base, diagnostics, program.relaxed)
+
+
+def data_image_path(output_file):
+    """Name of the data-memory image written next to a program image."""
+    root, extension = os.path.splitext(output_file)
+    return f"{root}_data{extension}"
+
+
+def _remove_stale_data_image(output_file):
+    """Deletes a data image left by an earlier build, which the testbenches and the ISS would preload."""
+    data_file = data_image_path(output_file)
+    if os.path.exists(data_file):
+        os.remove(data_file)
+
+
+def assemble_file(input_file, output_file, schedule=False, fmt='hex', data_base=0, include_dirs=(),
+                  strength_reduce=False, strict=False, mul_latency=0, div_latency=0):
+    """Two-pass assembly holding the whole program in memory.
+
+    With strength_reduce=True constant multiplies/divides are rewritten first
+    (strength_reduction.py) where the cost model with mul_latency/div_latency
+    extra EX cycles says that is faster; with schedule=True the hazard-aware NOP removal
+    pass (scheduler.py) runs next.
+    `fmt` selects the output format (see image.FORMATS). A non-empty data
+    section is written to data_image_path(output_file); without one, a data
+    image left there by an earlier build is deleted. Diagnostics are
+    printed; an error that stops the assembly is raised as ValueError. With
+    strict=True any error diagnostic is raised instead and nothing is written.
+    """
+    import image
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+
+    if strength_reduce:
+        import strength_reduction  # strength_reduction imports this module
+        lines, strength_report = strength_reduction.reduce_lines(lines, mul_latency, div_latency,
+                                                                 input_file, include_dirs)
+        print(f"Info: Strength reduction rewrote {len(strength_report.rewrites)} multiply/divide "
+              f"instruction(s) with a constant operand.")
+
+    if schedule:
+        import scheduler  # scheduler imports this module
+        lines, schedule_report = scheduler.schedule_lines(lines, input_file, include_dirs)
+        print(f"Info: Scheduling removed {schedule_report.nops_removed} NOP(s), "
+              f"reordered {schedule_report.changed} of {schedule_report.blocks} block(s).")
+
+    result = assemble(lines, data_base, input_file, include_dirs)
+    for diagnostic in result.diagnostics:
+        if diagnostic.code == 'fatal':
+            raise ValueError(diagnostic.message)
+        print(format_diagnostic(diagnostic))
+    if strict and not result.ok:
+        raise ValueError('; '.join(format_diagnostic(d) for d in result.diagnostics if d.severity == 'error'))
+
+    image.write_image(output_file, result.words, fmt)
+
+    if result.data:
+        data_file = data_image_path(output_file)
+        image.write_image(data_file, result.data, fmt, base_address=result.data_base)
+        print(f"Data section ({4 * len(result.data)} bytes at 0x{result.data_base:x}) written to {data_file}")
+    else:
+        _remove_stale_data_image(output_file)
+
+    return result.symbols
+
+
+STREAMING_FORMATS = ('hex', 'bin')
+
+
+def index_source(f):
+    """Streaming first pass over a binary file object.
+
+    Only the label table and a compact index of instruction lines are kept:
+    the byte offset, 1-based line number and word count of every line that
+    produces words. Variable-size pseudo-instructions referring to labels
+    not seen yet reserve their longest expansion, while forward branches are
+    assumed to be in range (only backward branches can be relaxed).
+    """
+    labels = {}
+    offsets = array('Q')
+    line_numbers = array('I')
+    sizes = array('B')
+    address = 0
+    offset = 0
+    for line_num, raw in enumerate(f, 1):
+        line_offset = offset
+        offset += len(raw)
+        line = clean_line(raw.decode('utf-8'))
+        if not line:
             continue
 
-        # Check for labels: "label_name:"
-        label_match = re.match(r"^\s*([a-zA-Z_][a-zA-Z0-9_]*):\s*(.*)", line)
+        label_match = LABEL_RE.match(line)
         if label_match:
             label, rest_of_line = label_match.groups()
             if label in labels:
                 raise ValueError(
-                    f"Duplicate label '{label}' at line {line_num + 1}")
-            labels[label] = current_address
-            # cleaned_lines_and_labels.append({'label_name': label, 'address': current_address, 'original_num': line_num + 1})
-            line = rest_of_line.strip()  # Continue processing the rest of the line
+                    f"Duplicate label '{label}' at line {line_num}")
+            labels[label] = address
+            line = rest_of_line.strip()
+            if not line:
+                continue
 
-        if not line:  # If line was only a label or became empty
+        if PREPROCESSOR_RE.match(line):
+            raise ValueError(f"Macros, repetitions, constants and includes (line {line_num}) "
+                             f"are not supported in streaming mode")
+        if is_known_directive(line):
+            directive = line.split(maxsplit=1)[0].lower()
+            if directive in DATA_DIRECTIVES or directive in ('.data', '.rodata', '.bss', '.section'):
+                raise ValueError(f"'{directive}' at line {line_num} is not supported in streaming mode")
             continue
 
-        # Check for directives like .globl
-        first_word = line.split(maxsplit=1)[0]
-        if first_word.lower() in known_directives:
-            print(f"Info: Directive '{line}' at line {line_num+1} ignored.")
-            # cleaned_lines_and_labels.append({'directive': line, 'address': current_address, 'original_num': line_num + 1})
-            # Directives usually don't take space unless they are .word, .byte etc.
-            # For simplicity, this assembler doesn't advance PC for data directives yet.
-            continue  # Skip to next line
+        size = line_size(line, labels, address) if is_variable_size(line) else 1
+        offsets.append(line_offset)
+        line_numbers.append(line_num)
+        sizes.append(size)
+        address += 4 * size
+    return labels, offsets, line_numbers, sizes
 
-        # If it's an instruction (or what's left of a line with a label)
-        cleaned_lines_and_labels.append(
-            {'line': line, 'address': current_address, 'original_num': line_num + 1})
-        current_address += 4
 
-    # Second pass: assemble instructions
-    output_hex_lines = []
-    for item in cleaned_lines_and_labels:
-        if 'line' in item:  # It's an instruction line
-            line_text = item['line']
-            address = item['address']
-            try:
-                hex_code = assemble_line(line_text, labels, address)
-                if hex_code:
-                    output_hex_lines.append(hex_code)
-                # If assemble_line returned None for a non-directive
-                elif line_text and not line_text.split(maxsplit=1)[0].lower() in known_directives:
-                    print(
-                        f"Error: Failed to assemble line {item['original_num']}: '{line_text}'. Outputting placeholder.")
-                    # Placeholder for error
-                    output_hex_lines.append("deadbeef")
-            except Exception as e:
-                print(
-                    f"Critical Error assembling line {item['original_num']} ('{line_text}'): {e}")
-                # Different placeholder for critical error
-                output_hex_lines.append("fa11fa11")
-        # elif 'directive' in item or 'label_name' in item:
-            # These are handled/ignored in first pass or used by assemble_line via `labels` dict
-            # No direct hex output for these meta-items themselves.
-            # pass
-
-    with open(args.output_file, 'w') as f:
-        for hex_line in output_hex_lines:
-            f.write(hex_line + "\n")
+def assemble_file_streaming(input_file, output_file, fmt='hex'):
+    """Two-pass assembly with memory proportional to the label table.
+
+    Pass 1 records labels and the instruction-line index; pass 2 seeks back to
+    each indexed line and writes its machine words as soon as they are encoded.
+    Only the 'hex' and 'bin' formats can be written this way.
+    """
+    if fmt not in STREAMING_FORMATS:
+        raise ValueError(f"Format '{fmt}' cannot be streamed, use one of {STREAMING_FORMATS}")
+    with open(input_file, 'rb') as src:
+        labels, offsets, line_numbers, sizes = index_source(src)
+
+        with open(output_file, 'w' if fmt == 'hex' else 'wb') as out:
+            address = 0
+            relaxed = 0
+            for index, offset in enumerate(offsets):
+                src.seek(offset)
+                line = clean_line(src.readline().decode('utf-8'))
+                label_match = LABEL_RE.match(line)
+                if label_match:
+                    line = label_match.group(2).strip()
+                relaxed += is_relaxed_branch(line, sizes[index])
+                for hex_code in assemble_to_words(line, labels, address, line_numbers[index], sizes[index]):
+                    if fmt == 'hex':
+                        out.write(hex_code + "\n")
+                    else:
+                        out.write(int(hex_code, 16).to_bytes(4, 'little'))
+                address += 4 * sizes[index]
+
+    _remove_stale_data_image(output_file)  # Streaming sources have no data section
+    if relaxed:
+        report('info', 'branch-relaxed', f"Relaxed {relaxed} out-of-range branch(es) into branch+jal pairs.")
+    return labels
+
+
+def main():
+    import argparse
+    import image
+
+    parser = argparse.ArgumentParser(description="RISC-V 32IM Assembler")
+    parser.add_argument("input_file", help="Input assembly file (.asm)")
+    parser.add_argument("-o", "--output_file", help="Output image file (default: input name with the format's extension)")
+    parser.add_argument("-f", "--format", choices=image.FORMATS, default='hex',
+                        help="Output format: $readmemh text (hex, default), raw little-endian binary (bin), "
+                             "Intel HEX (ihex) or a header+payload image that can be mmap'ed (img)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Constant-memory mode for very large sources: re-read the source "
+                             "in the second pass and write words as they are produced")
+    parser.add_argument("--data_base", type=lambda text: int(text, 0), default=0,
+                        help="Data-memory address of the .data section (default: 0)")
+    parser.add_argument("--schedule", action="store_true",
+                        help="Remove NOPs the forwarding unit makes redundant and reorder "
+                             "independent instructions within basic blocks")
+    parser.add_argument("--strength-reduce", action="store_true",
+                        help="Rewrite MUL/DIV/REM with a constant operand into shifts and adds "
+                             "where that is estimated to be faster (see strength_reduction.py)")
+    parser.add_argument("--mul-latency", type=int, default=0,
+                        help="Extra EX cycles per MUL assumed by --strength-reduce (default: 0, "
+                             "the combinational multiplier.v)")
+    parser.add_argument("--div-latency", type=int, default=0,
+                        help="Extra EX cycles per DIV/DIVU/REM/REMU assumed by --strength-reduce "
+                             "(default: 0, the combinational divider.v)")
+    parser.add_argument("-I", "--include_dir", action="append", default=[],
+                        help="Directory searched for .include files (after the source's own directory)")
+    parser.add_argument("--labels", action="store_true", help="Print the whole symbol table")
+    args = parser.parse_args()
+    if args.stream and (args.schedule or args.strength_reduce):
+        parser.error("--schedule and --strength-reduce need the whole program in memory "
+                     "and cannot be used with --stream")
+    if args.stream and args.format not in STREAMING_FORMATS:
+        parser.error(f"--stream supports the formats {', '.join(STREAMING_FORMATS)}")
+
+    if not args.output_file:
+        args.output_file = args.input_file.rsplit('.', 1)[0] + image.FORMAT_EXTENSIONS[args.format]
+
+    # Ensure output directory exists
+    output_dir = os.path.dirname(args.output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    if args.stream:
+        labels = assemble_file_streaming(args.input_file, args.output_file, fmt=args.format)
+    else:
+        labels = assemble_file(args.input_file, args.output_file, schedule=args.schedule,
+                               fmt=args.format, data_base=args.data_base, include_dirs=args.include_dir,
+                               strength_reduce=args.strength_reduce, mul_latency=args.mul_latency,
+                               div_latency=args.div_latency)
 
     print(f"Assembly complete. Output written to {args.output_file}")
     if labels:
-        print("Labels found:", labels)
+        if args.labels:
+            print("Labels found:", labels)
+        else:
+            print(f"Labels found: {len(labels)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+# RISC-V 32IM Assembler - parallel, cached batch assembly
+# File: assembler/batch.py
+#
+# Usage (from the project root):
+#   python assembler/batch.py                         # tests/asm_sources/*.asm -> tests/hex_outputs/
+#   python assembler/batch.py tests/asm_sources -o tests/hex_outputs -j 8
+#   python assembler/batch.py "gen/**/*.asm" -o build/hex --force
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import assembler
+import preprocessor
+
+DEFAULT_SOURCES = os.path.join('tests', 'asm_sources')
+DEFAULT_OUTPUT_DIR = os.path.join('tests', 'hex_outputs')
+DEFAULT_CACHE_DIR = os.path.join('tests', 'output', 'asm_cache')
+
+
+def assembler_version():
+    """Hash of the assembler's own sources (not its tests); any change to them invalidates the cache."""
+    h = hashlib.sha256()
+    assembler_dir = os.path.dirname(os.path.abspath(assembler.__file__))
+    for path in sorted(glob.glob(os.path.join(assembler_dir, '*.py'))):
+        if os.path.basename(path).startswith('test_'):
+            continue
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def cache_key(source_path, version):
+    """Cache key: hash of the source contents combined with the assembler version.
+
+    Files pulled in with .include are not part of the key; they are listed
+    with their hashes in the entry's dependency file (see dependencies_unchanged).
+    """
+    h = hashlib.sha256(version.encode())
+    with open(source_path, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _dependencies_path(cache_path):
+    return os.path.splitext(cache_path)[0] + '.deps'
+
+
+def dependencies_unchanged(cache_path):
+    """True if every file the cached entry's source included still has the recorded contents."""
+    try:
+        with open(_dependencies_path(cache_path), 'r', encoding='utf-8') as f:
+            for line in f:
+                digest, path = line.rstrip('\n').split(' ', 1)
+                if _file_hash(path) != digest:
+                    return False
+    except OSError:
+        return False  # No dependency list (older entry) or an included file is gone
+    return True
+
+
+def expand_inputs(inputs):
+    """Expands directories and glob patterns into a sorted list of .asm files.
+
+    Returns (source, output name) pairs; see output_name for the naming.
+    """
+    files = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            for path in glob.glob(os.path.join(item, '*.asm')):
+                files.setdefault(path, output_name(path, item))
+        else:
+            root = _glob_root(item)
+            for path in glob.glob(item, recursive=True):
+                if os.path.isfile(path):
+                    files.setdefault(path, output_name(path, root))
+    return sorted(files.items())
+
+
+def output_name(source, root):
+    """Output .hex path of `source`, relative to the output directory.
+
+    The source's directory relative to `root` (the directory or glob prefix
+    it was found under) is kept, so equally named files in different
+    subdirectories do not overwrite each other.
+    """
+    relative = os.path.relpath(source, root) if root else os.path.basename(source)
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(source)
+    return os.path.splitext(relative)[0] + '.hex'
+
+
+def _glob_root(pattern):
+    """Leading directories of a glob pattern that contain no wildcards."""
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep)[:-1]:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts)
+
+
+def _assemble_job(source_path, cache_path):
+    """Worker: assembles one file into the cache, returning (seconds, captured log).
+
+    A source with error diagnostics raises ValueError and is not cached.
+    A program with a data section also gets a cached data image; programs
+    without one get an empty marker file so cache hits know there is none.
+    The included files are recorded with their hashes next to the entry.
+    """
+    log = io.StringIO()
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            assembler.assemble_file(source_path, tmp_path, strict=True)
+    except Exception:
+        for path in (tmp_path, assembler.data_image_path(tmp_path)):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    elapsed = time.perf_counter() - start
+    with open(source_path, 'r', encoding='utf-8') as f:
+        included = preprocessor.included_files(f.readlines(), source_path)
+    tmp_deps_path = f"{_dependencies_path(cache_path)}.{os.getpid()}.tmp"
+    with open(tmp_deps_path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{_file_hash(path)} {os.path.abspath(path)}\n" for path in included)
+    os.replace(tmp_deps_path, _dependencies_path(cache_path))
+    tmp_data_path = assembler.data_image_path(tmp_path)
+    if os.path.exists(tmp_data_path):
+        os.replace(tmp_data_path, assembler.data_image_path(cache_path))
+    else:
+        open(assembler.data_image_path(cache_path), 'w').close()
+    os.replace(tmp_path, cache_path)
+    return elapsed, log.getvalue()
+
+
+def _same_contents(path_a, path_b):
+    if not os.path.exists(path_b) or os.path.getsize(path_a) != os.path.getsize(path_b):
+        return False
+    with open(path_a, 'rb') as a, open(path_b, 'rb') as b:
+        return a.read() == b.read()
+
+
+def batch_assemble(sources, output_dir, cache_dir, jobs=None, force=False, verbose=False):
+    """Assembles `sources` into `output_dir`, reusing cached results for unchanged files.
+
+    `sources` holds source paths, written to output_dir under their base
+    name, or (source, output name) pairs as returned by expand_inputs.
+    Sources that would write the same output are all reported as errors
+    and none of them is assembled.
+
+    Returns a list of (source, status, seconds, error) tuples where status is
+    'hit' (served from cache), 'built' or 'error'; error is the assembler's
+    message for files that failed (their outputs are left untouched) and
+    None otherwise.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    version = assembler_version()
+
+    outputs = dict(item if isinstance(item, tuple) else (item, output_name(item, None)) for item in sources)
+    sources = list(outputs)
+    claimed = {}
+    for source, name in outputs.items():
+        claimed.setdefault(os.path.normcase(name), []).append(source)
+
+    cache_paths = {source: os.path.join(cache_dir, cache_key(source, version) + '.hex')
+                   for source in sources}
+    results = {}
+    pending = {}
+    for source, cache_path in cache_paths.items():
+        others = [other for other in claimed[os.path.normcase(outputs[source])] if other != source]
+        if others:
+            results[source] = ('error', 0.0, f"output {outputs[source]} is also written by {', '.join(others)}")
+        elif not force and os.path.exists(cache_path) and dependencies_unchanged(cache_path):
+            results[source] = ('hit', 0.0)
+        else:
+            pending[source] = cache_path
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {source: pool.submit(_assemble_job, source, cache_path)
+                       for source, cache_path in pending.items()}
+            for source, future in futures.items():
+                try:
+                    elapsed, log = future.result()
+                except Exception as e:
+                    message = str(e) if isinstance(e, (ValueError, OSError)) else f"{type(e).__name__}: {e}"
+                    results[source] = ('error', 0.0, message)
+                    continue
+                results[source] = ('built', elapsed)
+                if verbose and log:
+                    print(f"--- {source}\n{log}", end='')
+
+    report = []
+    for source in sources:
+        status, elapsed, *error = results[source]
+        if status == 'error':
+            report.append((source, status, elapsed, error[0]))
+            continue
+        cache_path = cache_paths[source]
+        output_path = os.path.join(output_dir, outputs[source])
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        # Only touch outputs whose contents actually change
+        if not _same_contents(cache_path, output_path):
+            shutil.copyfile(cache_path, output_path)
+        cache_data_path = assembler.data_image_path(cache_path)
+        output_data_path = assembler.data_image_path(output_path)
+        if os.path.exists(cache_data_path) and os.path.getsize(cache_data_path):
+            if not _same_contents(cache_data_path, output_data_path):
+                shutil.copyfile(cache_data_path, output_data_path)
+        elif os.path.exists(output_data_path):
+            os.remove(output_data_path)  # Stale image of a program that no longer has data
+        report.append((source, status, elapsed, None))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel, cached batch assembly")
+    parser.add_argument("inputs", nargs='*', default=[DEFAULT_SOURCES],
+                        help="Directories or glob patterns of .asm files (default: tests/asm_sources)")
+    parser.add_argument("-o", "--output_dir", default=DEFAULT_OUTPUT_DIR,
+                        help="Directory for the .hex outputs (default: tests/hex_outputs)")
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="On-disk assembly cache (default: tests/output/asm_cache)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true", help="Ignore the cache and re-assemble everything")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print the assembler log of rebuilt files")
+    args = parser.parse_args()
+
+    sources = expand_inputs(args.inputs)
+    if not sources:
+        parser.error(f"no .asm files found in {args.inputs}")
+
+    start = time.perf_counter()
+    report = batch_assemble(sources, args.output_dir, args.cache_dir,
+                            jobs=args.jobs, force=args.force, verbose=args.verbose)
+    wall = time.perf_counter() - start
+
+    print(f"{'source':<48}{'status':>8}{'time (ms)':>12}")
+    for source, status, elapsed, error in report:
+        print(f"{source:<48}{status:>8}{elapsed * 1000:>12.1f}")
+        if error:
+            print(f"    {error}")
+    hits = sum(1 for _, status, _, _ in report if status == 'hit')
+    errors = sum(1 for _, status, _, _ in report if status == 'error')
+    print(f"{len(report)} files, {hits} cache hits ({100.0 * hits / len(report):.0f}%), "
+          + (f"{errors} failed, " if errors else '') + f"wall time {wall * 1000:.1f} ms")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# RISC-V 32IM Assembler - encoder throughput benchmark
+# File: assembler/benchmark.py
+#
+# Usage (from the project root):
+#   python assembler/benchmark.py --scale 200
+#   git show "$(git rev-list --max-parents=0 HEAD)":assembler/assembler.py > /tmp/assembler_ref.py
+#   python assembler/benchmark.py --scale 200 --reference /tmp/assembler_ref.py
+
+import argparse
+import contextlib
+import glob
+import importlib.util
+import io
+import os
+import re
+import time
+
+import assembler
+
+DEFAULT_SOURCES = os.path.join('tests', 'asm_sources', '*.asm')
+
+
+def load_reference(path):
+    """Loads another assembler.py (e.g. an older revision) as a separate module."""
+    spec = importlib.util.spec_from_file_location('assembler_reference', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def scale_source(text, copies):
+    """Concatenates `copies` copies of a program, renaming labels so they stay unique."""
+    label_names = [m.group(1) for m in (assembler.LABEL_RE.match(line.split('#', 1)[0].strip())
+                                        for line in text.splitlines()) if m]
+    if not label_names:
+        return text * copies
+    label_re = re.compile(r"\b(" + "|".join(map(re.escape, label_names)) + r")\b")
+    return "".join(label_re.sub(lambda m, k=k: f"{m.group(1)}_r{k}", text) for k in range(copies))
+
+
+def first_pass(text):
+    """Minimal first pass: returns (labels, [(line, address)]) for instruction lines."""
+    labels = {}
+    lines = []
+    address = 0
+    for raw in text.splitlines():
+        line = raw.split('#', 1)[0].strip()
+        if not line:
+            continue
+        label_match = assembler.LABEL_RE.match(line)
+        if label_match:
+            labels[label_match.group(1)] = address
+            line = label_match.group(2).strip()
+            if not line:
+                continue
+        if line.startswith('.'):
+            continue
+        lines.append((line, address))
+        address += 4
+    return labels, lines
+
+
+def time_encoder(module, labels, lines, repeat):
+    """Returns the best lines/sec over `repeat` runs of module.assemble_line."""
+    best = 0.0
+    assemble_line = module.assemble_line
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for line, address in lines:
+                try:
+                    assemble_line(line, labels, address)
+                except Exception:
+                    pass
+            elapsed = time.perf_counter() - start
+        best = max(best, len(lines) / elapsed if elapsed > 0 else float('inf'))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RISC-V assembler encoder throughput benchmark")
+    parser.add_argument("sources", nargs='*', help="Assembly files (default: tests/asm_sources/*.asm)")
+    parser.add_argument("--scale", type=int, default=100,
+                        help="Number of copies of each program to concatenate (default: 100)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions, best is kept (default: 3)")
+    parser.add_argument("--reference", help="Path to a reference assembler.py to compare against")
+    args = parser.parse_args()
+
+    sources = args.sources or sorted(glob.glob(DEFAULT_SOURCES))
+    reference = load_reference(args.reference) if args.reference else None
+
+    header = f"{'program':<32}{'lines':>10}{'current l/s':>16}"
+    if reference:
+        header += f"{'reference l/s':>16}{'speedup':>10}"
+    print(header)
+
+    total_lines = 0
+    total_current = 0.0
+    total_reference = 0.0
+    for path in sources:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = scale_source(f.read(), args.scale)
+        labels, lines = first_pass(text)
+        if not lines:
+            continue
+        current = time_encoder(assembler, labels, lines, args.repeat)
+        total_lines += len(lines)
+        total_current += len(lines) / current
+        row = f"{os.path.basename(path):<32}{len(lines):>10}{current:>16,.0f}"
+        if reference:
+            ref = time_encoder(reference, labels, lines, args.repeat)
+            total_reference += len(lines) / ref
+            row += f"{ref:>16,.0f}{current / ref:>9.2f}x"
+        print(row)
+
+    if total_lines:
+        row = f"{'TOTAL':<32}{total_lines:>10}{total_lines / total_current:>16,.0f}"
+        if reference:
+            row += f"{total_lines / total_reference:>16,.0f}{total_reference / total_current:>9.2f}x"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+# RISC-V 32IM Assembler - benchmark suite with synthetic programs and tracked baselines
+# File: assembler/benchmark_suite.py
+#
+# Measures, for every workload:
+#   - assembler throughput (source lines per CPU second of assembler.assemble,
+#     median of --repeat runs, with the runs' relative spread) and its peak
+#     Python heap (tracemalloc),
+#   - executed instructions and cycles of the program in the ISS and the
+#     pipeline timing model (timing_model.simulate).
+# Workloads are the real tests/asm_sources programs and parameterized
+# synthetic sources (see GENERATORS). Throughput is measured on a large
+# input: --scale renamed copies of a real program (benchmark.scale_source),
+# or a synthetic program of --size instructions. The simulated program is the
+# real program itself, or the same generator at --sim-size, so that it fits
+# in the 1024-word instruction memory.
+#
+# --save writes the results as a JSON baseline; --baseline compares against
+# one and exits with status 1 if throughput drops, or peak memory, words,
+# instructions or cycles grow, by more than the thresholds. A throughput drop
+# must also exceed NOISE_SIGMAS times the combined spread of both runs, and
+# workloads assembled in under --min-seconds per run are only reported, not
+# gated: timings that short are dominated by scheduler and cache noise.
+#
+# Usage (from the project root):
+#   python assembler/benchmark_suite.py --save tests/output/benchmark_baseline.json
+#   python assembler/benchmark_suite.py --baseline tests/output/benchmark_baseline.json
+#   python assembler/benchmark_suite.py alu branches --size 50000 --repeat 5
+
+import argparse
+import gc
+import glob
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import assembler
+import benchmark
+import iss
+import timing_model
+
+DEFAULT_SIZE = 20_000
+DEFAULT_SIM_SIZE = 500
+DEFAULT_SCALE = 50
+DEFAULT_SEED = 1
+DEFAULT_REPEAT = 7
+DEFAULT_THRESHOLD = 0.15        # Throughput and peak memory: smallest change reported
+DEFAULT_EXACT_THRESHOLD = 0.0   # Words, instructions and cycles are deterministic
+DEFAULT_MIN_SECONDS = 1.0       # Shorter throughput runs are not gated
+NOISE_SIGMAS = 4                # Throughput drops within this many spreads are noise
+MAX_INSTRUCTIONS = 1_000_000
+
+ALU_R_OPS = ('add', 'sub', 'and', 'or', 'xor', 'sll', 'srl', 'sra', 'slt', 'sltu', 'mul')
+ALU_I_OPS = ('addi', 'andi', 'ori', 'xori', 'slti', 'sltiu')
+SHIFT_OPS = ('slli', 'srli', 'srai')
+BRANCH_OPS = ('beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu')
+WORK_REGS = tuple(f"x{n}" for n in range(1, 16))
+
+# Metrics compared against a baseline: name -> True if higher is better
+METRICS = {
+    'lines_per_second': True,
+    'peak_kib': False,
+    'words': False,
+    'instructions': False,
+    'cycles': False,
+}
+EXACT_METRICS = frozenset(('words', 'instructions', 'cycles'))
+
+
+# --- Synthetic program generators: (size, rng) -> source text with about `size` instructions
+
+def _halt(label='halt'):
+    return [f"{label}:", f"    jal x0, {label}"]
+
+
+def _init_registers(rng):
+    return [f"    addi {reg}, x0, {rng.randint(-2048, 2047)}" for reg in WORK_REGS]
+
+
+def generate_alu(size, rng):
+    """Straight-line R- and I-type ALU code over x1..x15."""
+    lines = _init_registers(rng)
+    for _ in range(size):
+        rd, rs1, rs2 = rng.choice(WORK_REGS), rng.choice(WORK_REGS), rng.choice(WORK_REGS)
+        kind = rng.random()
+        if kind < 0.5:
+            lines.append(f"    {rng.choice(ALU_R_OPS)} {rd}, {rs1}, {rs2}")
+        elif kind < 0.85:
+            lines.append(f"    {rng.choice(ALU_I_OPS)} {rd}, {rs1}, {rng.randint(-2048, 2047)}")
+        else:
+            lines.append(f"    {rng.choice(SHIFT_OPS)} {rd}, {rs1}, {rng.randint(0, 31)}")
+    return '\n'.join(lines + _halt()) + '\n'
+
+
+def generate_branches(size, rng):
+    """Deep label/branch graph: short blocks ending in a forward branch to a later block.
+
+    Most targets are a few blocks ahead; one in ten can be any later block, so
+    large programs also exercise branch relaxation. Forward-only edges make
+    every program halt.
+    """
+    blocks = max(1, size // 4)
+    lines = _init_registers(rng)
+    for k in range(blocks):
+        lines.append(f"b{k}:")
+        for _ in range(3):
+            rd, rs1 = rng.choice(WORK_REGS), rng.choice(WORK_REGS)
+            lines.append(f"    {rng.choice(ALU_I_OPS)} {rd}, {rs1}, {rng.randint(-2048, 2047)}")
+        reach = blocks if rng.random() < 0.1 else min(blocks, k + 8)
+        target = rng.randint(k + 1, reach)
+        target = 'halt' if target == blocks else f"b{target}"
+        lines.append(f"    {rng.choice(BRANCH_OPS)} {rng.choice(WORK_REGS)}, {rng.choice(WORK_REGS)}, {target}")
+    return '\n'.join(lines + _halt()) + '\n'
+
+
+def _immediate(rng):
+    kind = rng.random()
+    if kind < 0.25:
+        return rng.randint(-2048, 2047)                         # addi
+    if kind < 0.4:
+        return rng.randint(1, 0xFFFFF) << 12                    # lui only
+    if kind < 0.55:
+        return (rng.randint(0, 0xFFFFF) << 12) | 0x800 | rng.randint(0, 0x7FF)  # bit 11 set: carry
+    if kind < 0.7:
+        return rng.choice((-2049, 2048, -0x80000000, 0x7FFFFFFF, 0xFFFFFFFF))
+    return rng.randint(-0x80000000, 0xFFFFFFFF)
+
+
+def generate_immediates(size, rng):
+    """li/lui/la with constants across the 12/20/32-bit boundaries (variable-size layout)."""
+    lines = []
+    labels = max(1, size // 64)
+    for k in range(size):
+        if k % 64 == 0:
+            lines.append(f"c{k // 64}:")
+        rd = rng.choice(WORK_REGS)
+        kind = rng.random()
+        if kind < 0.7:
+            value = _immediate(rng)
+            lines.append(f"    li {rd}, {value if rng.random() < 0.5 else hex(value)}")
+        elif kind < 0.85:
+            lines.append(f"    lui {rd}, {hex(rng.randint(0, 0xFFFFF))}")
+        else:
+            lines.append(f"    la {rd}, c{rng.randrange(labels)}")
+    return '\n'.join(lines + _halt()) + '\n'
+
+
+def generate_memory(size, rng):
+    """Counted loops of load/modify/store over a 2 KiB buffer in data memory."""
+    buffer_words = 512
+    lines = []
+    k = 0
+    emitted = 0
+    while emitted < size:
+        count = rng.randint(4, 32)
+        offset = 4 * rng.randrange(buffer_words - count - 1)
+        lines += [
+            "    la x5, buffer",
+            f"    addi x5, x5, {offset}",
+            f"    addi x6, x0, {count}",
+            f"m{k}:",
+            "    lw x7, 0(x5)",
+            "    lw x8, 4(x5)",
+            "    add x7, x7, x6",
+            f"    xori x8, x8, {rng.randint(-2048, 2047)}",
+            "    sw x7, 0(x5)",
+            "    sw x8, 4(x5)",
+            "    addi x5, x5, 4",
+            "    addi x6, x6, -1",
+            f"    bne x6, x0, m{k}",
+        ]
+        k += 1
+        emitted += 11
+    lines += _halt()
+    lines += [".data", "buffer:", f"    .space {4 * buffer_words}"]
+    return '\n'.join(lines) + '\n'
+
+
+GENERATORS = {
+    'alu': generate_alu,
+    'branches': generate_branches,
+    'immediates': generate_immediates,
+    'memory': generate_memory,
+}
+
+
+# --- Measurements
+
+def measure_assembler(text, repeat):
+    """Times assembling `text`; returns (lines/s, spread, seconds per run, peak traced heap in KiB).
+
+    lines/s and seconds are medians over `repeat` runs; spread is the robust
+    relative standard deviation of the runs (1.4826 * median absolute
+    deviation / median).
+    """
+    lines = text.splitlines(keepends=True)
+    tracemalloc.start()  # The traced run also warms up the timed ones
+    try:
+        assembler.assemble(lines)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    times = []
+    gc.disable()  # As timeit does: collections would add noise to the timed runs
+    try:
+        for _ in range(max(1, repeat)):
+            start = time.process_time()
+            assembler.assemble(lines)
+            times.append(time.process_time() - start)
+    finally:
+        gc.enable()
+    seconds = statistics.median(times)
+    if seconds <= 0:
+        return float('inf'), 0.0, seconds, peak / 1024
+    spread = 1.4826 * statistics.median(abs(t - seconds) for t in times) / seconds
+    return len(lines) / seconds, spread, seconds, peak / 1024
+
+
+def measure_program(text, max_instructions=MAX_INSTRUCTIONS):
+    """Assembles and runs a program; returns a dict of words/instructions/cycles/halted."""
+    result = assembler.assemble(text)
+    if not result.ok:
+        errors = [assembler.format_diagnostic(d) for d in result.diagnostics if d.severity == 'error']
+        raise ValueError(f"program does not assemble: {errors[0]}")
+    metrics = {'words': len(result.words), 'instructions': None, 'cycles': None, 'halted': None}
+    if len(result.words) > iss.MEM_SIZE_WORDS:
+        return metrics  # Does not fit in the instruction memory
+    data = [0] * (result.data_base // 4) + list(result.data) if result.data else None
+    timing = timing_model.simulate(list(result.words), max_instructions=max_instructions, data=data)
+    if timing.deadlock is None:
+        metrics.update(instructions=timing.instructions, cycles=timing.cycles, halted=timing.halted)
+    return metrics
+
+
+def workloads(names, sources, size, sim_size, scale, seed):
+    """Yields (name, throughput source text, simulated source text)."""
+    for name, generate in GENERATORS.items():
+        if names and name not in names:
+            continue
+        yield name, generate(size, random.Random(seed)), generate(sim_size, random.Random(seed))
+    for path in sources:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if names and name not in names:
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        yield name, benchmark.scale_source(text, scale), text
+
+
+def run_suite(names=(), sources=None, size=DEFAULT_SIZE, sim_size=DEFAULT_SIM_SIZE, scale=DEFAULT_SCALE,
+              seed=DEFAULT_SEED, repeat=DEFAULT_REPEAT, max_instructions=MAX_INSTRUCTIONS):
+    """Runs the selected workloads; returns the results as a JSON-ready dict."""
+    if sources is None:
+        sources = sorted(glob.glob(benchmark.DEFAULT_SOURCES))
+    results = {}
+    for name, big, program in workloads(names, sources, size, sim_size, scale, seed):
+        lines_per_second, spread, seconds, peak_kib = measure_assembler(big, repeat)
+        entry = {'lines': len(big.splitlines()), 'lines_per_second': round(lines_per_second),
+                 'spread': round(spread, 4), 'seconds': round(seconds, 4), 'peak_kib': round(peak_kib, 1)}
+        entry.update(measure_program(program, max_instructions))
+        results[name] = entry
+    meta = {'python': platform.python_version(), 'machine': platform.machine(),
+            'size': size, 'sim_size': sim_size, 'scale': scale, 'seed': seed, 'repeat': repeat,
+            'max_instructions': max_instructions}
+    return {'meta': meta, 'workloads': results}
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD, exact_threshold=DEFAULT_EXACT_THRESHOLD,
+            min_seconds=DEFAULT_MIN_SECONDS):
+    """Returns (regressions, improvements, ungated) as lists of message strings.
+
+    Throughput changes count only beyond both `threshold` and NOISE_SIGMAS
+    times the combined spread of the two runs; those of workloads faster
+    than `min_seconds` per run go to `ungated` instead of `regressions`.
+    """
+    regressions = []
+    improvements = []
+    ungated = []
+    for key in ('size', 'sim_size', 'scale', 'seed', 'max_instructions'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            raise ValueError(f"baseline was recorded with {key}={baseline['meta'].get(key)}, "
+                             f"this run uses {current['meta'].get(key)}")
+    for name, entry in current['workloads'].items():
+        old = baseline['workloads'].get(name)
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            before, after = old.get(metric), entry.get(metric)
+            if before is None or after is None:
+                continue
+            limit = exact_threshold if metric in EXACT_METRICS else threshold
+            timed = metric == 'lines_per_second'
+            if timed:
+                noise = math.hypot(old.get('spread', 0.0), entry.get('spread', 0.0))
+                limit = max(limit, NOISE_SIGMAS * noise)
+            change = (after - before) / before if before else (0.0 if after == before else float('inf'))
+            worse = -change if higher_is_better else change
+            message = f"{name}: {metric} {before:,} -> {after:,} ({change:+.1%})"
+            short = timed and min(old.get('seconds', 0.0), entry.get('seconds', 0.0)) < min_seconds
+            if worse > limit:
+                if short:
+                    ungated.append(f"{message}, runs shorter than {min_seconds:g} s are not gated")
+                else:
+                    regressions.append(f"{message}, threshold {limit:.0%}")
+            elif worse < -limit and change and not short:
+                improvements.append(message)
+    return regressions, improvements, ungated
+
+
+def print_results(results):
+    print(f"{'workload':<28}{'lines':>9}{'lines/s':>12}{'peak KiB':>11}"
+          f"{'words':>8}{'instructions':>14}{'cycles':>10}{'CPI':>7}")
+    for name, entry in results['workloads'].items():
+        instructions, cycles = entry['instructions'], entry['cycles']
+        if cycles is None:
+            sim = f"{'n/a':>14}{'n/a':>10}{'':>7}"
+        else:
+            limit = '' if entry['halted'] else '+'  # Instruction limit reached
+            sim = f"{f'{instructions}{limit}':>14}{cycles:>10}{cycles / (instructions or 1):>7.3f}"
+        print(f"{name:<28}{entry['lines']:>9}{entry['lines_per_second']:>12,}{entry['peak_kib']:>11,.1f}"
+              f"{entry['words']:>8}{sim}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assembler and program performance suite with baselines")
+    parser.add_argument("workloads", nargs='*',
+                        help=f"Only run these workloads ({', '.join(GENERATORS)} or a tests/asm_sources name)")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE,
+                        help=f"Instructions per synthetic program for throughput (default: {DEFAULT_SIZE})")
+    parser.add_argument("--sim-size", type=int, default=DEFAULT_SIM_SIZE,
+                        help=f"Instructions per simulated synthetic program (default: {DEFAULT_SIM_SIZE})")
+    parser.add_argument("--scale", type=int, default=DEFAULT_SCALE,
+                        help=f"Copies of each real program for throughput (default: {DEFAULT_SCALE})")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Generator seed (default: 1)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"Timing repetitions, the median is kept (default: {DEFAULT_REPEAT})")
+    parser.add_argument("--max", type=int, default=MAX_INSTRUCTIONS,
+                        help="Instruction limit of the simulation (default: 1M)")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Allowed throughput/peak-memory regression (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--exact-threshold", type=float, default=DEFAULT_EXACT_THRESHOLD,
+                        help="Allowed growth of words/instructions/cycles (default: 0)")
+    parser.add_argument("--min-seconds", type=float, default=DEFAULT_MIN_SECONDS,
+                        help=f"Only gate throughput of workloads taking at least this long per run "
+                             f"(default: {DEFAULT_MIN_SECONDS:g}; 0 gates all)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = run_suite(args.workloads, size=args.size, sim_size=args.sim_size, scale=args.scale,
+                        seed=args.seed, repeat=args.repeat, max_instructions=args.max)
+    if not results['workloads']:
+        parser.error("no workloads selected")
+    print_results(results)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nBaseline written to {args.save}")
+
+    if baseline is not None:
+        try:
+            regressions, improvements, ungated = compare(baseline, results, args.threshold,
+                                                         args.exact_threshold, args.min_seconds)
+        except ValueError as e:
+            parser.error(str(e))
+        for message in improvements:
+            print(f"improved: {message}")
+        for message in ungated:
+            print(f"slower (not gated): {message}")
+        if regressions:
+            print(f"\n{len(regressions)} REGRESSION(S) against {args.baseline}:")
+            for message in regressions:
+                print(f"  REGRESSION {message}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# Shared pytest fixtures for the assembler tests - run with `python -m pytest assembler`
+
+import contextlib
+import glob
+import io
+import os
+
+import pytest
+
+import assembler
+import iss
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = sorted(glob.glob(os.path.join(ROOT, 'tests', 'asm_sources', '*.asm')))
+
+
+def final_state(lines, source_path=None, max_instructions=200_000):
+    """(registers, data memory) after running `lines` in the ISS, or None if it does not halt.
+
+    Registers written by jal/jalr hold return addresses, which move whenever
+    a pass changes the code size, so they are left out of the register file.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        program = assembler.assemble_program(lines, source_path=source_path)
+    words = [int(word, 16) for word in program.text]
+    sim = iss.Simulator(words, data=[0] * (program.data_base // 4) + list(program.data))
+    if not sim.run(max_instructions):
+        return None
+    links = {op.rd for op in map(iss.decode, words) if op.name in iss.JUMP_OPS}
+    return [value for reg, value in enumerate(sim.regs) if reg not in links], list(sim.data_mem)
+
+
+@pytest.fixture(params=SOURCES, ids=os.path.basename)
+def asm_program(request):
+    """(path, source lines) of each program in tests/asm_sources."""
+    with open(request.param, 'r', encoding='utf-8') as f:
+        return request.param, f.readlines()
@@ -0,0 +1,200 @@
+# RISC-V 32IM Assembler - lockstep co-simulation diff between the ISS and the RTL
+# File: assembler/cosim.py
+#
+# The testbenches write a retired-instruction trace when run with
+# +trace=<file> (see the end of hardware/sim/tb_*.v):
+#   retire,0x<pc>,<rd>,0x<value>     one line per instruction leaving WB (rd 0: no write)
+#   store,0x<address>,0x<value>      one line per data-memory word write
+# This tool runs the ISS on the same program and compares both sides in
+# lockstep, stopping at the first divergence with a short window of the
+# instructions that matched before it. Both sides are generators: the RTL
+# trace file is read line by line and the ISS executes one instruction at a
+# time, so memory use does not grow with the program's run time. With --vvp
+# the simulator is run first, writing its trace to a temporary file of its
+# own, so $display output of the testbench never mixes with the trace.
+#
+# Stores are compared as their own stream, since a store is written in MEM,
+# one cycle before its instruction retires.
+#
+# Usage (from the project root):
+#   vvp tests/output/gcd_sim +trace=tests/output/gcd_trace.csv
+#   python assembler/cosim.py tests/asm_sources/gcd_test.asm tests/output/gcd_trace.csv
+#   python assembler/cosim.py tests/asm_sources/gcd_test.asm --vvp tests/output/gcd_sim
+
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+from collections import deque, namedtuple
+
+import assembler
+import iss
+import profiler
+
+Retire = namedtuple('Retire', 'pc rd value')
+Store = namedtuple('Store', 'address value')
+
+# First mismatch: the RTL event (line `trace_line` of the trace), what the ISS
+# expected instead (None if it had nothing left) and the last matched retires
+Divergence = namedtuple('Divergence', 'kind expected actual trace_line history reason')
+
+CosimResult = namedtuple('CosimResult', 'retired stores divergence complete')
+
+DEFAULT_CONTEXT = 8
+# Instructions the ISS may run ahead while looking for the store the RTL reported
+MAX_LOOKAHEAD = 64
+
+
+def _hex_or_none(text):
+    """Parses a '0x...' field; None for values with x/z bits."""
+    try:
+        return int(text, 16)
+    except ValueError:
+        return None
+
+
+def read_trace(lines):
+    """Yields (line number, kind, Retire/Store) from the lines of an RTL trace."""
+    for line_num, line in enumerate(lines, 1):
+        if line.startswith('retire,'):
+            _, pc, rd, value = line.strip().split(',')
+            yield line_num, 'retire', Retire(_hex_or_none(pc), int(rd), _hex_or_none(value))
+        elif line.startswith('store,'):
+            _, address, value = line.strip().split(',')
+            yield line_num, 'store', Store(_hex_or_none(address), _hex_or_none(value))
+
+
+def reference_events(sim, max_instructions):
+    """Yields ('store', Store) and ('retire', Retire) events in program order from the ISS."""
+    regs = sim.regs
+    for pc, op, _, _ in sim.trace(max_instructions):
+        if op.name in iss.STORE_OPS:
+            yield 'store', Store((regs[op.rs1] + op.imm) & iss.MASK32, regs[op.rs2])
+        rd = op.rd if op.name is not None else 0  # Stores and branches decode with rd 0
+        yield 'retire', Retire(pc, rd, regs[rd] if rd else 0)
+
+
+def compare(reference, rtl, context=DEFAULT_CONTEXT):
+    """Runs the two event streams in lockstep; returns a CosimResult.
+
+    Once the reference has halted, further RTL retires of its final (halt
+    loop) instruction are ignored; complete is False if the RTL trace ends
+    before the reference halts.
+    """
+    expected = {'retire': deque(), 'store': deque()}
+    history = deque(maxlen=context)
+    counts = {'retire': 0, 'store': 0}
+    reference = iter(reference)
+    finished = False
+    halt_pc = None
+
+    def result(divergence=None, complete=True):
+        return CosimResult(counts['retire'], counts['store'], divergence, complete)
+
+    for trace_line, kind, actual in rtl:
+        queue = expected[kind]
+        other = expected['store' if kind == 'retire' else 'retire']
+        while not queue and not finished:
+            event = next(reference, None)
+            if event is None:
+                finished = True
+            else:
+                expected[event[0]].append(event[1])
+                if event[0] == 'retire':
+                    halt_pc = event[1].pc
+                if len(other) > MAX_LOOKAHEAD:
+                    return result(Divergence(kind, None, actual, trace_line, list(history),
+                                             f"no matching reference {kind} within {MAX_LOOKAHEAD} instructions"))
+        if not queue:
+            if kind == 'retire' and actual.pc == halt_pc:
+                continue  # The RTL keeps spinning in the halt loop
+            return result(Divergence(kind, None, actual, trace_line, list(history),
+                                     "the reference program has already halted"))
+        wanted = queue.popleft()
+        if wanted != actual:
+            return result(Divergence(kind, wanted, actual, trace_line, list(history), "values differ"))
+        counts[kind] += 1
+        if kind == 'retire':
+            history.append(actual)
+
+    if expected['retire'] or expected['store']:
+        return result(complete=False)
+    return result(complete=finished or next(reference, None) is None)
+
+
+def _describe(event, source):
+    if event is None:
+        return "(nothing)"
+    if isinstance(event, Store):
+        address = '0x????????' if event.address is None else f"0x{event.address:08x}"
+        value = '0x????????' if event.value is None else f"0x{event.value:08x}"
+        return f"store [{address}] <- {value}"
+    pc = '0x????????' if event.pc is None else f"0x{event.pc:08x}"
+    write = f"x{event.rd} <- " + ('0x????????' if event.value is None else f"0x{event.value:08x}") \
+        if event.rd else "no register write"
+    text = ''
+    if source is not None and event.pc is not None:
+        line_num = source.line(event.pc)
+        text = f"  line {line_num}: {source.text(line_num)}"
+    return f"pc {pc}  {write:<22}{text}"
+
+
+def print_result(result, source=None):
+    divergence = result.divergence
+    if divergence is None:
+        status = "MATCH" if result.complete else "MATCH (RTL trace ended before the program halted)"
+        print(f"{status}: {result.retired} instructions and {result.stores} stores compared")
+        return
+    print(f"DIVERGENCE after {result.retired} matching instructions and {result.stores} stores "
+          f"({divergence.reason}), trace line {divergence.trace_line}:")
+    for event in divergence.history:
+        print(f"    {_describe(event, source)}")
+    print(f"  expected (ISS): {_describe(divergence.expected, source)}")
+    print(f"  actual   (RTL): {_describe(divergence.actual, source)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lockstep ISS vs RTL retired-instruction diff")
+    parser.add_argument("program", help="Program image (.hex, ...) or assembly source (.asm)")
+    parser.add_argument("trace", nargs='?', help="Trace written by a testbench run with +trace=<file>")
+    parser.add_argument("--vvp", metavar="SIM",
+                        help="Run this compiled simulator with +trace=<temporary file> and compare that trace")
+    parser.add_argument("--data", help="Data-memory image to preload (default: as in iss.py)")
+    parser.add_argument("--context", type=int, default=DEFAULT_CONTEXT,
+                        help=f"Matched instructions shown before a divergence (default: {DEFAULT_CONTEXT})")
+    parser.add_argument("--max", type=int, default=10_000_000, help="ISS instruction limit (default: 10M)")
+    args = parser.parse_args()
+    if (args.trace is None) == (args.vvp is None):
+        parser.error("give either a trace file or --vvp")
+
+    data = iss.load_data(args.data) if args.data else iss.find_data(args.program)
+    sim = iss.Simulator(iss.load_program(args.program), data=data)
+    source = None
+    if args.program.endswith('.asm'):
+        with open(args.program, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        with contextlib.redirect_stdout(io.StringIO()):
+            source = profiler.SourceMap(assembler.assemble_program(lines, source_path=args.program), lines)
+
+    reference = reference_events(sim, args.max)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trace_path = args.trace
+        if args.vvp:
+            trace_path = os.path.join(tmp_dir, 'trace.csv')
+            run = subprocess.run(['vvp', '-n', args.vvp, '+novcd', f'+trace={trace_path}'],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace')
+            if run.returncode or not os.path.exists(trace_path):
+                sys.exit(f"vvp {args.vvp} failed (exit code {run.returncode}) without writing a trace"
+                         + (f":\n{run.stderr.strip()}" if run.stderr.strip() else ''))
+        with open(trace_path, 'r', encoding='utf-8', errors='replace') as f:
+            result = compare(reference, read_trace(f), args.context)
+    print_result(result, source)
+    if result.divergence is not None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
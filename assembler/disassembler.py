@@ -0,0 +1,476 @@
+# RISC-V 32IM Assembler - bulk disassembler and static image analyzer
+# File: assembler/disassembler.py
+#
+# Decodes a whole program image (.hex/.bin/.ihex/.img) at once. With NumPy
+# installed the fields are masked out of every word in one array operation
+# per field and the I/S/B/U/J immediates are reassembled the same way, so
+# images of millions of words decode in well under a second; without NumPy
+# each word goes through iss.decode instead (same results, much slower).
+# The listing is built from the decoded columns as well: every distinct word
+# is formatted once and the lines are assembled column by column, so only
+# branches and jals that got a label cost a Python call per word.
+#
+# The listing is valid input for the assembler: branch and jal targets
+# inside the image become L_<address> labels, words that do not decode (and
+# the assembler's deadbeef/fa11fa11 error placeholders) become .word lines,
+# and --verify assembles the listing again and compares it word for word.
+#
+# The statistics give the instruction mix, the most used mnemonics and the
+# encoding problems: placeholder words, illegal and zero words, and branch
+# or jump targets outside the image or not word-aligned.
+#
+# Usage (from the project root):
+#   python assembler/disassembler.py tests/hex_outputs/fft_test.hex
+#   python assembler/disassembler.py tests/hex_outputs/fft_test.hex -o /tmp/fft.dis.asm --verify
+#   python assembler/disassembler.py build/huge.img --stats
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+from collections import Counter, namedtuple
+
+import assembler
+import image
+import iss
+import profiler
+
+try:
+    import numpy as np
+except ImportError:  # Optional: fall back to decoding one word at a time
+    np = None
+
+# Words the assembler emits in place of lines it could not encode
+PLACEHOLDERS = {
+    0xDEADBEEF: 'deadbeef',  # The line failed to assemble
+    0xFA11FA11: 'fa11fa11',  # Critical error while expanding the line
+}
+NOP_WORD = 0x00000013
+
+# Mnemonic index 0 is an undecodable word
+MNEMONICS = (None,) + tuple(name for name, spec in assembler.INSTRUCTION_TABLE.items()
+                            if spec.fmt != assembler.FMT_NONE)
+_INDEX = {name: i for i, name in enumerate(MNEMONICS)}
+_FORMATS = tuple(assembler.INSTRUCTION_TABLE[name].fmt if name else None for name in MNEMONICS)
+_TARGETED = tuple(name in iss.BRANCH_OPS or name == 'jal' for name in MNEMONICS)
+
+CHUNK_WORDS = 1 << 20  # Bounds the temporaries of the vectorized decoder
+
+# Column-wise decode of an image; name holds MNEMONICS indices and the other
+# fields follow iss.DecodedOp (NumPy arrays, or lists without NumPy)
+DecodedImage = namedtuple('DecodedImage', 'words name rd rs1 rs2 imm')
+
+# problems: kind -> (count, first few addresses)
+ImageStats = namedtuple('ImageStats', 'words mix mnemonics problems')
+
+PROBLEM_KINDS = (
+    ('deadbeef', "deadbeef placeholders (line failed to assemble)"),
+    ('fa11fa11', "fa11fa11 placeholders (critical assembler error)"),
+    ('illegal', "illegal encodings"),
+    ('zero', "zero words"),
+    ('target-outside', "branch/jump targets outside the image"),
+    ('target-misaligned', "branch/jump targets not word-aligned"),
+)
+PROBLEM_EXAMPLES = 5
+
+
+def _build_lookup():
+    """Table from opcode | funct3 << 7 | funct7 << 10 to a MNEMONICS index."""
+    lookup = np.zeros(1 << 17, dtype=np.uint8)
+    by_field = lookup.reshape(128, 8, 128)  # [funct7, funct3, opcode]
+    for name, spec in assembler.INSTRUCTION_TABLE.items():
+        if spec.fmt == assembler.FMT_NONE:
+            continue
+        if spec.fmt in (assembler.FMT_R, assembler.FMT_SHIFT):
+            by_field[spec.funct7, spec.funct3, spec.opcode] = _INDEX[name]
+        elif spec.fmt in (assembler.FMT_U, assembler.FMT_J):
+            by_field[:, :, spec.opcode] = _INDEX[name]
+        else:
+            by_field[:, spec.funct3, spec.opcode] = _INDEX[name]
+    return lookup
+
+
+_LOOKUP = _build_lookup() if np is not None else None
+
+
+def _decode_chunk(w):
+    """Decodes an int64 array of words; returns (name, rd, rs1, rs2, imm) arrays."""
+    opcode = w & 0x7F
+    rd = (w >> 7) & 0x1F
+    funct3 = (w >> 12) & 0x7
+    rs1 = (w >> 15) & 0x1F
+    rs2 = (w >> 20) & 0x1F
+    funct7 = w >> 25
+    signed = w - ((w >> 31) << 32)
+
+    imm_i = signed >> 20
+    imm_s = ((signed >> 25) << 5) | ((w >> 7) & 0x1F)
+    imm_b = ((signed >> 31) << 12) | (((w >> 7) & 0x1) << 11) | \
+            (((w >> 25) & 0x3F) << 5) | (((w >> 8) & 0xF) << 1)
+    imm_u = signed & ~0xFFF
+    imm_j = ((signed >> 31) << 20) | (((w >> 12) & 0xFF) << 12) | \
+            (((w >> 20) & 0x1) << 11) | (((w >> 21) & 0x3FF) << 1)
+
+    name = _LOOKUP[opcode | (funct3 << 7) | (funct7 << 10)]
+
+    is_u = (opcode == assembler.OPCODE_LUI) | (opcode == assembler.OPCODE_AUIPC)
+    is_j = opcode == assembler.OPCODE_JAL
+    is_b = opcode == assembler.OPCODE_BRANCH
+    is_s = opcode == assembler.OPCODE_STORE
+    is_shift = (opcode == assembler.OPCODE_IMM) & \
+               ((funct3 == assembler.FUNCT3_SLLI) | (funct3 == assembler.FUNCT3_SRLI))
+    is_i = ((opcode == assembler.OPCODE_IMM) & ~is_shift) | \
+           (opcode == assembler.OPCODE_LOAD) | (opcode == assembler.OPCODE_JALR)
+
+    # Same field conventions as iss.decode
+    rd = np.where(is_b | is_s, 0, rd)
+    rs1 = np.where(is_u | is_j, 0, rs1)
+    imm = np.select([is_u, is_j, is_b, is_s, is_shift, is_i],
+                    [imm_u, imm_j, imm_b, imm_s, rs2, imm_i], 0)
+    rs2 = np.where(is_u | is_j | is_shift | is_i, 0, rs2)
+    return name, rd, rs1, rs2, imm
+
+
+def decode_image(words, vectorized=True):
+    """Decodes a sequence of 32-bit words (array('I'), memoryview, list...) into a DecodedImage."""
+    if np is None or not vectorized:
+        ops = [iss.decode(word) for word in words]
+        return DecodedImage(list(words), [_INDEX[op.name] for op in ops], [op.rd for op in ops],
+                            [op.rs1 for op in ops], [op.rs2 for op in ops], [op.imm for op in ops])
+    raw = np.asarray(words, dtype=np.uint32)
+    count = len(raw)
+    name = np.empty(count, dtype=np.uint8)
+    rd = np.empty(count, dtype=np.uint8)
+    rs1 = np.empty(count, dtype=np.uint8)
+    rs2 = np.empty(count, dtype=np.uint8)
+    imm = np.empty(count, dtype=np.int32)
+    for start in range(0, count, CHUNK_WORDS):
+        end = start + CHUNK_WORDS
+        fields = _decode_chunk(raw[start:end].astype(np.int64))
+        for out, field in zip((name, rd, rs1, rs2, imm), fields):
+            out[start:end] = field
+    return DecodedImage(raw, name, rd, rs1, rs2, imm)
+
+
+def _first(mask):
+    """(count, first addresses) of the words selected by a boolean array."""
+    indices = np.flatnonzero(mask)
+    return int(len(indices)), [4 * int(i) for i in indices[:PROBLEM_EXAMPLES]]
+
+
+def analyze(decoded):
+    """Static statistics of a DecodedImage; returns an ImageStats."""
+    count = len(decoded.words)
+    categories = [profiler.category(iss.DecodedOp(name, 0, 0, 0, 0)) for name in MNEMONICS]
+    problems = {}
+    if isinstance(decoded.name, list):
+        names = list(decoded.name)
+        found = {kind: [] for kind, _ in PROBLEM_KINDS}
+        for index, word in enumerate(decoded.words):
+            kind = PLACEHOLDERS.get(word)
+            if kind is not None:
+                names[index] = 0  # deadbeef decodes as a jal; it is not one
+            elif word == 0:
+                kind = 'zero'
+            elif names[index] == 0:
+                kind = 'illegal'
+            elif _TARGETED[names[index]]:
+                target = 4 * index + decoded.imm[index]
+                if target % 4:
+                    kind = 'target-misaligned'
+                elif not 0 <= target < 4 * count:
+                    kind = 'target-outside'
+            if kind is not None:
+                found[kind].append(4 * index)
+        for kind, addresses in found.items():
+            problems[kind] = (len(addresses), addresses[:PROBLEM_EXAMPLES])
+        usage = Counter(names)
+    else:
+        names = decoded.name.copy()
+        words = decoded.words
+        for word, kind in PLACEHOLDERS.items():
+            mask = words == word
+            names[mask] = 0
+            problems[kind] = _first(mask)
+        zero = words == 0
+        problems['zero'] = _first(zero)
+        problems['illegal'] = _first((names == 0) & ~zero & ~np.isin(words, list(PLACEHOLDERS)))
+        targeted = np.asarray(_TARGETED)[names]
+        target = 4 * np.arange(count, dtype=np.int64) + decoded.imm
+        misaligned = targeted & (target % 4 != 0)
+        problems['target-misaligned'] = _first(misaligned)
+        problems['target-outside'] = _first(targeted & ~misaligned & ((target < 0) | (target >= 4 * count)))
+        usage = Counter(dict(enumerate(np.bincount(names, minlength=len(MNEMONICS)).tolist())))
+
+    mix = Counter()
+    mnemonics = Counter()
+    for index, uses in usage.items():
+        if uses:
+            mix[categories[index]] += uses
+            if index:
+                mnemonics[MNEMONICS[index]] += uses
+    return ImageStats(count, mix, mnemonics, problems)
+
+
+def _labels(decoded):
+    """Word-aligned in-image addresses that are branch or jal targets."""
+    count = len(decoded.words)
+    if isinstance(decoded.name, list):
+        targets = {4 * index + decoded.imm[index] for index, name in enumerate(decoded.name)
+                   if _TARGETED[name] and decoded.words[index] not in PLACEHOLDERS}
+        return {target for target in targets if target % 4 == 0 and 0 <= target < 4 * count}
+    targeted = np.asarray(_TARGETED)[decoded.name] & ~np.isin(decoded.words, list(PLACEHOLDERS))
+    target = 4 * np.flatnonzero(targeted).astype(np.int64) + decoded.imm[targeted]
+    target = target[(target % 4 == 0) & (target >= 0) & (target < 4 * count)]
+    return set(np.unique(target).tolist())
+
+
+def _instruction_text(word, name, rd, rs1, rs2, imm, target_text):
+    mnemonic = MNEMONICS[name]
+    fmt = _FORMATS[name]
+    if word == NOP_WORD:
+        return "nop"
+    if mnemonic is None or word in PLACEHOLDERS:
+        return f".word 0x{word:08x}"
+    if fmt == assembler.FMT_R:
+        return f"{mnemonic} x{rd}, x{rs1}, x{rs2}"
+    if fmt in (assembler.FMT_I, assembler.FMT_SHIFT):
+        return f"{mnemonic} x{rd}, x{rs1}, {imm}"
+    if fmt == assembler.FMT_LOAD:
+        return f"{mnemonic} x{rd}, {imm}(x{rs1})"
+    if fmt == assembler.FMT_S:
+        return f"{mnemonic} x{rs2}, {imm}(x{rs1})"
+    if fmt == assembler.FMT_B:
+        return f"{mnemonic} x{rs1}, x{rs2}, {target_text}"
+    if fmt == assembler.FMT_U:
+        return f"{mnemonic} x{rd}, 0x{(imm >> 12) & 0xFFFFF:x}"
+    return f"{mnemonic} x{rd}, {target_text}"
+
+
+def listing(decoded, comments=True):
+    """Yields the lines of an assembler-compatible listing of a DecodedImage."""
+    if isinstance(decoded.name, list):
+        yield from _python_listing(decoded, comments)
+        return
+    for chunk in listing_chunks(decoded, comments):
+        yield from chunk[:-1].split('\n')
+
+
+def listing_chunks(decoded, comments=True):
+    """Yields the listing as text chunks of whole, newline-terminated lines.
+
+    With NumPy the lines are assembled column-wise, CHUNK_WORDS words at a
+    time (see _numpy_chunks), which is what the command line writes out.
+    """
+    if isinstance(decoded.name, list):
+        lines = list(_python_listing(decoded, comments))
+        for start in range(0, len(lines), CHUNK_WORDS):
+            yield '\n'.join(lines[start:start + CHUNK_WORDS]) + '\n'
+        return
+    yield from _numpy_chunks(decoded, comments)
+
+
+def _address_format(count):
+    return f"%0{max(4, len(f'{4 * count:x}'))}x"
+
+
+def _python_listing(decoded, comments):
+    """Listing lines of a DecodedImage decoded without NumPy, one word at a time.
+
+    Generated images repeat the same words a lot, so the text of every word
+    that does not name a branch target is formatted once and then reused.
+    """
+    address_format = _address_format(len(decoded.words))
+    labels = _labels(decoded)
+    cache = {}
+
+    for index, (word, name, rd, rs1, rs2, imm) in enumerate(zip(*decoded)):
+        pc = 4 * index
+        if pc in labels:
+            yield f"L_{address_format % pc}:"
+        parts = cache.get(word)
+        if parts is None:
+            target_text = None
+            if _TARGETED[name] and word not in PLACEHOLDERS:
+                target = pc + imm
+                # A numeric branch/jal operand is the offset itself
+                target_text = f"L_{address_format % target}" if target in labels else str(imm)
+            text = _instruction_text(word, name, rd, rs1, rs2, imm, target_text)
+            parts = (f"    {text:<32}# ", f": {word:08x}") if comments else (f"    {text}", None)
+            if target_text is None:
+                cache[word] = parts
+        if comments:
+            yield parts[0] + address_format % pc + parts[1]
+        else:
+            yield parts[0]
+
+
+def _ascii_table(strings):
+    """Equal-length ASCII strings as the rows of a uint8 matrix."""
+    return np.frombuffer(''.join(strings).encode('ascii'), dtype=np.uint8).reshape(len(strings), -1)
+
+
+def _numpy_chunks(decoded, comments):
+    """Listing text of a NumPy DecodedImage, built from per-word columns.
+
+    The text of each distinct word is formatted once and spread to all of
+    its lines by fancy indexing; only branches and jals whose target got a
+    label are formatted individually. With comments every line normally has
+    the same width, so a chunk is one uint8 matrix of (text, address, word)
+    columns written out with a single tobytes(); lines of other widths
+    (no comments, or a text longer than the comment column) are joined as
+    strings instead.
+    """
+    words = decoded.words
+    count = len(words)
+    address_format = _address_format(count)
+    width = len(address_format % 0)
+    unique, first, inverse = np.unique(words, return_index=True, return_inverse=True)
+    texts = [_instruction_text(word, name, rd, rs1, rs2, imm,
+                               str(imm) if _TARGETED[name] and word not in PLACEHOLDERS else None)
+             for word, name, rd, rs1, rs2, imm in zip(unique.tolist(), *(c[first].tolist() for c in decoded[1:]))]
+
+    label_pcs = np.array(sorted(_labels(decoded)), dtype=np.int64)
+    targeted = np.asarray(_TARGETED)[decoded.name] & ~np.isin(words, list(PLACEHOLDERS))
+    target = 4 * np.arange(count, dtype=np.int64) + decoded.imm
+    labelled = np.flatnonzero(targeted & np.isin(target, label_pcs))
+    labelled_texts = [_instruction_text(word, name, rd, rs1, rs2, imm, f"L_{address_format % (4 * index + imm)}")
+                      for index, word, name, rd, rs1, rs2, imm
+                      in zip(labelled.tolist(), *(c[labelled].tolist() for c in decoded))]
+
+    def head(text):
+        return f"    {text:<32}# " if comments else f"    {text}"
+
+    heads = [head(text) for text in texts]
+    labelled_heads = [head(text) for text in labelled_texts]
+    fixed = comments and len({len(h) for h in heads + labelled_heads}) == 1
+    if fixed:
+        head_table = _ascii_table(heads)
+        labelled_table = _ascii_table(labelled_heads) if labelled_heads else None
+        tail_table = _ascii_table([f": {word:08x}\n" for word in unique.tolist()])
+        head_width, tail_width = head_table.shape[1], tail_table.shape[1]
+        row_bytes = head_width + width + tail_width
+        # Gathering whole rows as opaque items is much faster than 2-D fancy indexing
+        head_items = head_table.view(f'V{head_width}').ravel()
+        tail_items = tail_table.view(f'V{tail_width}').ravel()
+        digits = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+    else:
+        head_column = np.array(heads, dtype=object)
+        tail_column = np.array([f": {word:08x}" for word in unique.tolist()], dtype=object)
+
+    for start in range(0, count, CHUNK_WORDS):
+        end = min(start + CHUNK_WORDS, count)
+        index = inverse[start:end]
+        pcs = 4 * np.arange(start, end, dtype=np.int64)
+        lo, hi = np.searchsorted(labelled, [start, end])
+        label_lo, label_hi = np.searchsorted(label_pcs, [4 * start, 4 * end])
+        rows = (label_pcs[label_lo:label_hi] // 4 - start).tolist()
+        label_lines = [f"L_{address_format % pc}:\n" for pc in label_pcs[label_lo:label_hi].tolist()]
+        if fixed:
+            matrix = np.empty((end - start, row_bytes), dtype=np.uint8)
+            matrix[:, :head_width] = head_items[index].view(np.uint8).reshape(-1, head_width)
+            if hi > lo:
+                matrix[labelled[lo:hi] - start, :head_width] = labelled_table[lo:hi]
+            for position in range(width):
+                matrix[:, head_width + width - 1 - position] = digits[(pcs >> (4 * position)) & 0xF]
+            matrix[:, head_width + width:] = tail_items[index].view(np.uint8).reshape(-1, tail_width)
+            data = memoryview(matrix).cast('B')
+            pieces = []
+            previous = 0
+            for row, line in zip(rows, label_lines):
+                pieces += [data[previous * row_bytes:row * row_bytes], line.encode('ascii')]
+                previous = row
+            pieces.append(data[previous * row_bytes:])
+            yield b''.join(pieces).decode('ascii')
+            continue
+        lines = head_column[index]
+        for position, text in zip((labelled[lo:hi] - start).tolist(), labelled_heads[lo:hi]):
+            lines[position] = text
+        if comments:
+            lines = lines + np.array([address_format % pc for pc in pcs.tolist()], dtype=object) \
+                + tail_column[index]
+        lines = np.insert(lines, rows, [line[:-1] for line in label_lines])
+        yield '\n'.join(lines.tolist()) + '\n'
+
+
+def verify(lines, words):
+    """Assembles listing lines again; returns the word index of the first difference or None."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = assembler.assemble(list(lines))
+    if not result.ok:
+        errors = [assembler.format_diagnostic(d) for d in result.diagnostics if d.severity == 'error']
+        raise ValueError(f"listing does not assemble: {errors[0]}")
+    original = list(words) if not isinstance(words, list) else words
+    for index, (old, new) in enumerate(zip(original, result.words)):
+        if old != new:
+            return index
+    if len(original) != len(result.words):
+        return min(len(original), len(result.words))
+    return None
+
+
+def print_stats(stats, top=10):
+    total = stats.words or 1
+    print(f"{stats.words} words ({4 * stats.words} bytes)")
+    print("\nInstruction mix:")
+    for name in profiler.MIX_CATEGORIES + ('illegal',):
+        print(f"  {name:<8}{stats.mix[name]:>12}{100.0 * stats.mix[name] / total:>8.1f}%")
+    print(f"\nMnemonics (top {top}):")
+    for name, uses in stats.mnemonics.most_common(top):
+        print(f"  {name:<8}{uses:>12}{100.0 * uses / total:>8.1f}%")
+    print("\nEncoding problems:")
+    for kind, description in PROBLEM_KINDS:
+        found, addresses = stats.problems[kind]
+        where = f"  at {', '.join(f'0x{a:x}' for a in addresses)}{' ...' if found > len(addresses) else ''}" \
+            if found else ''
+        print(f"  {description:<48}{found:>10}{where}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk disassembler and static image analyzer")
+    parser.add_argument("image", help="Program image (.hex, .bin, .ihex or .img)")
+    parser.add_argument("--format", choices=image.FORMATS, help="Image format (default: from the extension)")
+    parser.add_argument("-o", "--output_file", help="Write the listing here instead of stdout")
+    parser.add_argument("--stats", action="store_true", help="Only print the statistics, no listing")
+    parser.add_argument("--verify", action="store_true",
+                        help="Assemble the listing again and check that it reproduces the image")
+    parser.add_argument("--no-comments", action="store_true",
+                        help="Leave out the address/word comment of each line")
+    parser.add_argument("--top", type=int, default=10, help="Mnemonics shown in the statistics (default: 10)")
+    args = parser.parse_args()
+    if args.stats and (args.output_file or args.verify):
+        parser.error("--stats does not write a listing")
+
+    start = time.perf_counter()
+    words = image.load_words(args.image, args.format)
+    decoded = decode_image(words)
+    decode_time = time.perf_counter() - start
+    # Status lines go to stderr when the listing itself is written to stdout
+    status = sys.stdout if args.stats or args.output_file else sys.stderr
+
+    lines = None
+    if not args.stats:
+        text = ''.join(listing_chunks(decoded, not args.no_comments))
+        lines = text[:-1].split('\n') if text else []
+        if args.output_file:
+            with open(args.output_file, 'w', encoding='utf-8') as f:
+                f.write(text)
+            print(f"Listing ({len(lines)} lines) written to {args.output_file}")
+        else:
+            sys.stdout.write(text)
+    with contextlib.redirect_stdout(status):
+        print(f"\n{args.image}: decoded in {decode_time:.3f} s "
+              f"({'NumPy' if np is not None else 'pure Python, install numpy for speed'})")
+        print_stats(analyze(decoded), args.top)
+
+    if args.verify:
+        mismatch = verify(lines, words)
+        if mismatch is not None:
+            print(f"\nRound trip FAILED: word {mismatch} (address 0x{4 * mismatch:x}) differs", file=status)
+            sys.exit(1)
+        print(f"\nRound trip OK: the listing assembles to the same {len(words)} words", file=status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,606 @@
+# RISC-V 32IM Assembler - differential fuzzing of the RTL against the ISS
+# File: assembler/fuzz.py
+#
+# Generates random RV32IM programs, encoded with the assembler's own
+# encoders, and compares the registers and data memory the RTL ends with
+# (hardware/sim/tb_fuzz.v under Icarus Verilog) against the ISS (iss.py):
+#   - hazard-dense mixes: sources are mostly the registers written in the
+#     last few instructions of a small pool (x1..x8), which is seeded with
+#     corner values (0, -1, INT_MIN, ...); x0 is sometimes the destination
+#   - loads and stores only reach the 1024-word data memory, through x0 or
+#     a base register (x31 = 2048) the random code never writes, and mostly
+#     hit a few hot words so stores feed later loads
+#   - control flow only goes forward (branches, jal, jalr to an absolute
+#     address), so every program reaches the halt loop appended at its end
+# By default the generator avoids what the timing model (timing_model.py)
+# already knows the RTL gets wrong (uncovered forwarding hazards, the
+# load-use deadlock), and programs the model still flags are regenerated;
+# --known-hazards keeps them.
+#
+# tb_fuzz.v is compiled once (cached like regression.py) and runs a whole
+# batch of programs per vvp process; batches are generated, simulated and
+# compared in a process pool. Each failing program is then minimized by
+# delta debugging (the candidates of each round are simulated as one batch)
+# and written to <work dir>/fail_<seed>.asm with the differences on top.
+# Programs for which vvp gives no result (a crash or --timeout) are harness
+# problems, not divergences: they are reported separately and never minimized.
+#
+# Usage (from the project root):
+#   python assembler/fuzz.py                                  # 1000 programs
+#   python assembler/fuzz.py --programs 20000 --batch 500 -j 8 --seed 42
+#   python assembler/fuzz.py --mix muldiv --length 40         # favour M-extension corner cases
+#   python assembler/fuzz.py --dry-run --programs 2000        # generator and ISS only (no iverilog)
+
+import argparse
+import glob
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import assembler
+import image
+import iss
+import regression
+import timing_model
+
+TB_PATH = os.path.join('hardware', 'sim', 'tb_fuzz.v')
+DEFAULT_WORK_DIR = os.path.join('tests', 'output', 'fuzz')
+
+DEFAULT_PROGRAMS = 1000
+DEFAULT_BATCH = 250
+DEFAULT_LENGTH = 120
+MAX_LENGTH = 500            # jalr targets are absolute 12-bit addresses
+DEFAULT_MAX_CYCLES = 20000  # Per program in tb_fuzz.v
+MAX_INSTRUCTIONS = 100_000  # ISS limit (forward-only programs never get close)
+MAX_ATTEMPTS = 50           # Regenerations per seed when filtering known hazards
+DEFAULT_MAX_FAILURES = 10   # Failures minimized per run
+
+WORK_REGS = tuple(f"x{n}" for n in range(1, 9))
+BASE_REG = 'x31'
+BASE_ADDRESS = 2048  # Held in x31: offsets -2048..2044 cover the whole data memory
+HOT_WORDS = 8
+
+CORNER_VALUES = (0, 1, -1, 2, -2, 31, 32, 0x7FFFFFFF, -0x80000000, 0xFFFF, -0x10000, 0x55555555)
+CORNER_IMMEDIATES = (0, 1, -1, 2047, -2048, 31, 32)
+
+ALU_R_OPS = ('add', 'sub', 'and', 'or', 'xor', 'sll', 'srl', 'sra', 'slt', 'sltu')
+MULDIV_OPS = ('mul', 'div', 'divu', 'rem', 'remu')
+ALU_I_OPS = ('addi', 'andi', 'ori', 'xori', 'slti', 'sltiu')
+SHIFT_OPS = ('slli', 'srli', 'srai')
+BRANCH_OPS = ('beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu')
+
+# Instruction kind -> weight
+MIXES = {
+    'default': {'alu': 22, 'muldiv': 10, 'imm': 18, 'shift': 8, 'upper': 5,
+                'load': 12, 'store': 10, 'branch': 10, 'jump': 5},
+    'muldiv': {'alu': 10, 'muldiv': 45, 'imm': 15, 'shift': 5, 'upper': 5,
+               'load': 8, 'store': 6, 'branch': 4, 'jump': 2},
+    'memory': {'alu': 12, 'muldiv': 4, 'imm': 12, 'shift': 4, 'upper': 3,
+               'load': 30, 'store': 25, 'branch': 6, 'jump': 4},
+    'control': {'alu': 15, 'muldiv': 5, 'imm': 15, 'shift': 5, 'upper': 5,
+                'load': 8, 'store': 7, 'branch': 25, 'jump': 15},
+}
+
+# One instruction; skip is None, or for control ops the number of following
+# instructions jumped over (clamped to the halt loop), so that deleting
+# instructions while minimizing keeps every target valid
+Instr = namedtuple('Instr', 'name args skip')
+
+NOP = Instr('addi', ('x0', 'x0', '0'), None)
+
+# seed: generator seed; data: ((word index, value), ...) preloaded into data memory
+Case = namedtuple('Case', 'seed instructions data')
+
+# Final architectural state; regs are x1..x31 (None for x/z bits), memory maps
+# word index -> value for the non-zero words
+State = namedtuple('State', 'halted regs memory')
+
+FuzzOptions = namedtuple('FuzzOptions', 'length mix known_hazards max_cycles timeout')
+
+# failures: (Case, differences) of real divergences; inconclusive: seeds of
+# programs without an RTL result (vvp failed or timed out)
+BatchResult = namedtuple('BatchResult', 'programs regenerated failures inconclusive mix seconds')
+
+
+# --- Programs
+
+def resolve(instructions):
+    """(mnemonic, operands) of every instruction with numeric offsets, plus the halt loop."""
+    halt = len(instructions)
+    resolved = []
+    for index, instr in enumerate(instructions):
+        if instr.skip is None:
+            resolved.append((instr.name, list(instr.args)))
+            continue
+        target = min(index + 1 + instr.skip, halt)
+        if instr.name == 'jalr':
+            resolved.append(('jalr', [instr.args[0], 'x0', str(4 * target)]))
+        else:
+            resolved.append((instr.name, list(instr.args) + [str(4 * (target - index))]))
+    resolved.append(('beq', ['x0', 'x0', '0']))
+    return resolved
+
+
+def encode(instructions):
+    """Machine words of a program, halt loop included."""
+    return [assembler.encode_instruction(name, args, {}, 4 * index)
+            for index, (name, args) in enumerate(resolve(instructions))]
+
+
+def data_words(data):
+    """Data-memory image (from address 0) of a case's data."""
+    if not data:
+        return []
+    words = [0] * (max(index for index, _ in data) + 1)
+    for index, value in data:
+        words[index] = value
+    return words
+
+
+def to_source(case, comments=()):
+    """Assembly source of a case that assembler.py turns into the same words and data."""
+    lines = [f"# {comment}\n" for comment in comments]
+    lines.append(".text\n")
+    for name, args in resolve(case.instructions)[:-1]:
+        if name in ('lw', 'sw'):
+            lines.append(f"    {name} {args[0]}, {args[1]}({args[2]})\n")
+        else:
+            lines.append(f"    {name} {', '.join(args)}\n")
+    lines += ["halt:\n", "    beq x0, x0, halt\n"]
+    if case.data:
+        lines.append(".data\n")
+        zeros = 0
+        for word in data_words(case.data):
+            if word == 0:
+                zeros += 1
+                continue
+            if zeros:
+                lines.append(f"    .space {4 * zeros}\n")
+                zeros = 0
+            lines.append(f"    .word 0x{word:08x}\n")
+    return lines
+
+
+class _Generator:
+    """Random instruction stream for one seed; see the module comment.
+
+    For every position it keeps the register writes of the last 3 EX cycles
+    along each path reaching it (a taken branch or jump adds 2 flushed
+    cycles), which is as far back as forwarding_covers looks.
+    """
+
+    def __init__(self, rng, mix, known_hazards):
+        self.rng = rng
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.known_hazards = known_hazards
+        self.hot = [rng.randrange(0, 1024) for _ in range(HOT_WORDS)]
+        self.instructions = []
+        self.histories = defaultdict(set, {0: {(None, None, None)}})
+        self.recent = []  # Destination registers of the last few instructions
+
+    # --- Hazards
+
+    def _writers(self):
+        """Yields (register, write kind, EX-cycle distance) of the latest writers on each incoming path."""
+        for history in self.histories[len(self.instructions)]:
+            seen = set()
+            for slot in range(len(history) - 1, -1, -1):
+                if history[slot] and history[slot][0] not in seen:
+                    seen.add(history[slot][0])
+                    yield history[slot] + (len(history) - slot,)
+
+    def unsafe(self):
+        """Registers a reader placed now would read stale."""
+        if self.known_hazards:
+            return set()
+        return {reg for reg, kind, distance in self._writers() if not timing_model.forwarding_covers(kind, distance)}
+
+    def hazard(self, instr):
+        """True if instr, appended now, would meet a hazard the RTL is known to get wrong."""
+        word = encode([instr])[0]
+        op = iss.decode(word)
+        rd, rs1, rs2 = timing_model._raw_fields(word)
+        if op.name in iss.LOAD_OPS and rd != 0 and rd in (rs1, rs2):
+            return True  # cpu_top.v's load-use check stalls forever
+        reads = set(timing_model.source_registers(op)) - {0}
+        for reg, kind, distance in self._writers():
+            if reg in reads and not timing_model.forwarding_covers(kind, distance):
+                return True
+            if op.name == 'lui' and reg == rs1 and distance in (1, 2):
+                return True  # The forwarding unit matches LUI's raw rs1 field
+        return False
+
+    def append(self, instr):
+        index = len(self.instructions)
+        op = iss.decode(encode([instr])[0])
+        kind = timing_model.write_kind(op)
+        write = (op.rd, kind) if kind else None
+        if write:
+            self.recent.append(f"x{op.rd}")
+        incoming = self.histories.pop(index, set())
+        if instr.skip is not None and incoming:
+            self.histories[index + 1 + instr.skip].add((write, None, None))
+        if instr.name not in iss.JUMP_OPS:
+            self.histories[index + 1] |= {history[1:] + (write,) for history in incoming}
+        self.instructions.append(instr)
+
+    def emit(self, instr):
+        """Appends instr, after NOPs if it would otherwise meet a known hazard."""
+        while not self.known_hazards and self.hazard(instr):
+            self.append(NOP)
+        self.append(instr)
+
+    # --- Operands
+
+    def source(self):
+        rng = self.rng
+        unsafe = self.unsafe()
+        recent = [reg for reg in self.recent[-3:] if int(reg[1:]) not in unsafe]
+        if recent and rng.random() < 0.7:
+            return rng.choice(recent)
+        regs = [reg for reg in WORK_REGS if int(reg[1:]) not in unsafe]
+        return 'x0' if not regs or rng.random() < 0.08 else rng.choice(regs)
+
+    def destination(self):
+        return 'x0' if self.rng.random() < 0.05 else self.rng.choice(WORK_REGS)
+
+    def immediate(self):
+        rng = self.rng
+        return rng.choice(CORNER_IMMEDIATES) if rng.random() < 0.3 else rng.randint(-2048, 2047)
+
+    def address(self):
+        """(offset, base) of a word in data memory."""
+        rng = self.rng
+        index = rng.choice(self.hot) if rng.random() < 0.7 else rng.randrange(0, 1024)
+        if 4 * index <= 2044 and rng.random() < 0.3:
+            return str(4 * index), 'x0'
+        return str(4 * index - BASE_ADDRESS), BASE_REG
+
+    # --- Instructions
+
+    def candidate(self):
+        rng = self.rng
+        kind = rng.choices(self.kinds, self.weights)[0]
+        if kind == 'alu':
+            return Instr(rng.choice(ALU_R_OPS), (self.destination(), self.source(), self.source()), None)
+        if kind == 'muldiv':
+            return Instr(rng.choice(MULDIV_OPS), (self.destination(), self.source(), self.source()), None)
+        if kind == 'imm':
+            return Instr(rng.choice(ALU_I_OPS), (self.destination(), self.source(), str(self.immediate())), None)
+        if kind == 'shift':
+            return Instr(rng.choice(SHIFT_OPS), (self.destination(), self.source(), str(rng.randint(0, 31))), None)
+        if kind == 'upper':
+            return Instr(rng.choice(('lui', 'auipc')), (self.destination(), str(rng.randint(0, 0xFFFFF))), None)
+        if kind == 'load':
+            return Instr('lw', (self.destination(),) + self.address(), None)
+        if kind == 'store':
+            return Instr('sw', (self.source(),) + self.address(), None)
+        if kind == 'branch':
+            return Instr(rng.choice(BRANCH_OPS), (self.source(), self.source()), rng.randint(0, 3))
+        if rng.random() < 0.7:
+            return Instr('jal', (rng.choice(('x0', 'x1', self.destination())),), rng.randint(0, 3))
+        return Instr('jalr', (self.destination(),), rng.randint(0, 3))
+
+    def preamble(self):
+        for name, args in assembler.li_sequence(BASE_REG, BASE_ADDRESS):
+            self.emit(Instr(name, tuple(args), None))
+        for reg in WORK_REGS:
+            if self.rng.random() < 0.8:
+                value = self.rng.choice(CORNER_VALUES) if self.rng.random() < 0.6 \
+                    else self.rng.randint(-0x80000000, 0x7FFFFFFF)
+                for name, args in assembler.li_sequence(reg, value):
+                    self.emit(Instr(name, tuple(args), None))
+        self.recent = []
+
+    def body(self, length):
+        while len(self.instructions) < length:
+            for _ in range(20):
+                instr = self.candidate()
+                if self.known_hazards or not self.hazard(instr):
+                    break
+            else:
+                instr = NOP
+            self.append(instr)
+
+
+def known_hazard(words, data):
+    """True if the timing model finds an uncovered hazard or the load-use deadlock."""
+    result = timing_model.simulate(words, max_instructions=MAX_INSTRUCTIONS, data=data_words(data))
+    return bool(result.hazards) or result.deadlock is not None
+
+
+def generate(seed, length=DEFAULT_LENGTH, mix='default', known_hazards=False):
+    """Generates the case for a seed; returns (Case, number of regenerations)."""
+    rng = random.Random(seed)
+    for attempt in range(MAX_ATTEMPTS):
+        generator = _Generator(rng, MIXES[mix], known_hazards)
+        generator.preamble()
+        generator.body(min(length, MAX_LENGTH))
+        data = tuple(sorted({(rng.choice(generator.hot) if rng.random() < 0.5 else rng.randrange(0, 1024),
+                              rng.getrandbits(32) or 1) for _ in range(24)}))
+        data = tuple({index: value for index, value in data}.items())
+        case = Case(seed, tuple(generator.instructions), data)
+        if known_hazards or not known_hazard(encode(case.instructions), case.data):
+            return case, attempt
+    return case, attempt + 1
+
+
+# --- Reference model and RTL
+
+def reference_state(case):
+    """Final state of a case in the ISS; raises iss.SimulationError for invalid programs."""
+    sim = iss.Simulator(encode(case.instructions), data=data_words(case.data))
+    halted = sim.run(MAX_INSTRUCTIONS)
+    memory = {index: value for index, value in enumerate(sim.data_mem) if value}
+    return State(halted, tuple(sim.regs[1:]), memory)
+
+
+def _hex_or_none(text):
+    try:
+        return int(text, 16)
+    except ValueError:
+        return None
+
+
+def read_states(path, count):
+    """Parses tb_fuzz.v's rtl_state.csv into a list of States (None for programs not reported)."""
+    states = [None] * count
+    current = None
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            fields = line.strip().split(',')
+            if fields[0] == 'program':
+                current = int(fields[1])
+                states[current] = State(fields[2] == '1', [0] * 31, {})
+            elif fields[0] == 'reg' and current is not None:
+                states[current].regs[int(fields[1]) - 1] = _hex_or_none(fields[2])
+            elif fields[0] == 'mem' and current is not None:
+                states[current].memory[int(fields[1])] = _hex_or_none(fields[2])
+    return [state._replace(regs=tuple(state.regs)) if state else None for state in states]
+
+
+def run_rtl(sim_path, cases, batch_dir, max_cycles=DEFAULT_MAX_CYCLES, timeout=None):
+    """Runs cases in one vvp process; returns their States (None if the simulation failed)."""
+    os.makedirs(batch_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(batch_dir, 'prog_*.hex')):
+        os.remove(stale)
+    for number, case in enumerate(cases):
+        image.write_hex(os.path.join(batch_dir, f"prog_{number}.hex"), encode(case.instructions))
+        if case.data:
+            image.write_hex(os.path.join(batch_dir, f"prog_{number}_data.hex"), data_words(case.data))
+    state_path = os.path.join(batch_dir, 'rtl_state.csv')
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    command = ['vvp', '-n', sim_path, f'+batch={batch_dir}', f'+count={len(cases)}',
+               f'+max_cycles={max_cycles}']
+    try:
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       timeout=timeout, check=True)
+    except (subprocess.TimeoutExpired, subprocess.CalledProcessError):
+        return [None] * len(cases)
+    if not os.path.exists(state_path):
+        return [None] * len(cases)
+    return read_states(state_path, len(cases))
+
+
+def differences(expected, actual):
+    """Human-readable differences between the ISS and RTL final states."""
+    found = []
+    if not actual.halted:
+        found.append("RTL did not reach the halt loop within max_cycles")
+    for reg, (want, got) in enumerate(zip(expected.regs, actual.regs), 1):
+        if want != got:
+            got_text = '0x????????' if got is None else f"0x{got:08x}"
+            found.append(f"x{reg}: ISS 0x{want:08x}, RTL {got_text}")
+    for index in sorted(set(expected.memory) | set(actual.memory)):
+        want, got = expected.memory.get(index, 0), actual.memory.get(index, 0)
+        if want != got:
+            got_text = '0x????????' if got is None else f"0x{got:08x}"
+            found.append(f"mem[0x{4 * index:03x}]: ISS 0x{want:08x}, RTL {got_text}")
+    return found
+
+
+def _kind_counts(case):
+    return Counter(instr.name for instr in case.instructions)
+
+
+def run_batch(first_seed, count, options, sim_path, batch_dir):
+    """Generates, simulates and compares one batch; returns a BatchResult."""
+    start = time.perf_counter()
+    cases = []
+    regenerated = 0
+    mix = Counter()
+    for seed in range(first_seed, first_seed + count):
+        case, attempts = generate(seed, options.length, options.mix, options.known_hazards)
+        cases.append(case)
+        regenerated += attempts
+        mix.update(_kind_counts(case))
+    expected = [reference_state(case) for case in cases]
+    failures = []
+    inconclusive = []
+    if sim_path is not None:
+        actual = run_rtl(sim_path, cases, batch_dir, options.max_cycles, options.timeout)
+        for case, want, got in zip(cases, expected, actual):
+            if got is None:
+                inconclusive.append(case.seed)
+                continue
+            found = differences(want, got)
+            if found:
+                failures.append((case, found))
+        if not failures and not inconclusive:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+    return BatchResult(count, regenerated, failures, inconclusive, mix, time.perf_counter() - start)
+
+
+# --- Minimization
+
+def _valid(case, known_hazards):
+    """Reference state of a candidate, or None if it is not a usable program."""
+    try:
+        state = reference_state(case)
+    except iss.SimulationError:
+        return None  # E.g. the base register setup was removed
+    if not state.halted:
+        return None
+    if not known_hazards and known_hazard(encode(case.instructions), case.data):
+        return None  # Would only rediscover a known difference
+    return state
+
+
+def _failing(candidates, options, sim_path, batch_dir):
+    """Which candidate cases still diverge, simulating all valid ones in one vvp run.
+
+    A candidate without an RTL result (vvp failed or timed out) is
+    inconclusive and does not count as diverging.
+    """
+    expected = [_valid(case, options.known_hazards) for case in candidates]
+    valid = [case for case, state in zip(candidates, expected) if state is not None]
+    actual = iter(run_rtl(sim_path, valid, batch_dir, options.max_cycles, options.timeout) if valid else [])
+    failing = []
+    for state in expected:
+        got = next(actual) if state is not None else None
+        failing.append(got is not None and bool(differences(state, got)))
+    return failing
+
+
+def minimize(case, options, sim_path, batch_dir):
+    """Shortest variant of a failing case that still diverges (ddmin over its instructions).
+
+    Returns (minimized Case, differences of the minimized case, or None if
+    its final RTL run gave no result).
+    """
+    if case.data and _failing([case._replace(data=())], options, sim_path, batch_dir)[0]:
+        case = case._replace(data=())
+    instructions = list(case.instructions)
+    chunks = 2
+    while len(instructions) >= 2:
+        size = -(-len(instructions) // chunks)
+        candidates = [case._replace(instructions=tuple(instructions[:start] + instructions[start + size:]))
+                      for start in range(0, len(instructions), size)]
+        failing = [c for c, fails in zip(candidates, _failing(candidates, options, sim_path, batch_dir)) if fails]
+        if failing:
+            instructions = list(min(failing, key=lambda c: len(c.instructions)).instructions)
+            chunks = max(chunks - 1, 2)
+        elif size == 1:
+            break
+        else:
+            chunks = min(chunks * 2, len(instructions))
+    case = case._replace(instructions=tuple(instructions))
+    actual = run_rtl(sim_path, [case], batch_dir, options.max_cycles, options.timeout)[0]
+    shutil.rmtree(batch_dir, ignore_errors=True)
+    return case, differences(reference_state(case), actual) if actual is not None else None
+
+
+def minimize_job(case, found, options, sim_path, work_dir):
+    """Minimizes one failure and writes it to <work_dir>/fail_<seed>.asm; returns the path and summary."""
+    original = len(case.instructions)
+    small, small_found = minimize(case, options, sim_path, os.path.join(work_dir, f"min_{case.seed}"))
+    comments = [f"fuzz case seed {case.seed}, minimized from {original} to {len(small.instructions)} "
+                f"instruction(s); found with --mix {options.mix} --length {options.length}"
+                + (" --known-hazards" if options.known_hazards else '')]
+    comments += small_found or found
+    path = os.path.join(work_dir, f"fail_{case.seed}.asm")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(to_source(small, comments))
+    return path, original, len(small.instructions), small_found or found
+
+
+# --- Driver
+
+def main():
+    parser = argparse.ArgumentParser(description="Differential fuzzing of the RTL against the ISS")
+    parser.add_argument("--programs", type=int, default=DEFAULT_PROGRAMS,
+                        help=f"Programs to generate (default: {DEFAULT_PROGRAMS})")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH,
+                        help=f"Programs per vvp run (default: {DEFAULT_BATCH})")
+    parser.add_argument("--length", type=int, default=DEFAULT_LENGTH,
+                        help=f"Instructions per program, preamble included (default: {DEFAULT_LENGTH}, "
+                             f"at most {MAX_LENGTH})")
+    parser.add_argument("--mix", choices=sorted(MIXES), default='default', help="Instruction mix")
+    parser.add_argument("--seed", type=int, default=1, help="First seed; program i uses seed + i (default: 1)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--known-hazards", action="store_true",
+                        help="Keep programs the timing model already flags (uncovered hazards, load-use deadlock)")
+    parser.add_argument("--max-cycles", type=int, default=DEFAULT_MAX_CYCLES,
+                        help=f"RTL cycle limit per program (default: {DEFAULT_MAX_CYCLES})")
+    parser.add_argument("--max-failures", type=int, default=DEFAULT_MAX_FAILURES,
+                        help=f"Failures to minimize (default: {DEFAULT_MAX_FAILURES})")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-vvp-run timeout in seconds")
+    parser.add_argument("--work_dir", default=DEFAULT_WORK_DIR,
+                        help="Batches and minimized failures (default: tests/output/fuzz)")
+    parser.add_argument("--cache_dir", default=regression.DEFAULT_CACHE_DIR,
+                        help="Compiled simulator cache (default: as regression.py)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only generate the programs and run the reference model")
+    args = parser.parse_args()
+    if not 1 <= args.length <= MAX_LENGTH:
+        parser.error(f"--length must be between 1 and {MAX_LENGTH}")
+
+    sim_path = None
+    if not args.dry_run:
+        for tool in ('iverilog', 'vvp'):
+            if shutil.which(tool) is None:
+                parser.error(f"'{tool}' not found in PATH (install Icarus Verilog, or use --dry-run)")
+        os.makedirs(args.cache_dir, exist_ok=True)
+        testbench = regression.Testbench('tb_fuzz', TB_PATH, None, None, None)
+        try:
+            build_status, sim_path = regression.build(testbench, sorted(glob.glob(regression.RTL_GLOB)),
+                                                      args.cache_dir)
+        except subprocess.CalledProcessError as e:
+            sys.exit(f"iverilog failed: {e.stderr.strip()}")
+        print(f"tb_fuzz: {'cached build' if build_status == 'hit' else 'compiled'} {sim_path}")
+    os.makedirs(args.work_dir, exist_ok=True)
+    sim_path = os.path.abspath(sim_path) if sim_path else None
+    work_dir = os.path.abspath(args.work_dir)
+
+    options = FuzzOptions(args.length, args.mix, args.known_hazards, args.max_cycles, args.timeout)
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = []
+        for first in range(0, args.programs, args.batch):
+            seed = args.seed + first
+            count = min(args.batch, args.programs - first)
+            futures.append(pool.submit(run_batch, seed, count, options, sim_path,
+                                       os.path.join(work_dir, f"batch_{seed}")))
+        results = [future.result() for future in futures]
+        failures = [failure for result in results for failure in result.failures]
+        inconclusive = sorted(seed for result in results for seed in result.inconclusive)
+        minimized = [pool.submit(minimize_job, case, found, options, sim_path, work_dir)
+                     for case, found in failures[:args.max_failures]]
+        minimized = [future.result() for future in minimized]
+    wall = time.perf_counter() - start
+
+    programs = sum(result.programs for result in results)
+    regenerated = sum(result.regenerated for result in results)
+    mix = sum((result.mix for result in results), Counter())
+    total = sum(mix.values())
+    what = "generated and run on the ISS" if args.dry_run else f"compared in {len(results)} vvp run(s)"
+    print(f"{programs} programs {what}, {wall:.1f} s ({programs / wall:.0f} programs/s, "
+          f"{total} instructions)")
+    if not args.known_hazards:
+        print(f"{regenerated} program(s) regenerated because the timing model flagged a known hazard")
+    print("mix: " + ', '.join(f"{name} {100 * count / total:.1f}%" for name, count in mix.most_common(12)))
+    if args.dry_run:
+        return
+    print(f"{len(failures)} divergence(s)")
+    for path, original, small, found in minimized:
+        print(f"  {path}: {original} -> {small} instruction(s)")
+        for line in found[:5]:
+            print(f"      {line}")
+    if inconclusive:
+        shown = ', '.join(map(str, inconclusive[:10])) + (', ...' if len(inconclusive) > 10 else '')
+        print(f"{len(inconclusive)} program(s) without an RTL result (vvp failed or timed out; "
+              f"batches kept in {args.work_dir}), seeds {shown}")
+    if failures or inconclusive:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
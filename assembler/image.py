@@ -0,0 +1,248 @@
+# RISC-V 32IM Assembler - memory image formats
+# File: assembler/image.py
+#
+# Writers and loaders for the word images produced by the assembler:
+#   hex   one '%08x' word per line, read by the testbenches' $readmemh (default)
+#   bin   raw little-endian words
+#   ihex  Intel HEX records (type 00 data, 04 extended linear address, 01 EOF)
+#   img   16-byte header followed by little-endian words; open_image() maps it
+#         and exposes the payload as a zero-copy memoryview of 32-bit words
+#
+# The format of an existing file is chosen from its extension (see FORMAT_EXTENSIONS).
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+FORMATS = ('hex', 'bin', 'ihex', 'img')
+FORMAT_EXTENSIONS = {'hex': '.hex', 'bin': '.bin', 'ihex': '.ihex', 'img': '.img'}
+
+# img header: magic, version, header size, base address, word count
+IMAGE_MAGIC = b'RV32'
+IMAGE_VERSION = 1
+IMAGE_HEADER = struct.Struct('<4sHHII')
+
+IHEX_RECORD_BYTES = 16
+
+
+def _little_endian(words):
+    """Returns an array('I') holding `words` in little-endian byte order."""
+    data = array('I', words)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data
+
+
+def format_for_path(path):
+    """Guesses the image format from a file name, defaulting to 'hex'."""
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, fmt_extension in FORMAT_EXTENSIONS.items():
+        if extension == fmt_extension:
+            return fmt
+    if extension == '.ihx':
+        return 'ihex'
+    return 'hex'
+
+
+# --- Writers
+
+def write_hex(path, words, base_address=0):
+    with open(path, 'w') as f:
+        if base_address:
+            f.write(f"@{base_address // 4:x}\n")  # $readmemh word address
+        f.writelines(f"{word:08x}\n" for word in words)
+
+
+def write_bin(path, words):
+    with open(path, 'wb') as f:
+        f.write(_little_endian(words).tobytes())
+
+
+def _ihex_record(record_type, address, payload):
+    record = bytes((len(payload), (address >> 8) & 0xFF, address & 0xFF, record_type)) + payload
+    checksum = (-sum(record)) & 0xFF
+    return f":{record.hex().upper()}{checksum:02X}\n"
+
+
+def write_ihex(path, words, base_address=0):
+    data = _little_endian(words).tobytes()
+    upper = None
+    with open(path, 'w') as f:
+        offset = 0
+        while offset < len(data):
+            address = base_address + offset
+            if address >> 16 != upper:
+                upper = address >> 16
+                f.write(_ihex_record(0x04, 0, struct.pack('>H', upper)))
+            # Records must not cross a 64 KiB boundary
+            chunk = data[offset:offset + min(IHEX_RECORD_BYTES, 0x10000 - (address & 0xFFFF))]
+            f.write(_ihex_record(0x00, address & 0xFFFF, chunk))
+            offset += len(chunk)
+        f.write(_ihex_record(0x01, 0, b''))
+
+
+def write_img(path, words, base_address=0):
+    data = _little_endian(words)
+    with open(path, 'wb') as f:
+        f.write(IMAGE_HEADER.pack(IMAGE_MAGIC, IMAGE_VERSION, IMAGE_HEADER.size, base_address, len(data)))
+        f.write(data.tobytes())
+
+
+def write_image(path, words, fmt='hex', base_address=0):
+    """Writes `words` (ints, e.g. an array('I')) to `path` in the given format.
+
+    The raw 'bin' format has nowhere to record base_address, so it is padded
+    with zero words from address 0 instead; the others keep the base address.
+    Either way load_words places the words back at base_address.
+    """
+    if fmt == 'hex':
+        write_hex(path, words, base_address)
+    elif fmt == 'bin':
+        write_bin(path, _from_address_zero(base_address, words) if base_address else words)
+    elif fmt == 'ihex':
+        write_ihex(path, words, base_address)
+    elif fmt == 'img':
+        write_img(path, words, base_address)
+    else:
+        raise ValueError(f"Unknown image format '{fmt}', expected one of {FORMATS}")
+
+
+# --- Loaders
+
+def load_hex(path):
+    """Reads a $readmemh-style file into an array('I') indexed from word address 0.
+
+    '@address' lines move the load position, as in $readmemh; skipped words are 0.
+    """
+    words = array('I')
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('//', 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith('@'):
+                index = int(line[1:], 16)
+                if index > len(words):
+                    words.extend(bytes(index - len(words)))
+                else:
+                    del words[index:]
+                continue
+            words.append(int(line, 16))
+    return words
+
+
+def _from_little_endian(data):
+    """Converts little-endian bytes into an array('I')."""
+    words = array('I')
+    words.frombytes(data)
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return words
+
+
+def load_bin(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) % 4:
+        raise ValueError(f"{path}: size {len(data)} is not a multiple of 4 bytes")
+    return _from_little_endian(data)
+
+
+def load_ihex(path):
+    """Reads an Intel HEX file; returns (base_address, array('I'))."""
+    memory = {}
+    upper = 0
+    with open(path, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith(':'):
+                raise ValueError(f"{path}:{line_num}: record does not start with ':'")
+            record = bytes.fromhex(line[1:])
+            if sum(record) & 0xFF:
+                raise ValueError(f"{path}:{line_num}: checksum mismatch")
+            count, address, record_type = record[0], (record[1] << 8) | record[2], record[3]
+            payload = record[4:4 + count]
+            if record_type == 0x00:
+                start = (upper << 16) + address
+                for i, byte in enumerate(payload):
+                    memory[start + i] = byte
+            elif record_type == 0x01:
+                break
+            elif record_type == 0x04:
+                upper = int.from_bytes(payload, 'big')
+    if not memory:
+        return 0, array('I')
+    base = min(memory) & ~3
+    end = (max(memory) + 4) & ~3
+    return base, _from_little_endian(bytes(memory.get(address, 0) for address in range(base, end)))
+
+
+class MappedImage:
+    """A read-only mapping of an img file; `words` views the payload without copying.
+
+    Use as a context manager, or call close() once the views are no longer needed.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size, self.base_address, count = \
+            IMAGE_HEADER.unpack_from(self._map, 0)
+        if magic != IMAGE_MAGIC or version != IMAGE_VERSION:
+            self._map.close()
+            raise ValueError(f"{path}: not a version {IMAGE_VERSION} image")
+        self._view = memoryview(self._map)[header_size:header_size + 4 * count]
+        if sys.byteorder == 'little':
+            self.words = self._view.cast('I')
+        else:
+            self.words = _from_little_endian(self._view)  # Needs a byte-swapped copy
+
+    def __len__(self):
+        return len(self.words)
+
+    def close(self):
+        if isinstance(self.words, memoryview):
+            self.words.release()
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_image(path):
+    """Maps an img file; see MappedImage."""
+    return MappedImage(path)
+
+
+def load_img(path):
+    """Reads an img file; returns (base_address, array('I'))."""
+    with open_image(path) as image:
+        return image.base_address, array('I', image.words)
+
+
+def _from_address_zero(base_address, words):
+    placed = array('I', bytes(4 * (base_address // 4)))
+    placed.extend(words)
+    return placed
+
+
+def load_words(path, fmt=None):
+    """Loads any supported image into an array('I') indexed from address 0."""
+    fmt = fmt or format_for_path(path)
+    if fmt == 'hex':
+        return load_hex(path)
+    if fmt == 'bin':
+        return load_bin(path)
+    if fmt == 'ihex':
+        return _from_address_zero(*load_ihex(path))
+    if fmt == 'img':
+        return _from_address_zero(*load_img(path))
+    raise ValueError(f"Unknown image format '{fmt}', expected one of {FORMATS}")
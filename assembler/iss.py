@@ -0,0 +1,463 @@
+# RISC-V 32IM instruction-set simulator (Python golden model)
+# File: assembler/iss.py
+#
+# Executes RV32I + MUL/DIV/DIVU/REM/REMU with the same memory layout as the
+# hardware/sim testbenches: separate 1024-word instruction and data memories,
+# word-addressed (addr / 4), stores outside the data memory are dropped.
+#
+# The image is decoded once into a list of DecodedOp records. Straight-line
+# runs ending in a branch/jump are then translated lazily into Python
+# functions, so the steady-state cost is one call per basic block.
+#
+# Usage (from the project root):
+#   python assembler/iss.py tests/hex_outputs/fft_test.hex --regs --mem 0x400:0x430
+#   python assembler/iss.py tests/asm_sources/bubble_sort_test.asm
+
+import argparse
+import contextlib
+import io
+import os
+import time
+from collections import namedtuple
+
+import assembler
+import image
+
+MEM_SIZE_WORDS = 1024  # Matches MEM_SIZE_WORDS in hardware/sim/tb_*.v
+MASK32 = 0xFFFFFFFF
+SIGN32 = 0x80000000
+
+DecodedOp = namedtuple('DecodedOp', 'name rd rs1 rs2 imm')
+
+# Reverse of assembler.INSTRUCTION_TABLE: (opcode, funct3, funct7) -> mnemonic.
+# funct7 is None for formats where it is not part of the encoding.
+_DECODE_TABLE = {}
+for _name, _spec in assembler.INSTRUCTION_TABLE.items():
+    if _spec.fmt == assembler.FMT_NONE:
+        continue
+    if _spec.fmt in (assembler.FMT_R, assembler.FMT_SHIFT):
+        _DECODE_TABLE[(_spec.opcode, _spec.funct3, _spec.funct7)] = _name
+    elif _spec.fmt in (assembler.FMT_U, assembler.FMT_J):
+        _DECODE_TABLE[(_spec.opcode, None, None)] = _name
+    else:
+        _DECODE_TABLE[(_spec.opcode, _spec.funct3, None)] = _name
+
+BRANCH_OPS = frozenset(('beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu'))
+JUMP_OPS = frozenset(('jal', 'jalr'))
+CONTROL_OPS = BRANCH_OPS | JUMP_OPS
+LOAD_OPS = frozenset(('lw',))
+STORE_OPS = frozenset(('sw',))
+
+
+class SimulationError(Exception):
+    """Raised when the program does something the testbench memory model cannot serve."""
+
+
+def _signed(value):
+    return (value ^ SIGN32) - SIGN32
+
+
+def decode(word):
+    """Decodes a 32-bit instruction word into a DecodedOp (name is None if illegal)."""
+    opcode = word & 0x7F
+    rd = (word >> 7) & 0x1F
+    funct3 = (word >> 12) & 0x7
+    rs1 = (word >> 15) & 0x1F
+    rs2 = (word >> 20) & 0x1F
+    funct7 = word >> 25
+
+    if opcode in (assembler.OPCODE_LUI, assembler.OPCODE_AUIPC):
+        return DecodedOp(_DECODE_TABLE[(opcode, None, None)], rd, 0, 0, _signed(word & 0xFFFFF000))
+    if opcode == assembler.OPCODE_JAL:
+        imm = (((word >> 31) & 0x1) << 20) | (((word >> 12) & 0xFF) << 12) | \
+              (((word >> 20) & 0x1) << 11) | (((word >> 21) & 0x3FF) << 1)
+        return DecodedOp('jal', rd, 0, 0, imm - (1 << 21) if imm & (1 << 20) else imm)
+    if opcode == assembler.OPCODE_OP:
+        return DecodedOp(_DECODE_TABLE.get((opcode, funct3, funct7)), rd, rs1, rs2, 0)
+    if opcode == assembler.OPCODE_BRANCH:
+        imm = (((word >> 31) & 0x1) << 12) | (((word >> 7) & 0x1) << 11) | \
+              (((word >> 25) & 0x3F) << 5) | (((word >> 8) & 0xF) << 1)
+        return DecodedOp(_DECODE_TABLE.get((opcode, funct3, None)), 0, rs1, rs2,
+                         imm - (1 << 13) if imm & (1 << 12) else imm)
+    if opcode == assembler.OPCODE_STORE:
+        imm = ((word >> 25) << 5) | ((word >> 7) & 0x1F)
+        return DecodedOp(_DECODE_TABLE.get((opcode, funct3, None)), 0, rs1, rs2,
+                         imm - (1 << 12) if imm & (1 << 11) else imm)
+    if opcode == assembler.OPCODE_IMM and funct3 in (assembler.FUNCT3_SLLI, assembler.FUNCT3_SRLI):
+        return DecodedOp(_DECODE_TABLE.get((opcode, funct3, funct7)), rd, rs1, 0, rs2)  # rs2 field is shamt
+    if opcode in (assembler.OPCODE_IMM, assembler.OPCODE_LOAD, assembler.OPCODE_JALR):
+        return DecodedOp(_DECODE_TABLE.get((opcode, funct3, None)), rd, rs1, 0, _signed(word) >> 20)
+    return DecodedOp(None, rd, rs1, rs2, 0)
+
+
+def _div(a, b):
+    if b == 0:
+        return MASK32
+    sa, sb = _signed(a), _signed(b)
+    if sa == -SIGN32 and sb == -1:
+        return SIGN32  # Overflow: -2^31 / -1
+    q = abs(sa) // abs(sb)
+    return (-q if (sa < 0) != (sb < 0) else q) & MASK32
+
+
+def _divu(a, b):
+    return MASK32 if b == 0 else a // b
+
+
+def _rem(a, b):
+    if b == 0:
+        return a
+    sa, sb = _signed(a), _signed(b)
+    if sa == -SIGN32 and sb == -1:
+        return 0
+    r = abs(sa) % abs(sb)
+    return (-r if sa < 0 else r) & MASK32
+
+
+def _remu(a, b):
+    return a if b == 0 else a % b
+
+
+# Right-hand sides for register-writing ops; {a} is rs1, {b} is rs2 or the immediate.
+_R_EXPR = {
+    'add': '({a} + {b}) & 4294967295',
+    'sub': '({a} - {b}) & 4294967295',
+    'and': '{a} & {b}',
+    'or': '{a} | {b}',
+    'xor': '{a} ^ {b}',
+    'sll': '({a} << ({b} & 31)) & 4294967295',
+    'srl': '{a} >> ({b} & 31)',
+    'sra': '((({a} ^ 2147483648) - 2147483648) >> ({b} & 31)) & 4294967295',
+    'slt': 'int(({a} ^ 2147483648) < ({b} ^ 2147483648))',
+    'sltu': 'int({a} < {b})',
+    'mul': '({a} * {b}) & 4294967295',
+    'div': '_div({a}, {b})',
+    'divu': '_divu({a}, {b})',
+    'rem': '_rem({a}, {b})',
+    'remu': '_remu({a}, {b})',
+}
+_I_EXPR = {
+    'addi': 'add', 'andi': 'and', 'ori': 'or', 'xori': 'xor',
+    'slti': 'slt', 'sltiu': 'sltu', 'slli': 'sll', 'srli': 'srl', 'srai': 'sra',
+}
+_BRANCH_COND = {
+    'beq': '{a} == {b}',
+    'bne': '{a} != {b}',
+    'blt': '({a} ^ 2147483648) < ({b} ^ 2147483648)',
+    'bge': '({a} ^ 2147483648) >= ({b} ^ 2147483648)',
+    'bltu': '{a} < {b}',
+    'bgeu': '{a} >= {b}',
+}
+
+
+_BRANCH_TEST = {
+    'beq': lambda a, b: a == b,
+    'bne': lambda a, b: a != b,
+    'blt': lambda a, b: (a ^ SIGN32) < (b ^ SIGN32),
+    'bge': lambda a, b: (a ^ SIGN32) >= (b ^ SIGN32),
+    'bltu': lambda a, b: a < b,
+    'bgeu': lambda a, b: a >= b,
+}
+
+
+def control_taken(op, regs):
+    """Returns True if `op` redirects the pc given the current register values.
+
+    Jumps are always taken; a conditional branch is taken when its condition
+    holds, even if the target happens to be pc + 4.
+    """
+    if op.name in JUMP_OPS:
+        return True
+    test = _BRANCH_TEST.get(op.name)
+    return test is not None and test(regs[op.rs1], regs[op.rs2])
+
+
+def _reg(n):
+    return '0' if n == 0 else f'r[{n}]'
+
+
+def translate(op, pc, limit_bytes):
+    """Returns Python statements executing one decoded op at `pc`.
+
+    Control-transfer ops end with a `return <next pc>`; everything else falls through.
+    """
+    name, rd = op.name, op.rd
+    a, b = _reg(op.rs1), _reg(op.rs2)
+    if name in _R_EXPR:
+        return [f'r[{rd}] = ' + _R_EXPR[name].format(a=a, b=b)] if rd else []
+    if name in _I_EXPR:
+        return [f'r[{rd}] = ' + _R_EXPR[_I_EXPR[name]].format(a=a, b=op.imm & MASK32)] if rd else []
+    if name == 'lui':
+        return [f'r[{rd}] = {op.imm & MASK32}'] if rd else []
+    if name == 'auipc':
+        return [f'r[{rd}] = {(pc + op.imm) & MASK32}'] if rd else []
+    if name == 'lw':
+        lines = [f'a = ({a} + {op.imm}) & 4294967295',
+                 f'if a >= {limit_bytes}: raise SimulationError("load from 0x%08x at pc 0x{pc:08x}" % a)']
+        if rd:
+            lines.append(f'r[{rd}] = m[a >> 2]')
+        return lines
+    if name == 'sw':
+        return [f'a = ({a} + {op.imm}) & 4294967295',
+                f'if a < {limit_bytes}: m[a >> 2] = {b}']
+    if name in _BRANCH_COND:
+        target = (pc + op.imm) & MASK32
+        return [f'if {_BRANCH_COND[name].format(a=a, b=b)}: return {target}',
+                f'return {pc + 4}']
+    if name == 'jal':
+        lines = [f'r[{rd}] = {pc + 4}'] if rd else []
+        return lines + [f'return {(pc + op.imm) & MASK32}']
+    if name == 'jalr':
+        lines = [f't = ({a} + {op.imm}) & 4294967294']
+        if rd:
+            lines.append(f'r[{rd}] = {pc + 4}')
+        return lines + ['return t']
+    return [f'raise SimulationError("illegal instruction at pc 0x{pc:08x}")']
+
+
+_NAMESPACE = {'_div': _div, '_divu': _divu, '_rem': _rem, '_remu': _remu,
+              'SimulationError': SimulationError}
+
+
+def _block_source(ops, start_pc, limit_bytes, max_len):
+    """Generates the body of the block starting at start_pc.
+
+    Returns (statements, instruction_count, last_pc).
+    """
+    body = []
+    pc = start_pc
+    count = 0
+    while True:
+        index = pc >> 2
+        if index >= len(ops):
+            # Ran off the end of the image: hand the out-of-range pc back to run()
+            body.append(f'return {pc}')
+            pc -= 4
+            break
+        op = ops[index]
+        body.extend(translate(op, pc, limit_bytes))
+        count += 1
+        if op.name in CONTROL_OPS or op.name is None or count >= max_len:
+            break
+        pc += 4
+    if not body or not body[-1].startswith(('return', 'raise')):
+        body.append(f'return {pc + 4}')
+    return body, count, pc
+
+
+def _compile_blocks(ops, start_pcs, limit_bytes, max_len):
+    """Compiles the blocks at start_pcs with a single compile() call."""
+    parts = []
+    shapes = {}
+    for start_pc in start_pcs:
+        body, count, last_pc = _block_source(ops, start_pc, limit_bytes, max_len)
+        parts.append(f'def _b{start_pc}(r, m):\n    ' + '\n    '.join(body) + '\n')
+        shapes[start_pc] = (count, last_pc)
+    namespace = dict(_NAMESPACE)
+    exec(compile('\n'.join(parts), '<iss blocks>', 'exec'), namespace)
+    return {pc: (namespace[f'_b{pc}'], count, last_pc) for pc, (count, last_pc) in shapes.items()}
+
+
+def compile_block(ops, start_pc, limit_bytes, max_len=64):
+    """Translates the basic block starting at start_pc into a Python function.
+
+    Returns (function, instruction_count, last_pc). The function takes the
+    register list and data memory list and returns the next pc.
+    """
+    return _compile_blocks(ops, [start_pc], limit_bytes, max_len)[start_pc]
+
+
+def compile_image(ops, limit_bytes, max_len=64):
+    """Translates every statically known block leader of an image at once.
+
+    Leaders are pc 0, branch/jal targets and the instructions following a
+    control transfer. Blocks entered elsewhere (e.g. via jalr) are compiled
+    lazily by the Simulator.
+    """
+    leaders = {0}
+    for index, op in enumerate(ops):
+        if op.name in CONTROL_OPS:
+            pc = index * 4
+            leaders.add(pc + 4)
+            if op.name != 'jalr':
+                leaders.add((pc + op.imm) & MASK32)
+    end_pc = 4 * len(ops)
+    start_pcs = sorted(pc for pc in leaders if pc < end_pc and pc % 4 == 0)
+    return _compile_blocks(ops, start_pcs, limit_bytes, max_len)
+
+
+def load_program(path):
+    """Loads an image in any format image.py supports, or assembles a .asm file in-process."""
+    if path.endswith('.asm'):
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        with contextlib.redirect_stdout(io.StringIO()):
+            program = assembler.assemble_program(lines, source_path=path)
+        return [int(w, 16) for w in program.text]
+    return image.load_words(path)
+
+
+def load_data(path):
+    """Data-memory contents from address 0: a data image, or the data section of a .asm file."""
+    if path.endswith('.asm'):
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        with contextlib.redirect_stdout(io.StringIO()):
+            program = assembler.assemble_program(lines, source_path=path)
+        return [0] * (program.data_base // 4) + list(program.data)
+    return list(image.load_words(path))
+
+
+def find_data(program_path):
+    """The data memory to preload for a program: its own .data section for a .asm
+    file, else the data image the assembler wrote next to it (if any)."""
+    if program_path.endswith('.asm'):
+        return load_data(program_path) or None
+    data_path = assembler.data_image_path(program_path)
+    return load_data(data_path) if os.path.exists(data_path) else None
+
+
+class Simulator:
+    """RV32IM golden model with the testbenches' Harvard memory layout."""
+
+    def __init__(self, program, data=None, mem_size_words=MEM_SIZE_WORDS):
+        if len(program) > mem_size_words:
+            raise SimulationError(
+                f"program has {len(program)} words, instruction memory holds {mem_size_words}")
+        self.program = list(program)
+        self.ops = [decode(word) for word in self.program]
+        self.mem_size_words = mem_size_words
+        self.limit_bytes = 4 * mem_size_words
+        self.end_pc = 4 * len(self.program)
+        self.regs = [0] * 32
+        self.data_mem = [0] * mem_size_words
+        if data:
+            if len(data) > mem_size_words:
+                raise SimulationError(
+                    f"data image has {len(data)} words, data memory holds {mem_size_words}")
+            self.data_mem[:len(data)] = data
+        self.pc = 0
+        self.instret = 0
+        self.halted = False
+        self._blocks = compile_image(self.ops, self.limit_bytes)
+        self._steps = {}
+
+    def _block(self, pc):
+        block = self._blocks.get(pc)
+        if block is None:
+            block = self._blocks[pc] = compile_block(self.ops, pc, self.limit_bytes)
+        return block
+
+    def step(self):
+        """Executes a single instruction; returns the next pc."""
+        if self.halted:
+            return self.pc
+        pc = self.pc
+        if pc >= self.end_pc:
+            self.halted = True
+            return pc
+        func = self._steps.get(pc)
+        if func is None:
+            func = self._steps[pc] = compile_block(self.ops, pc, self.limit_bytes, max_len=1)[0]
+        next_pc = func(self.regs, self.data_mem)
+        self.instret += 1
+        self.halted = next_pc == pc
+        self.pc = next_pc
+        return next_pc
+
+    def run(self, max_instructions=10_000_000):
+        """Runs until the program branches to itself or runs off its end (halt), or the limit is hit.
+
+        Returns True if the program halted.
+        """
+        regs, mem = self.regs, self.data_mem
+        blocks = self._blocks
+        end_pc = self.end_pc
+        pc = self.pc
+        instret = self.instret
+        budget = instret + max_instructions
+        try:
+            while not self.halted:
+                if pc >= end_pc:
+                    self.halted = True  # Fell off the end of the program
+                    break
+                block = blocks.get(pc)
+                if block is None:
+                    block = self._block(pc)
+                func, count, last_pc = block
+                if instret + count > budget:
+                    break
+                next_pc = func(regs, mem)
+                instret += count
+                if next_pc == last_pc:
+                    self.halted = True  # Jump/branch to itself, e.g. beq x0, x0, halt_loop
+                pc = next_pc
+        finally:
+            self.pc = pc
+            self.instret = instret
+        # Finish a partial block one instruction at a time so the limit is exact
+        while not self.halted and self.instret < budget:
+            self.step()
+        return self.halted
+
+    def trace(self, max_instructions=10_000_000):
+        """Steps through the program, yielding (pc, op, taken, next_pc) per instruction.
+
+        `taken` is only meaningful for control-transfer ops (see control_taken).
+        """
+        budget = self.instret + max_instructions
+        while not self.halted and self.instret < budget:
+            pc = self.pc
+            if pc >= self.end_pc:
+                self.halted = True
+                break
+            op = self.ops[pc >> 2]
+            taken = op.name in CONTROL_OPS and control_taken(op, self.regs)
+            next_pc = self.step()
+            yield pc, op, taken, next_pc
+
+    def reg(self, n, signed=False):
+        return _signed(self.regs[n]) if signed else self.regs[n]
+
+    def load_word(self, address):
+        return self.data_mem[(address & MASK32) >> 2]
+
+
+def _parse_range(text):
+    start, end = (int(x, 0) for x in text.split(':'))
+    return start, end
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RISC-V 32IM instruction-set simulator")
+    parser.add_argument("program", help="Program image (.hex) or assembly source (.asm)")
+    parser.add_argument("--data", help="Data-memory image to preload (default: the program's .data section "
+                                       "or the *_data image next to it)")
+    parser.add_argument("--max", type=int, default=10_000_000, help="Instruction limit (default: 10M)")
+    parser.add_argument("--regs", action="store_true", help="Dump the final register file")
+    parser.add_argument("--mem", action="append", default=[], metavar="START:END",
+                        help="Dump data memory byte range, e.g. 0x400:0x430 (repeatable)")
+    args = parser.parse_args()
+
+    data = load_data(args.data) if args.data else find_data(args.program)
+    sim = Simulator(load_program(args.program), data=data)
+    start = time.perf_counter()
+    halted = sim.run(args.max)
+    elapsed = time.perf_counter() - start
+
+    status = "halted" if halted else "instruction limit reached"
+    mips = sim.instret / elapsed / 1e6 if elapsed > 0 else float('inf')
+    print(f"{status} at pc 0x{sim.pc:08x} after {sim.instret} instructions "
+          f"({elapsed * 1000:.1f} ms, {mips:.2f} MIPS)")
+    if args.regs:
+        for n in range(32):
+            print(f"x{n:<2} = 0x{sim.regs[n]:08x} ({_signed(sim.regs[n])})")
+    for mem_range in args.mem:
+        start_addr, end_addr = _parse_range(mem_range)
+        for address in range(start_addr, end_addr, 4):
+            value = sim.load_word(address)
+            print(f"0x{address:04x}: 0x{value:08x} ({_signed(value)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+# RISC-V 32IM Assembler - macro preprocessor
+# File: assembler/preprocessor.py
+#
+# Expands the following directives before the assembler's first pass (GNU as
+# syntax):
+#   .macro name [param[=default], ...]     body up to .endm; invoked as
+#   ...                                    `name arg, ...` or `name param=arg`
+#   .endm
+#   .rept count ... .endr                  body repeated `count` times
+#   .irp param, value, ... ... .endr       body once per value
+#   .equ name, expr / .set name, expr      constants, evaluated when defined
+#   .include "file"                        relative to the including file, then -I dirs
+# In macro and .irp bodies \param is replaced by its value, \@ by a number
+# unique to each macro expansion (for local labels, e.g. loop\@:) and \() by
+# nothing (to glue a parameter to following text). Operands that are integer
+# expressions (+ - * / % << >> & | ^ ~ and parentheses, over numbers and
+# constants) are folded into a single number, so `lw x5, \i*4(x10)` works.
+#
+# Every expanded line is mapped to the line of the top-level source that
+# produced it (the macro call, the .rept/.irp line or the .include line), so
+# line addresses and diagnostics keep pointing at the file being assembled;
+# the inner location (file:line of the body line, macro name) goes into the
+# diagnostic message. Included files are read and cleaned once per process
+# and reused while their size and modification time are unchanged.
+
+import ast
+import functools
+import os
+import re
+from collections import namedtuple
+
+import assembler
+
+MAX_DEPTH = 100  # Nested expansions (macro recursion, nested includes)
+MAX_EXPANDED_LINES = 1 << 22  # Output lines (and .rept count); 16 MiB of text at most
+
+# lines: cleaned source lines; line_numbers: top-level line of each one;
+# contexts: None, or where inside a macro/.rept/include the line came from
+Preprocessed = namedtuple('Preprocessed', 'lines line_numbers contexts')
+
+Macro = namedtuple('Macro', 'name params defaults body')
+
+BLOCK_ENDS = {'.macro': '.endm', '.rept': '.endr', '.irp': '.endr'}
+DIRECTIVES = frozenset(('.macro', '.endm', '.rept', '.irp', '.endr', '.equ', '.set', '.include'))
+
+_TOKEN_RE = re.compile(r'(\S+)\s*(.*)')
+_MACRO_HEADER_RE = re.compile(r'([A-Za-z_.][\w.]*)\s*,?\s*(.*)$')
+_ESCAPE_RE = re.compile(r'\\(\w+|@|\(\))')
+_MEMORY_OPERAND_RE = re.compile(r'^(.*?)\(\s*(\w+)\s*\)$')
+_EXPRESSION_CHARS = re.compile(r'[-+*/%<>&|^~()]')
+_SIMPLE_LITERAL_RE = re.compile(r'^[-+]?(0[xX][0-9a-fA-F]+|0[bB][01]+|\d+)$')
+
+# path -> (size, mtime, cleaned records)
+_include_cache = {}
+
+_BINARY_OPS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: _truncating_div(a, b),
+    ast.FloorDiv: lambda a, b: _truncating_div(a, b),
+    ast.Mod: lambda a, b: a - b * _truncating_div(a, b),
+    ast.LShift: lambda a, b: a << b,
+    ast.RShift: lambda a, b: a >> b,
+    ast.BitAnd: lambda a, b: a & b,
+    ast.BitOr: lambda a, b: a | b,
+    ast.BitXor: lambda a, b: a ^ b,
+}
+_UNARY_OPS = {ast.USub: lambda a: -a, ast.UAdd: lambda a: a, ast.Invert: lambda a: ~a}
+
+
+def _truncating_div(a, b):
+    """Integer division rounding toward zero, as in the GNU assembler."""
+    if b == 0:
+        raise ValueError("division by zero")
+    q = abs(a) // abs(b)
+    return -q if (a < 0) != (b < 0) else q
+
+
+def _evaluate_node(node, symbols):
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        return node.value
+    if isinstance(node, ast.Name) and node.id in symbols:
+        return symbols[node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        return _BINARY_OPS[type(node.op)](_evaluate_node(node.left, symbols), _evaluate_node(node.right, symbols))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        return _UNARY_OPS[type(node.op)](_evaluate_node(node.operand, symbols))
+    raise ValueError("not an integer expression")
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _parse(text):
+    """Expression tree of text, or None if it is not valid expression syntax."""
+    try:
+        return ast.parse(text.strip(), mode='eval').body
+    except SyntaxError:
+        return None
+
+
+def evaluate(text, symbols=None):
+    """Value of an integer expression over literals and `symbols`; raises ValueError otherwise.
+
+    Trees are cached by text, so the same expression evaluated again with
+    other symbol values (.set inside .rept) is not parsed again.
+    """
+    tree = _parse(text)
+    if tree is None:
+        raise ValueError(f"invalid expression '{text}'")
+    try:
+        return _evaluate_node(tree, symbols or {})
+    except RecursionError:
+        raise ValueError(f"invalid expression '{text}'") from None
+
+
+def split_arguments(text):
+    """Splits comma-separated arguments, ignoring commas inside parentheses and strings."""
+    if '(' not in text and '"' not in text:
+        args = [arg.strip() for arg in text.split(',')]
+        return args if args != [''] else []
+    args = []
+    depth = 0
+    in_string = False
+    start = 0
+    for i, char in enumerate(text):
+        if char == '"' and (i == 0 or text[i - 1] != '\\'):
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            args.append(text[start:i].strip())
+            start = i + 1
+    args.append(text[start:].strip())
+    return args if args != [''] else []
+
+
+def _clean(raw):
+    return assembler.strip_comment_quoted(raw) if '"' in raw else assembler.clean_line(raw)
+
+
+def parse_source(lines, path=None):
+    """Cleans source lines into (text, line number, path) records, skipping empty ones."""
+    records = []
+    for line_num, raw in enumerate(lines, 1):
+        line = _clean(raw)
+        if line:
+            records.append((line, line_num, path))
+    return records
+
+
+def read_include(path):
+    """Records of an included file, memoized while its size and mtime are unchanged."""
+    real = os.path.realpath(path)
+    stat = os.stat(real)
+    cached = _include_cache.get(real)
+    if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    with open(real, 'r', encoding='utf-8') as f:
+        records = parse_source(f.readlines(), os.path.relpath(path))
+    _include_cache[real] = (stat.st_size, stat.st_mtime_ns, records)
+    return records
+
+
+def _location(line_num, path):
+    return f"{path}:{line_num}" if path else f"line {line_num}"
+
+
+class Preprocessor:
+    """Expands one program; see the module comment for the directives."""
+
+    def __init__(self, source_path=None, include_dirs=()):
+        self.include_stack = [source_path] if source_path else []  # Files being expanded
+        self.include_dirs = list(include_dirs)
+        self.included = set()  # Every file included so far
+        self.macros = {}
+        self.symbols = {}
+        self.symbol_locations = {}  # Constant name -> where it was first defined
+        self.labels = {}            # Label name -> where it was defined
+        self._symbol_re = None
+        self.expansions = 0  # Value of \@ in the next macro expansion
+        self.lines = []
+        self.line_numbers = []
+        self.contexts = []
+
+    # --- Constants and operand folding
+
+    def define(self, name, expr, where):
+        if not re.fullmatch(r'[A-Za-z_]\w*', name):
+            raise ValueError(f"Invalid symbol name '{name}' at {where}")
+        if name.lower() in assembler.REGISTER_MAP:
+            raise ValueError(f"Register name '{name}' cannot be used as a symbol at {where}")
+        if name in self.labels:
+            raise ValueError(f"Symbol '{name}' at {where} is also a label (defined at {self.labels[name]})")
+        try:
+            value = self.value(expr)
+        except ValueError as e:
+            raise ValueError(f"Cannot evaluate '{expr}' for '{name}' at {where}: {e}") from None
+        if name not in self.symbols:
+            self._symbol_re = None
+            self.symbol_locations[name] = where
+        self.symbols[name] = value
+
+    def substitute(self, text):
+        """Replaces the constants defined so far by their values."""
+        if not self.symbols:
+            return text
+        if self._symbol_re is None:
+            names = sorted(self.symbols, key=len, reverse=True)
+            self._symbol_re = re.compile(r'(?<![\w.])(' + '|'.join(map(re.escape, names)) + r')\b')
+        return self._symbol_re.sub(lambda m: str(self.symbols[m.group(1)]), text)
+
+    def value(self, expr):
+        return evaluate(expr, self.symbols)
+
+    def fold_operand(self, operand):
+        """Substitutes constants in one operand and folds integer expressions."""
+        if not _EXPRESSION_CHARS.search(operand) and operand not in self.symbols:
+            return self.substitute(operand)
+        memory = _MEMORY_OPERAND_RE.match(operand)
+        if memory and memory.group(1).strip():
+            offset, base = memory.groups()
+            if not _SIMPLE_LITERAL_RE.match(offset.strip()):
+                try:
+                    return f"{evaluate(offset, self.symbols)}({base})"
+                except ValueError:
+                    pass
+            return self.substitute(operand)
+        if memory or _SIMPLE_LITERAL_RE.match(operand):
+            return operand
+        try:
+            return str(evaluate(operand, self.symbols))
+        except ValueError:
+            return self.substitute(operand)  # Labels and anything else are left to the assembler
+
+    def rewrite(self, line):
+        """Applies constants and expression folding to the operands of a line."""
+        match = _TOKEN_RE.match(line)
+        mnemonic, operands = match.groups()
+        if not operands or mnemonic.lower() in assembler.STRING_DIRECTIVES:
+            return line
+        if not self.symbols and not _EXPRESSION_CHARS.search(operands):
+            return line
+        folded = [self.fold_operand(operand) for operand in split_arguments(operands)]
+        return f"{mnemonic} {', '.join(folded)}"
+
+    # --- Output
+
+    def emit(self, line, top, context):
+        if len(self.lines) >= MAX_EXPANDED_LINES:
+            raise ValueError(f"Expansion exceeds {MAX_EXPANDED_LINES} lines at line {top}")
+        self.lines.append(line)
+        self.line_numbers.append(top)
+        self.contexts.append(context)
+
+    # --- Blocks
+
+    @staticmethod
+    def collect(records, start, directive, where):
+        """Body records of the block opened at records[start - 1]; returns (body, next index)."""
+        end_directive = BLOCK_ENDS[directive]
+        openers = [d for d, e in BLOCK_ENDS.items() if e == end_directive]
+        depth = 1
+        for index in range(start, len(records)):
+            first = records[index][0].split(None, 1)[0].lower()
+            if first in openers:
+                depth += 1
+            elif first == end_directive:
+                depth -= 1
+                if depth == 0:
+                    return records[start:index], index + 1
+        raise ValueError(f"'{directive}' without a matching '{end_directive}' at {where}")
+
+    def define_macro(self, operands, body, where):
+        match = _MACRO_HEADER_RE.match(operands)
+        if not match:
+            raise ValueError(f"'.macro' needs a name at {where}")
+        name = match.group(1).lower()
+        params = []
+        defaults = {}
+        for param in re.split(r'[\s,]+', match.group(2).strip()) if match.group(2).strip() else []:
+            param, has_default, default = param.partition('=')
+            if not re.fullmatch(r'\w+', param):
+                raise ValueError(f"Invalid parameter '{param}' of macro '{name}' at {where}")
+            params.append(param)
+            if has_default:
+                defaults[param] = default
+        self.macros[name] = Macro(name, params, defaults, body)
+
+    def call_macro(self, macro, operands, top, where, depth):
+        args = dict(macro.defaults)
+        positional = 0
+        for arg in split_arguments(operands):
+            key, equals, value = arg.partition('=')
+            if equals and key.strip() in macro.params:
+                args[key.strip()] = value.strip()
+                continue
+            if positional >= len(macro.params):
+                raise ValueError(f"Too many arguments for macro '{macro.name}' at {where}")
+            args[macro.params[positional]] = arg
+            positional += 1
+        missing = [param for param in macro.params if param not in args]
+        if missing:
+            raise ValueError(f"Missing argument(s) {', '.join(missing)} for macro '{macro.name}' at {where}")
+        args['@'] = str(self.expansions)
+        args['()'] = ''
+        self.expansions += 1
+        self.run(self.bind(macro.body, args), top, f"in macro '{macro.name}'", depth + 1)
+
+    @staticmethod
+    def bind(body, values):
+        """Replaces \\name escapes in body records by values[name]."""
+        def replace(match):
+            return values.get(match.group(1), match.group(0))
+        return [(_ESCAPE_RE.sub(replace, text) if '\\' in text else text, line_num, path)
+                for text, line_num, path in body]
+
+    def repeat(self, body, count, top, context, depth):
+        """Expands a .rept body; identical repetitions are copied instead of re-expanded."""
+        if count <= 0:
+            return
+        if count > MAX_EXPANDED_LINES:
+            raise ValueError(f"'.rept' count {count} exceeds the limit of {MAX_EXPANDED_LINES} at line {top}")
+        start = len(self.lines)
+        state = (dict(self.symbols), self.expansions, len(self.macros))
+        self.run(body, top, context, depth + 1)
+        if (dict(self.symbols), self.expansions, len(self.macros)) == state:
+            if start + (len(self.lines) - start) * count > MAX_EXPANDED_LINES:
+                raise ValueError(f"Expansion exceeds {MAX_EXPANDED_LINES} lines at line {top}")
+            for output in (self.lines, self.line_numbers, self.contexts):
+                output.extend(output[start:] * (count - 1))
+            return
+        for _ in range(count - 1):
+            self.run(body, top, context, depth + 1)
+
+    def include(self, operands, top, where, depth):
+        name = operands.strip()
+        if len(name) >= 2 and name[0] == name[-1] == '"':
+            name = name[1:-1]
+        current_dir = os.path.dirname(self.include_stack[-1]) if self.include_stack else ''
+        candidates = [os.path.join(current_dir, name)]
+        candidates += [os.path.join(directory, name) for directory in self.include_dirs]
+        path = next((c for c in candidates if os.path.isfile(c)), None)
+        if path is None:
+            raise ValueError(f"Include file '{name}' not found at {where}")
+        if os.path.realpath(path) in [os.path.realpath(p) for p in self.include_stack]:
+            raise ValueError(f"Recursive include of '{name}' at {where}")
+        self.include_stack.append(path)
+        self.included.add(path)
+        try:
+            try:
+                records = read_include(path)
+            except (OSError, UnicodeDecodeError) as e:
+                raise ValueError(f"Cannot read include file '{name}' at {where}: {e}") from None
+            self.run(records, top, None, depth + 1)
+        finally:
+            self.include_stack.pop()
+
+    # --- Driver
+
+    def run(self, records, top=None, context=None, depth=0):
+        """Expands records; top is the top-level line for nested expansions (None at top level)."""
+        if depth > MAX_DEPTH:
+            raise ValueError(f"Expansion nested more than {MAX_DEPTH} levels deep "
+                             f"(recursive macro?) at line {top}")
+        macros = self.macros
+        index = 0
+        count = len(records)
+        while index < count:
+            text, line_num, path = records[index]
+            index += 1
+            line_top = line_num if top is None else top
+            if top is None and path is None:
+                where = f"line {line_num}"
+                line_context = None
+            else:
+                where = f"line {line_top} ({_location(line_num, path)})"
+                line_context = _location(line_num, path) + (f" {context}" if context else '')
+
+            label = assembler.LABEL_RE.match(text)
+            if label:
+                if label.group(1) in self.symbols:
+                    raise ValueError(f"Label '{label.group(1)}' at {where} is also a symbol "
+                                     f"(defined at {self.symbol_locations[label.group(1)]})")
+                self.labels.setdefault(label.group(1), where)
+                self.emit(f"{label.group(1)}:", line_top, line_context)
+                text = label.group(2).strip()
+                if not text:
+                    continue
+            first, operands = _TOKEN_RE.match(text).groups()
+            directive = first.lower()
+
+            if directive in DIRECTIVES:
+                if directive in BLOCK_ENDS:
+                    body, index = self.collect(records, index, directive, where)
+                    nested_top = line_top
+                    if directive == '.macro':
+                        self.define_macro(operands, body, where)
+                    elif directive == '.rept':
+                        try:
+                            times = self.value(operands)
+                        except ValueError as e:
+                            raise ValueError(f"Invalid '.rept' count '{operands}' at {where}: {e}") from None
+                        self.repeat(body, times, nested_top, context or 'in .rept', depth)
+                    else:
+                        params = split_arguments(operands)
+                        if not params or not re.fullmatch(r'\w+', params[0]):
+                            raise ValueError(f"'.irp' needs a parameter name at {where}")
+                        for value in params[1:]:
+                            self.run(self.bind(body, {params[0]: value, '()': ''}), nested_top,
+                                     context or 'in .irp', depth + 1)
+                elif directive in ('.equ', '.set'):
+                    name, _, expr = operands.partition(',')
+                    self.define(name.strip(), expr.strip(), where)
+                elif directive == '.include':
+                    self.include(operands, line_top, where, depth)
+                else:
+                    raise ValueError(f"'{first}' without a matching block at {where}")
+                continue
+
+            macro = macros.get(directive) if macros else None
+            if macro is not None:
+                self.call_macro(macro, operands, line_top, where, depth)
+                continue
+            self.emit(self.rewrite(text), line_top, line_context)
+
+
+def preprocess(lines, source_path=None, include_dirs=()):
+    """Expands macros, repetitions, constants and includes; returns a Preprocessed."""
+    preprocessor = Preprocessor(source_path, include_dirs)
+    preprocessor.run(parse_source(lines))
+    return Preprocessed(preprocessor.lines, preprocessor.line_numbers, preprocessor.contexts)
+
+
+def included_files(lines, source_path=None, include_dirs=()):
+    """Paths of all files a source includes, directly or through other includes."""
+    if not assembler.needs_preprocessing(lines):
+        return []
+    preprocessor = Preprocessor(source_path, include_dirs)
+    preprocessor.run(parse_source(lines))
+    return sorted(preprocessor.included)
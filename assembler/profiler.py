@@ -0,0 +1,267 @@
+# RISC-V 32IM Assembler - execution profiler for assembly programs
+# File: assembler/profiler.py
+#
+# Runs an assembly program in the ISS and attributes every executed
+# instruction back to its source line (AssembledProgram.line_addresses, i.e.
+# the assembler's original_num) and to the enclosing text label. The stall
+# and flush cycles of the pipeline timing model are attributed the same way,
+# to the instruction that caused them. The report also shows
+#   - the instruction mix (alu/branch/jump/load/store/mul/div),
+#   - hot loops, found from taken backward branches and jumps,
+#   - a collapsed-stack export (one "frame;frame;... count" line per stack)
+#     for flamegraph.pl, speedscope or inferno; calls made with jal/jalr
+#     that write a link register become stack frames.
+#
+# Usage (from the project root):
+#   python assembler/profiler.py tests/asm_sources/hash_test.asm
+#   python assembler/profiler.py tests/asm_sources/convolution_test.asm --max 20000 --top 10
+#   python assembler/profiler.py tests/asm_sources/fft_test.asm --collapsed /tmp/fft.folded --weight cycles
+
+import argparse
+import bisect
+import contextlib
+import io
+import os
+from collections import Counter, namedtuple
+
+import assembler
+import iss
+import timing_model
+
+MIX_CATEGORIES = ('alu', 'branch', 'jump', 'load', 'store', 'mul', 'div')
+TOP_LABEL = '(start)'  # Name of the code in front of the first text label
+
+# counts: pc -> executions; stacks: (call frames, pc) -> executions;
+# back_edges: (target pc, source pc) -> times taken; lost_by_pc: pc -> stall
+# and flush cycles (empty without the timing model); cycles is None without
+# it, and deadlock the pc the timing model stopped at, if it did
+Profile = namedtuple('Profile', 'program source instructions halted counts stacks back_edges '
+                                'lost_by_pc cycles deadlock')
+
+# A loop found from its back edge: head..tail is the address range of its
+# body, taken the number of times the back edge was followed
+Loop = namedtuple('Loop', 'head tail taken instructions')
+
+
+def category(op):
+    """Instruction-mix bucket of a decoded op ('illegal' for undecodable words)."""
+    name = op.name
+    if name is None:
+        return 'illegal'
+    if name in iss.BRANCH_OPS:
+        return 'branch'
+    if name in iss.JUMP_OPS:
+        return 'jump'
+    if name in iss.LOAD_OPS:
+        return 'load'
+    if name in iss.STORE_OPS:
+        return 'store'
+    if name in timing_model.MUL_OPS:
+        return 'mul'
+    if name in timing_model.DIV_OPS:
+        return 'div'
+    return 'alu'
+
+
+class SourceMap:
+    """Maps text addresses to source lines and to the enclosing text label."""
+
+    def __init__(self, program, lines):
+        self.lines = lines
+        self.line_of = {}
+        for line_num, address in program.line_addresses.items():
+            for k in range(program.line_sizes[line_num]):
+                self.line_of[address + 4 * k] = line_num
+        # Sorted by address, then definition order, so the last label defined
+        # at an address names the code that follows it
+        order = {label: i for i, label in enumerate(program.text_labels)}
+        text = sorted(program.text_labels, key=lambda label: (program.labels[label], order[label]))
+        self._addresses = [program.labels[label] for label in text]
+        self._names = text
+
+    def label(self, pc):
+        index = bisect.bisect_right(self._addresses, pc) - 1
+        return self._names[index] if index >= 0 else TOP_LABEL
+
+    def line(self, pc):
+        return self.line_of.get(pc)
+
+    def text(self, line_num):
+        """Source text of a line without its comment, for reports."""
+        if line_num is None or not 0 < line_num <= len(self.lines):
+            return '?'
+        return assembler.clean_line(self.lines[line_num - 1]) or '?'
+
+
+def profile(path, max_instructions=1_000_000, timing=True, policy='rtl'):
+    """Assembles and runs the .asm file at `path`; returns (Profile, SourceMap)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    with contextlib.redirect_stdout(io.StringIO()):
+        program = assembler.assemble_program(lines, source_path=path)
+    words = [int(word, 16) for word in program.text]
+    data = [0] * (program.data_base // 4) + list(program.data) if program.data else None
+    source = SourceMap(program, lines)
+
+    sim = iss.Simulator(words, data=data)
+    counts = Counter()
+    stacks = Counter()
+    back_edges = Counter()
+    frames = ()
+    returns = []  # Return address of each call frame
+    for pc, op, taken, next_pc in sim.trace(max_instructions):
+        counts[pc] += 1
+        stacks[frames, pc] += 1
+        if not taken:
+            continue
+        if op.rd != 0:  # jal/jalr writing a link register: a call
+            frames = frames + (source.label(next_pc),)
+            returns.append(pc + 4)
+        elif next_pc in returns:  # Return, whichever register held the link
+            depth = len(returns) - 1 - returns[::-1].index(next_pc)
+            frames = frames[:depth]
+            del returns[depth:]
+        elif next_pc < pc:
+            back_edges[next_pc, pc] += 1
+
+    lost_by_pc = {}
+    cycles = deadlock = None
+    if timing:
+        result = timing_model.simulate(words, policy=policy, max_instructions=max_instructions, data=data)
+        deadlock = result.deadlock
+        if deadlock is None:
+            lost_by_pc = result.lost_by_pc
+            cycles = result.cycles
+    return Profile(program, path, sim.instret, sim.halted, counts, stacks, back_edges,
+                   lost_by_pc, cycles, deadlock), source
+
+
+def instruction_mix(prof):
+    mix = Counter()
+    for pc, count in prof.counts.items():
+        mix[category(iss.decode(int(prof.program.text[pc >> 2], 16)))] += count
+    return mix
+
+
+def hot_loops(prof):
+    """Loops ordered by the instructions executed inside their address range."""
+    pcs = sorted(prof.counts)
+    loops = []
+    for (head, tail), taken in prof.back_edges.items():
+        start = bisect.bisect_left(pcs, head)
+        end = bisect.bisect_right(pcs, tail)
+        executed = sum(prof.counts[pc] for pc in pcs[start:end])
+        loops.append(Loop(head, tail, taken, executed))
+    loops.sort(key=lambda loop: loop.instructions, reverse=True)
+    return loops
+
+
+def _attribute(prof, key):
+    """Sums executions and lost cycles by key(pc); returns {key: [instructions, lost]}."""
+    totals = {}
+    for pc, count in prof.counts.items():
+        entry = totals.setdefault(key(pc), [0, 0])
+        entry[0] += count
+        entry[1] += prof.lost_by_pc.get(pc, 0)
+    return totals
+
+
+def _frame(text):
+    """Makes `text` safe as a collapsed-stack frame name."""
+    return text.replace(';', ',').replace('\n', ' ')
+
+
+def write_collapsed(prof, source, path, weight='instructions'):
+    """Writes one 'root;call frames;label;line count' record per distinct stack.
+
+    With weight='cycles', each instruction counts 1 plus its share of the
+    stall and flush cycles the timing model attributed to it.
+    """
+    root = _frame(os.path.basename(prof.source))
+    folded = Counter()
+    for (frames, pc), count in prof.stacks.items():
+        label = source.label(pc)
+        stack = [root] + list(frames)
+        if not frames or frames[-1] != label:
+            stack.append(label)
+        line_num = source.line(pc)
+        stack.append(f"line {line_num}: {source.text(line_num)}")
+        if weight == 'cycles':
+            count += prof.lost_by_pc.get(pc, 0) * count / prof.counts[pc]
+        folded[';'.join(_frame(frame) for frame in stack)] += count
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in sorted(folded.items()):
+            f.write(f"{stack} {round(count)}\n")
+
+
+def print_report(prof, source, top=15):
+    total = prof.instructions or 1
+    status = "halted" if prof.halted else "instruction limit reached"
+    print(f"{prof.source}: {prof.instructions} instructions ({status})", end='')
+    if prof.cycles is not None:
+        cpi = prof.cycles / prof.instructions if prof.instructions else 0.0
+        print(f", {prof.cycles} cycles, CPI {cpi:.3f}")
+    else:
+        print()
+    if prof.deadlock is not None:
+        print(f"No cycle attribution: the timing model deadlocks at pc 0x{prof.deadlock:08x} "
+              f"(line {source.line(prof.deadlock)}), try --policy hazard_unit")
+    has_timing = prof.cycles is not None
+
+    mix = instruction_mix(prof)
+    print("\nInstruction mix:")
+    for name in MIX_CATEGORIES + ('illegal',):
+        if mix[name] or name in MIX_CATEGORIES:
+            print(f"  {name:<8}{mix[name]:>12}{100.0 * mix[name] / total:>8.1f}%")
+
+    stall_header = f"{'stalls':>10}" if has_timing else ''
+    print(f"\nBy label:\n  {'label':<24}{'instructions':>14}{'%':>8}{stall_header}")
+    by_label = _attribute(prof, source.label)
+    for label, (count, lost) in sorted(by_label.items(), key=lambda item: item[1][0], reverse=True):
+        stalls = f"{lost:>10}" if has_timing else ''
+        print(f"  {label:<24}{count:>14}{100.0 * count / total:>8.1f}{stalls}")
+
+    print(f"\nHot lines (top {top}):\n  {'line':>6}{'executions':>12}{'%':>8}{stall_header}  source")
+    by_line = _attribute(prof, source.line)
+    ranked = sorted(by_line.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)
+    for line_num, (count, lost) in ranked[:top]:
+        stalls = f"{lost:>10}" if has_timing else ''
+        print(f"  {line_num if line_num else '?':>6}{count:>12}{100.0 * count / total:>8.1f}{stalls}"
+              f"  {source.text(line_num)}")
+
+    loops = hot_loops(prof)
+    if loops:
+        print(f"\nHot loops:\n  {'head':<28}{'back edge':>12}{'taken':>12}{'instructions':>14}{'%':>8}")
+        for loop in loops[:top]:
+            head = f"{source.label(loop.head)} (line {source.line(loop.head)})"
+            print(f"  {head:<28}{f'line {source.line(loop.tail)}':>12}{loop.taken:>12}"
+                  f"{loop.instructions:>14}{100.0 * loop.instructions / total:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-line and per-label execution profiler")
+    parser.add_argument("source", help="Assembly source (.asm)")
+    parser.add_argument("--max", type=int, default=1_000_000, help="Instruction limit (default: 1M)")
+    parser.add_argument("--top", type=int, default=15, help="Rows in the hot line/loop tables (default: 15)")
+    parser.add_argument("--no-timing", action="store_true",
+                        help="Skip the pipeline timing model (no cycle or stall attribution)")
+    parser.add_argument("--policy", choices=timing_model.POLICIES, default='rtl',
+                        help="Stall policy of the timing model (default: rtl)")
+    parser.add_argument("--collapsed", metavar="PATH", help="Write collapsed stacks for flame graph tools")
+    parser.add_argument("--weight", choices=('instructions', 'cycles'), default='instructions',
+                        help="Sample weight of the collapsed stacks (default: instructions)")
+    args = parser.parse_args()
+    if not args.source.endswith('.asm'):
+        parser.error("the profiler needs the assembly source for line and label attribution")
+    if args.weight == 'cycles' and args.no_timing:
+        parser.error("--weight cycles needs the timing model")
+
+    prof, source = profile(args.source, args.max, timing=not args.no_timing, policy=args.policy)
+    print_report(prof, source, args.top)
+    if args.collapsed:
+        write_collapsed(prof, source, args.collapsed, args.weight)
+        print(f"\nCollapsed stacks written to {args.collapsed}")
+
+
+if __name__ == "__main__":
+    main()
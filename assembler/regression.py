@@ -0,0 +1,225 @@
+# RISC-V 32IM Assembler - parallel regression runner for the RTL testbenches
+# File: assembler/regression.py
+#
+# For every hardware/sim/tb_*.v the runner
+#   1. assembles the program the testbench loads ($readmemh path -> tests/asm_sources/<name>.asm)
+#      in-process, writing tests/hex_outputs/<name>.hex (and <name>_data.hex),
+#   2. compiles the testbench with iverilog, reusing a cached simulator when
+#      neither the testbench nor any hardware/rtl/*.v file changed,
+#   3. runs the vvp jobs in a thread pool and parses tests/output/*_result.csv
+#      into one PASS/FAIL summary.
+#
+# Writing waveforms dominates the simulation time, so the testbenches skip
+# $dumpvars when run with +novcd; the runner passes it unless --vcd is given.
+#
+# Usage (from the project root):
+#   python assembler/regression.py                    # all testbenches
+#   python assembler/regression.py fft gcd -j 4       # testbenches whose name contains 'fft' or 'gcd'
+#   python assembler/regression.py fft --vcd          # also write tests/output/tb_fft_test.vcd
+
+import argparse
+import csv
+import glob
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import assembler
+import image
+
+SIM_DIR = os.path.join('hardware', 'sim')
+RTL_GLOB = os.path.join('hardware', 'rtl', '*.v')
+SOURCE_DIR = os.path.join('tests', 'asm_sources')
+DEFAULT_CACHE_DIR = os.path.join('tests', 'output', 'sim_cache')
+
+IVERILOG_FLAGS = ()
+
+_READMEMH_RE = re.compile(r'\$readmemh\(\s*"([^"]+)"')
+_RESULT_RE = re.compile(r'\$fopen\(\s*"([^"]+_result\.csv)"')
+
+# One testbench: its Verilog file, the program it loads and the files it reads/writes
+Testbench = namedtuple('Testbench', 'name path source hex_path result_path')
+
+# Outcome of one testbench; status is 'PASS', 'FAIL' or 'ERROR'
+TestResult = namedtuple('TestResult', 'name status passed checks build seconds detail')
+
+
+def discover(sim_dir=SIM_DIR, source_dir=SOURCE_DIR):
+    """Pairs every tb_*.v with the .asm source of the image it loads."""
+    testbenches = []
+    for path in sorted(glob.glob(os.path.join(sim_dir, 'tb_*.v'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        hex_paths = [p for p in _READMEMH_RE.findall(text) if not p.endswith('_data.hex')]
+        results = _RESULT_RE.findall(text)
+        if not hex_paths or not results:
+            continue
+        hex_path = os.path.normpath(hex_paths[0])
+        stem = os.path.splitext(os.path.basename(hex_path))[0]
+        name = os.path.splitext(os.path.basename(path))[0]
+        testbenches.append(Testbench(name, path, os.path.join(source_dir, stem + '.asm'),
+                                     hex_path, os.path.normpath(results[0])))
+    return testbenches
+
+
+def assemble_testbench(testbench):
+    """Assembles the testbench's program in-process; returns an error message or None."""
+    if not os.path.exists(testbench.source):
+        return f"missing source {testbench.source}"
+    with open(testbench.source, 'r', encoding='utf-8') as f:
+        result = assembler.assemble(f.readlines(), source_path=testbench.source)
+    errors = [assembler.format_diagnostic(d) for d in result.diagnostics if d.severity == 'error']
+    if errors:
+        return '; '.join(errors)
+    os.makedirs(os.path.dirname(testbench.hex_path) or '.', exist_ok=True)
+    image.write_hex(testbench.hex_path, result.words)
+    data_path = assembler.data_image_path(testbench.hex_path)
+    if result.data:
+        image.write_hex(data_path, result.data, result.data_base)
+    elif os.path.exists(data_path):
+        os.remove(data_path)  # Stale image of a program that no longer has data
+    return None
+
+
+def build_key(testbench_path, rtl_paths):
+    """Hash of the testbench, the RTL sources (names and contents) and the compiler flags."""
+    h = hashlib.sha256(' '.join(IVERILOG_FLAGS).encode())
+    for path in [testbench_path] + sorted(rtl_paths):
+        h.update(os.path.basename(path).encode() + b'\0')
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def build(testbench, rtl_paths, cache_dir, force=False):
+    """Compiles the testbench unless a cached simulator exists; returns (status, vvp path)."""
+    sim_path = os.path.join(cache_dir, f"{testbench.name}-{build_key(testbench.path, rtl_paths)}.vvp")
+    if not force and os.path.exists(sim_path):
+        return 'hit', sim_path
+    for stale in glob.glob(os.path.join(cache_dir, f"{testbench.name}-*.vvp")):
+        os.remove(stale)
+    tmp_path = f"{sim_path}.{os.getpid()}.tmp"
+    subprocess.run(['iverilog', *IVERILOG_FLAGS, '-o', tmp_path, testbench.path, *rtl_paths],
+                   check=True, capture_output=True, text=True)
+    os.replace(tmp_path, sim_path)
+    return 'built', sim_path
+
+
+def parse_results(path):
+    """Counts the PASS/FAIL checks of a *_result.csv; returns (passed, checks)."""
+    passed = checks = 0
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for row in csv.reader(f):
+            for field in row:
+                verdict = field.strip().split(' ', 1)[0]
+                if verdict in ('PASS', 'FAIL'):
+                    checks += 1
+                    passed += verdict == 'PASS'
+                    break
+    return passed, checks
+
+
+def run_testbench(testbench, rtl_paths, cache_dir, vcd=False, force=False, timeout=None):
+    """Builds and simulates one testbench whose program is already assembled; returns a TestResult."""
+    start = time.perf_counter()
+
+    def result(status, passed=0, checks=0, build='-', detail=''):
+        return TestResult(testbench.name, status, passed, checks, build,
+                          time.perf_counter() - start, detail)
+
+    try:
+        build_status, sim_path = build(testbench, rtl_paths, cache_dir, force)
+    except subprocess.CalledProcessError as e:
+        return result('ERROR', detail=f"iverilog failed: {e.stderr.strip()}")
+
+    if os.path.exists(testbench.result_path):
+        os.remove(testbench.result_path)
+    command = ['vvp', '-n', sim_path] + ([] if vcd else ['+novcd'])
+    try:
+        run = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return result('ERROR', build=build_status, detail=f"vvp timed out after {timeout} s")
+    if run.returncode != 0:
+        return result('ERROR', build=build_status, detail=f"vvp exited with {run.returncode}")
+    if not os.path.exists(testbench.result_path):
+        return result('ERROR', build=build_status, detail=f"{testbench.result_path} not written")
+
+    passed, checks = parse_results(testbench.result_path)
+    status = 'PASS' if checks and passed == checks else 'FAIL'
+    return result(status, passed, checks, build_status)
+
+
+def run_all(testbenches, cache_dir=DEFAULT_CACHE_DIR, jobs=None, vcd=False, force=False, timeout=None):
+    """Runs the testbenches concurrently; returns the TestResults in discovery order.
+
+    The programs are assembled first, in this thread (assembler.assemble is
+    not thread-safe and takes milliseconds). The iverilog and vvp processes do
+    the rest of the work, so threads are enough to keep every core busy.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(os.path.join('tests', 'output'), exist_ok=True)
+    rtl_paths = sorted(glob.glob(RTL_GLOB))
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        for testbench in testbenches:
+            start = time.perf_counter()
+            error = assemble_testbench(testbench)
+            if error:
+                results[testbench] = TestResult(testbench.name, 'ERROR', 0, 0, '-',
+                                                time.perf_counter() - start, error)
+            else:
+                results[testbench] = pool.submit(run_testbench, testbench, rtl_paths, cache_dir,
+                                                 vcd, force, timeout)
+        return [r if isinstance(r, TestResult) else r.result() for r in results.values()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel regression runner for the RTL testbenches")
+    parser.add_argument("filters", nargs='*',
+                        help="Only run testbenches whose name contains one of these strings")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Concurrent simulations (default: number of CPUs)")
+    parser.add_argument("--vcd", action="store_true", help="Dump waveforms (tests/output/tb_*.vcd)")
+    parser.add_argument("--force", action="store_true", help="Recompile every testbench, ignoring the cache")
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="Compiled simulator cache (default: tests/output/sim_cache)")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-simulation timeout in seconds")
+    args = parser.parse_args()
+
+    for tool in ('iverilog', 'vvp'):
+        if shutil.which(tool) is None:
+            parser.error(f"'{tool}' not found in PATH (install Icarus Verilog)")
+
+    testbenches = discover()
+    if args.filters:
+        testbenches = [tb for tb in testbenches if any(f in tb.name for f in args.filters)]
+    if not testbenches:
+        parser.error("no testbenches selected")
+
+    start = time.perf_counter()
+    results = run_all(testbenches, args.cache_dir, args.jobs, args.vcd, args.force, args.timeout)
+    wall = time.perf_counter() - start
+
+    print(f"{'testbench':<28}{'status':>8}{'checks':>10}{'build':>8}{'time (s)':>10}")
+    for r in results:
+        checks = f"{r.passed}/{r.checks}" if r.checks else '-'
+        print(f"{r.name:<28}{r.status:>8}{checks:>10}{r.build:>8}{r.seconds:>10.2f}")
+        if r.detail:
+            print(f"  {r.detail}")
+    failed = [r.name for r in results if r.status != 'PASS']
+    hits = sum(1 for r in results if r.build == 'hit')
+    print(f"{len(results) - len(failed)}/{len(results)} passed, {hits} cached build(s), "
+          f"wall time {wall:.2f} s")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+# RISC-V 32IM Assembler - hazard-aware NOP removal and scheduling pass
+# File: assembler/scheduler.py
+#
+# The test programs pad dependent instructions with NOPs "to prevent
+# hazards". Most of that padding is unnecessary: forwarding_unit.v forwards
+# ALU results from EX/MEM and MEM/WB. This pass deletes the redundant NOPs
+# and reorders independent instructions inside each basic block, keeping
+# only the gaps the pipeline really needs (see timing_model.forwarding_covers):
+#   - ALU result, consumer 1-2 instructions later: forwarded
+#   - consumer exactly 3 instructions later: reads the stale register
+#     (the register file has no write-through), so a gap of 3 is avoided
+#   - load or JAL/JALR link value: must be 4 or more instructions earlier
+#
+# Blocks are bounded by labels, directives and control instructions. Across
+# a boundary the producer/consumer positions are kept unless they become at
+# least 3 slots away from the boundary, so the pass never creates a hazard
+# between blocks. Blocks that already contain an uncovered hazard are left
+# untouched, as the program's results may depend on it.
+#
+# Usage (from the project root):
+#   python assembler/scheduler.py tests/asm_sources/*.asm      # report only
+#   python assembler/scheduler.py tests/asm_sources/fft_test.asm -o /tmp/fft_sched.asm
+#   python assembler/assembler.py tests/asm_sources/fft_test.asm --schedule
+
+import argparse
+import contextlib
+import io
+from collections import namedtuple
+
+import assembler
+import iss
+import timing_model
+
+# Distance at which every producer kind is visible to the consumer
+SAFE_DISTANCE = 4
+
+NOP_WORD = 0x00000013
+NOP_LINE = "    nop\n"
+
+# One instruction line together with the comment/blank lines written above it
+_Unit = namedtuple('_Unit', 'lines op word')
+
+ScheduleReport = namedtuple('ScheduleReport', 'blocks changed skipped nops_removed')
+
+
+def _reads(op):
+    """Registers (other than x0) whose value `op` depends on."""
+    return [reg for reg in timing_model.source_registers(op) if reg]
+
+
+def _lui_field(op, word):
+    """LUI's raw rs1 field, which the forwarding unit matches although LUI reads x0."""
+    if op.name == 'lui':
+        return (word >> 15) & 0x1F
+    return 0
+
+
+def _block_hazards(seq):
+    """Returns True if the straight-line sequence of (op, word) has an uncovered dependency."""
+    last_writer = {}
+    for j, (op, word) in enumerate(seq):
+        for reg in _reads(op):
+            if reg in last_writer:
+                i, kind = last_writer[reg]
+                if not timing_model.forwarding_covers(kind, j - i):
+                    return True
+        raw = _lui_field(op, word)
+        if raw in last_writer and j - last_writer[raw][0] in (1, 2):
+            return True
+        kind = timing_model.write_kind(op)
+        if kind:
+            last_writer[op.rd] = (j, kind)
+    return False
+
+
+def _boundary_profile(seq):
+    """Positions of live-in reads and distances of last writes from the block end.
+
+    Returns (live_in, live_out): live_in maps an instruction id to its position
+    if it reads a register not written earlier in the block, live_out maps
+    each written register to the number of slots after its last write.
+    """
+    live_in = {}
+    written = {}
+    for position, (ident, op, word) in enumerate(seq):
+        reads = _reads(op)
+        raw = _lui_field(op, word)
+        if raw:
+            reads = reads + [raw]
+        if any(reg not in written for reg in reads):
+            live_in[ident] = position
+        kind = timing_model.write_kind(op)
+        if kind:
+            written[op.rd] = position
+    live_out = {reg: len(seq) - 1 - position for reg, position in written.items()}
+    return live_in, live_out
+
+
+def _boundaries_kept(new, orig):
+    """True if `new` behaves like `orig` towards the neighbouring blocks."""
+    new_in, new_out = _boundary_profile(new)
+    orig_in, orig_out = _boundary_profile(orig)
+    for ident, position in new_in.items():
+        if position < SAFE_DISTANCE - 1 and position != orig_in.get(ident):
+            return False
+    for reg, distance in new_out.items():
+        if distance < SAFE_DISTANCE - 1 and distance != orig_out.get(reg):
+            return False
+    return True
+
+
+def _depends(a, b):
+    """True if instruction b (later in program order) must stay after instruction a."""
+    op_a, op_b = a[1], b[1]
+    writes_a = {op_a.rd} if timing_model.write_kind(op_a) else set()
+    writes_b = {op_b.rd} if timing_model.write_kind(op_b) else set()
+    reads_a = set(_reads(op_a))
+    reads_b = set(_reads(op_b))
+    if writes_a & (reads_b | writes_b) or writes_b & reads_a:
+        return True
+    memory = iss.LOAD_OPS | iss.STORE_OPS
+    if op_a.name in memory and op_b.name in memory and \
+            (op_a.name in iss.STORE_OPS or op_b.name in iss.STORE_OPS):
+        return True
+    return False
+
+
+def _safe_at(candidate, position, placed, orig_position):
+    """True if `candidate` can issue at `position` after the already `placed` entries."""
+    _, op, word = candidate
+    reads = _reads(op)
+    raw = _lui_field(op, word)
+    live_in = False
+    for reg in reads + ([raw] if raw else []):
+        for i in range(len(placed) - 1, -1, -1):
+            writer = placed[i][1]
+            if timing_model.write_kind(writer) and writer.rd == reg:
+                distance = position - i
+                if reg == raw and reg not in reads:
+                    if distance in (1, 2):
+                        return False
+                elif not timing_model.forwarding_covers(timing_model.write_kind(writer), distance):
+                    return False
+                break
+        else:
+            live_in = True
+    return not live_in or position >= SAFE_DISTANCE - 1 or position == orig_position
+
+
+def schedule_block(seq):
+    """Schedules one basic block.
+
+    `seq` is a list of (id, op, word) in program order; NOPs are entries whose
+    word is NOP_WORD. Returns the new order as a list of ids and None for NOP
+    slots, or None if the block is better left as it is.
+    """
+    if _block_hazards([(op, word) for _, op, word in seq]):
+        return None
+    body = [entry for entry in seq if entry[2] != NOP_WORD]
+    orig_position = {entry[0]: position for position, entry in enumerate(seq)}
+    terminator = body[-1] if body and body[-1][1].name in iss.CONTROL_OPS else None
+
+    predecessors = {entry[0]: set() for entry in body}
+    for j, later in enumerate(body):
+        for earlier in body[:j]:
+            if later is terminator or _depends(earlier, later):
+                predecessors[later[0]].add(earlier[0])
+
+    nop = (None, iss.decode(NOP_WORD), NOP_WORD)
+    placed = []
+    done = set()
+    remaining = list(body)
+    while remaining:
+        for candidate in remaining:
+            if predecessors[candidate[0]] <= done and \
+                    _safe_at(candidate, len(placed), placed, orig_position[candidate[0]]):
+                placed.append(candidate)
+                done.add(candidate[0])
+                remaining.remove(candidate)
+                break
+        else:
+            placed.append(nop)
+
+    # Pad before the terminator (or at the end) until the neighbours see the same values
+    for _ in range(SAFE_DISTANCE):
+        if len(placed) > len(seq):
+            return None
+        if _boundaries_kept(placed, seq):
+            break
+        if terminator is not None:
+            placed.insert(len(placed) - 1, nop)
+            if not _safe_at(terminator, len(placed) - 1, placed[:-1], orig_position[terminator[0]]):
+                return None
+        else:
+            placed.append(nop)
+    else:
+        return None
+    if len(placed) > len(seq) or _block_hazards([(op, word) for _, op, word in placed]):
+        return None
+    return [entry[0] for entry in placed]
+
+
+def _split_units(lines, source_path=None, include_dirs=()):
+    """Splits source lines into instruction units and barriers.
+
+    Returns (items, trailer): items is a list of ('unit', _Unit) or
+    ('barrier', [lines]); trailer holds the lines after the last item.
+    Instructions sharing a line with a label, and multi-word pseudo-instructions,
+    are kept as barriers, and so are macro calls and everything else the
+    preprocessor expands.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        program = assembler.assemble_program(lines, source_path=source_path, include_dirs=include_dirs)
+    items = []
+    pending = []
+    for line_num, raw in enumerate(lines, 1):
+        line = assembler.clean_line(raw)
+        pending.append(raw)
+        if not line:
+            continue
+        address = program.line_addresses.get(line_num)
+        # Pseudo-instructions expanding to several words are not split up
+        if address is None or program.line_sizes[line_num] != 1 or \
+                assembler.LABEL_RE.match(line) or assembler.is_known_directive(line):
+            items.append(('barrier', pending))
+        else:
+            word = int(program.text[address // 4], 16)
+            items.append(('unit', _Unit(pending, iss.decode(word), word)))
+        pending = []
+    return items, pending
+
+
+def schedule_lines(lines, source_path=None, include_dirs=()):
+    """Applies the pass to a list of source lines (.include paths as in assembler.assemble_program).
+
+    Returns (new_lines, ScheduleReport).
+    """
+    items, trailer = _split_units(lines, source_path, include_dirs)
+
+    # Group consecutive instruction units into basic blocks
+    blocks = []
+    current = []
+    for kind, item in items:
+        if kind == 'barrier':
+            if current:
+                blocks.append(('block', current))
+                current = []
+            blocks.append(('barrier', item))
+            continue
+        current.append(item)
+        if item.op.name in iss.CONTROL_OPS or item.op.name is None:
+            blocks.append(('block', current))
+            current = []
+    if current:
+        blocks.append(('block', current))
+
+    out = []
+    changed = skipped = nops_removed = block_count = 0
+    for kind, block in blocks:
+        if kind == 'barrier':
+            out.extend(block)
+            continue
+        block_count += 1
+        seq = [(ident, unit.op, unit.word) for ident, unit in enumerate(block)]
+        order = schedule_block(seq)
+        if order is None:
+            skipped += 1
+            for unit in block:
+                out.extend(unit.lines)
+            continue
+        if order != [entry[0] if entry[2] != NOP_WORD else None for entry in seq]:
+            changed += 1
+        # NOP slots reuse the original NOP lines (and their comments) first
+        spare_nops = [unit for unit in block if unit.word == NOP_WORD]
+        nops_removed += len(spare_nops) - order.count(None)
+        for ident in order:
+            if ident is None:
+                out.extend(spare_nops.pop(0).lines if spare_nops else [NOP_LINE])
+            else:
+                out.extend(block[ident].lines)
+    out.extend(trailer)
+    return out, ScheduleReport(block_count, changed, skipped, nops_removed)
+
+
+def _measure(lines, max_instructions, source_path=None, mul_latency=0, div_latency=0):
+    """Assembles lines in memory and returns (words, timing result)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        words = assembler.assemble_program(lines, source_path=source_path).text
+    program = [int(word, 16) for word in words]
+    return program, timing_model.simulate(program, mul_latency=mul_latency, div_latency=div_latency,
+                                          max_instructions=max_instructions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hazard-aware NOP removal and scheduling pass")
+    parser.add_argument("sources", nargs='+', help="Assembly files (.asm)")
+    parser.add_argument("-o", "--output_file", help="Write the scheduled source (single input only)")
+    parser.add_argument("--max", type=int, default=1_000_000,
+                        help="Instruction limit when estimating cycles (default: 1M)")
+    args = parser.parse_args()
+    if args.output_file and len(args.sources) != 1:
+        parser.error("-o/--output_file takes a single source")
+
+    print(f"{'program':<32}{'words':>12}{'NOPs removed':>14}{'cycles':>18}{'saved':>8}")
+    for path in args.sources:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        new_lines, report = schedule_lines(lines, path)
+        before, timing_before = _measure(lines, args.max, path)
+        after, timing_after = _measure(new_lines, args.max, path)
+        row = f"{path.rsplit('/', 1)[-1]:<32}{f'{len(before)}->{len(after)}':>12}{report.nops_removed:>14}"
+        if timing_before.halted and timing_after.halted:
+            cycles = f"{timing_before.cycles}->{timing_after.cycles}"
+            row += f"{cycles:>18}{timing_before.cycles - timing_after.cycles:>8}"
+        else:
+            row += f"{'does not halt':>18}{'n/a':>8}"
+        print(row)
+        if report.skipped:
+            print(f"  {report.skipped} of {report.blocks} block(s) left unchanged "
+                  f"(existing uncovered hazard or no safe schedule)")
+        if timing_before.hazards:
+            print(f"  warning: the original program has {len(timing_before.hazards)} dynamic data "
+                  f"hazard(s); its hardware results may differ from the ISS")
+
+    if args.output_file:
+        with open(args.output_file, 'w', encoding='utf-8') as f:
+            f.writelines(new_lines)
+        print(f"Scheduled source written to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
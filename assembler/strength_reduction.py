@@ -0,0 +1,494 @@
+# RISC-V 32IM Assembler - constant multiply/divide strength reduction pass
+# File: assembler/strength_reduction.py
+#
+# A small constant propagation (x0, li/lui/addi chains and ALU ops on known
+# values, within basic blocks and along the control-flow graph) finds MUL/DIV/DIVU/REM/REMU instructions with a
+# constant operand and rewrites them into ALU sequences:
+#   mul  rd, rs, c        shifts and adds/subs over the binary or
+#                         non-adjacent form of c (whichever is shorter)
+#   divu rd, rs, 2^k      srli rd, rs, k
+#   remu rd, rs, 2^k      andi rd, rs, 2^k-1 (or slli+srli for k > 11)
+#   div  rd, rs, +-2^k    bias = (rs >> 31) >>> (32-k); (rs + bias) >> k (negated for -2^k)
+#   rem  rd, rs, +-2^k    rs - ((rs + bias) & -2^k)
+# and instructions whose operands are both known into `li rd, value`.
+#
+# A rewrite is kept only if its estimated cost is lower: the sequence
+# length against 1 + the mul/div latency. multiplier.v and divider.v are
+# currently combinational (see timing_model.py), so the default latencies
+# are 0 and nothing is rewritten unless --mul-latency/--div-latency model
+# iterative units. Sequences that
+# read rs after writing rd need rd != rs. A rewrite is also dropped unless
+# the block keeps exactly the same uncovered dependencies (existing hazards
+# stay as they are, none are added) and the same timing towards its
+# neighbours (scheduler._boundaries_kept). Code addresses move, so programs
+# computing jump targets by hand must not use it.
+#
+# Usage (from the project root):
+#   python assembler/strength_reduction.py tests/asm_sources/*.asm        # report only
+#   python assembler/strength_reduction.py tests/asm_sources/mul_integrated_test.asm -o /tmp/mul_sr.asm
+#   python assembler/strength_reduction.py prog.asm --mul-latency 4 --div-latency 32
+#   python assembler/assembler.py prog.asm --strength-reduce --mul-latency 4 --div-latency 32
+
+import argparse
+import contextlib
+import io
+from collections import namedtuple
+
+import assembler
+import iss
+import scheduler
+import timing_model
+
+DEFAULT_MUL_LATENCY = 0  # Extra EX cycles per MUL; multiplier.v is combinational
+DEFAULT_DIV_LATENCY = 0  # Extra EX cycles per DIV/DIVU/REM/REMU; divider.v is combinational
+
+MASK32 = 0xFFFFFFFF
+
+# ALU results on known values, from the ISS's own expressions
+_ALU = {name: eval("lambda a, b: " + expr.format(a="a", b="b"), dict(iss._NAMESPACE))
+        for name, expr in iss._R_EXPR.items()}
+
+# One source line with the words it assembled to (none for comments, labels
+# and directives) and their decoded ops
+_Line = namedtuple('_Line', 'num raw text label address words ops')
+
+# line: source line number; constant: known operand value (None when both are known)
+Rewrite = namedtuple('Rewrite', 'line original constant replacement saved')
+StrengthReport = namedtuple('StrengthReport', 'blocks rewrites skipped')
+
+
+def known_value(op, known):
+    """Value written by `op` if its inputs are all in `known` (reg -> value), else None."""
+    name = op.name
+    if name in iss._R_EXPR:
+        if op.rs1 in known and op.rs2 in known:
+            return _ALU[name](known[op.rs1], known[op.rs2])
+    elif name in iss._I_EXPR:
+        if op.rs1 in known:
+            return _ALU[iss._I_EXPR[name]](known[op.rs1], op.imm & MASK32)
+    elif name == 'lui':
+        return op.imm & MASK32
+    return None
+
+
+def propagate(op, known):
+    """Updates the known register values after `op`."""
+    if op.rd and timing_model.write_kind(op):
+        value = known_value(op, known)
+        if value is None:
+            known.pop(op.rd, None)
+        else:
+            known[op.rd] = value
+
+
+def _digits(value):
+    """Shortest signed-digit form of a 32-bit value: [(bit, +1/-1)], highest bit first."""
+    binary = [(bit, 1) for bit in range(31, -1, -1) if value >> bit & 1]
+    naf = []
+    remaining = value
+    bit = 0
+    while remaining:
+        if remaining & 1:
+            digit = 2 - (remaining & 3)
+            remaining -= digit
+            if bit < 32:  # 2^32 wraps to 0
+                naf.append((bit, digit))
+        remaining >>= 1
+        bit += 1
+    naf.reverse()
+    return min(binary, naf, key=len)
+
+
+def mul_sequence(rd, rs, value):
+    """Lines computing rd = rs * value (mod 2^32), or None if rd == rs prevents it."""
+    if value == 0:
+        return [f"addi {rd}, x0, 0"]
+    digits = _digits(value)
+    if len(digits) > 1 and rd == rs:
+        return None
+    bit, sign = digits[0]
+    lines = []
+    base = rs
+    if sign < 0:
+        lines.append(f"sub {rd}, x0, {rs}")
+        base = rd
+    for next_bit, next_sign in digits[1:]:
+        lines.append(f"slli {rd}, {base}, {bit - next_bit}")
+        lines.append(f"{'add' if next_sign > 0 else 'sub'} {rd}, {rd}, {rs}")
+        base = rd
+        bit = next_bit
+    if bit:
+        lines.append(f"slli {rd}, {base}, {bit}")
+    elif base == rs:
+        lines.append(f"addi {rd}, {rs}, 0")
+    return lines
+
+
+def _power_of_two(value):
+    """k if value == 2^k, else None."""
+    return value.bit_length() - 1 if value and value & (value - 1) == 0 else None
+
+
+def _bias(rd, rs, k):
+    """Lines leaving 2^k - 1 in rd if rs is negative, else 0 (1 <= k <= 31)."""
+    if k == 1:
+        return [f"srli {rd}, {rs}, 31"]
+    return [f"srai {rd}, {rs}, 31", f"srli {rd}, {rd}, {32 - k}"]
+
+
+def div_sequence(name, rd, rs, value):
+    """Lines computing a division/remainder by a power of two, or None."""
+    if name in ('divu', 'remu'):
+        k = _power_of_two(value)
+        if k is None:
+            return None
+        if name == 'divu':
+            return [f"srli {rd}, {rs}, {k}" if k else f"addi {rd}, {rs}, 0"]
+        if k == 0:
+            return [f"addi {rd}, x0, 0"]
+        if k <= 11:
+            return [f"andi {rd}, {rs}, {(1 << k) - 1}"]
+        return [f"slli {rd}, {rs}, {32 - k}", f"srli {rd}, {rd}, {32 - k}"]
+
+    divisor = iss._signed(value)
+    k = _power_of_two(abs(divisor))
+    if k is None:
+        return None
+    if k == 0:  # +-1: the quotient is +-rs (-2^31 / -1 wraps like DIV), the remainder 0
+        if name == 'rem':
+            return [f"addi {rd}, x0, 0"]
+        return [f"addi {rd}, {rs}, 0" if divisor > 0 else f"sub {rd}, x0, {rs}"]
+    if rd == rs:
+        return None
+    lines = _bias(rd, rs, k) + [f"add {rd}, {rd}, {rs}"]
+    if name == 'div':
+        lines.append(f"srai {rd}, {rd}, {k}")
+        if divisor < 0:
+            lines.append(f"sub {rd}, x0, {rd}")
+        return lines
+    # The remainder takes the dividend's sign, whatever the divisor's
+    if k <= 11:
+        lines.append(f"andi {rd}, {rd}, {-(1 << k)}")
+    else:
+        lines += [f"srai {rd}, {rd}, {k}", f"slli {rd}, {rd}, {k}"]
+    lines.append(f"sub {rd}, {rs}, {rd}")
+    return lines
+
+
+def replacement(op, known):
+    """(lines, constant operand, reason) for a MUL/DIV op with a known operand, or None.
+
+    The constant is None when both operands are known (folded into li);
+    lines is empty and reason says why when no sequence applies.
+    """
+    if not op.rd:
+        return None
+    rd = f"x{op.rd}"
+    if op.rs1 in known and op.rs2 in known:
+        value = _ALU[op.name](known[op.rs1], known[op.rs2])
+        return [f"li {rd}, {iss._signed(value)}"], None, None
+    if op.name in timing_model.MUL_OPS:
+        if op.rs2 in known:
+            rs, constant = op.rs1, known[op.rs2]
+        elif op.rs1 in known:
+            rs, constant = op.rs2, known[op.rs1]
+        else:
+            return None
+        lines = mul_sequence(rd, f"x{rs}", constant)
+    elif op.rs2 in known:
+        constant = known[op.rs2]
+        divisor = constant if op.name in ('divu', 'remu') else abs(iss._signed(constant))
+        if _power_of_two(divisor) is None:
+            return [], constant, "divisor is not a power of two"
+        lines = div_sequence(op.name, rd, f"x{op.rs1}", constant)
+    else:
+        return None
+    if lines is None:
+        return [], constant, "needs a scratch register (destination equals the source)"
+    return lines, constant, None
+
+
+def _encode(lines):
+    """Decoded ops and words of replacement lines."""
+    words = []
+    for line in lines:
+        words += [int(word, 16) for word in assembler.assemble_line_words(line, {}, 0)]
+    return [(iss.decode(word), word) for word in words]
+
+
+def _read_lines(lines, source_path=None, include_dirs=()):
+    """Splits source lines into _Line records with the words each one assembled to."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        program = assembler.assemble_program(lines, source_path=source_path, include_dirs=include_dirs)
+    records = []
+    for line_num, raw in enumerate(lines, 1):
+        text = assembler.clean_line(raw)
+        label = assembler.LABEL_RE.match(text) if text else None
+        address = program.line_addresses.get(line_num)
+        words = []
+        if address is not None:
+            start = address // 4
+            words = [int(word, 16) for word in program.text[start:start + program.line_sizes[line_num]]]
+        records.append(_Line(line_num, raw, text, label.group(1) if label else None,
+                             address, words, [iss.decode(word) for word in words]))
+    return records
+
+
+def _splits_block(line):
+    """True if the line cannot be part of a straight-line block (directives, macro expansions)."""
+    if not line.text:
+        return False
+    rest = assembler.LABEL_RE.sub(r'\2', line.text).strip()
+    if not rest:
+        return False
+    if not line.words:
+        return True  # Directive or data
+    mnemonic = rest.split(None, 1)[0].lower()
+    return len(line.words) > 1 and mnemonic not in ('li', 'la')
+
+
+def _blocks(records):
+    """Groups line indices into basic blocks: ('block', [index, ...]) or ('barrier', index)."""
+    blocks = []
+    current = []
+    for index, line in enumerate(records):
+        if line.label is not None and current:
+            blocks.append(('block', current))
+            current = []
+        if _splits_block(line):
+            if current:
+                blocks.append(('block', current))
+                current = []
+            blocks.append(('barrier', index))
+            continue
+        current.append(index)
+        if any(op.name in iss.CONTROL_OPS or op.name is None for op in line.ops):
+            blocks.append(('block', current))
+            current = []
+    if current:
+        blocks.append(('block', current))
+    return blocks
+
+
+def _meet(a, b):
+    """Registers known with the same value on both paths."""
+    return {reg: value for reg, value in a.items() if b.get(reg) == value}
+
+
+def entry_constants(records, blocks):
+    """Known registers at the entry of each block, keyed by its position in `blocks`.
+
+    A forward dataflow over the control-flow graph: the entry state of a
+    block is the meet of its predecessors' exit states. Blocks control may
+    reach in ways the graph does not show (after a call, and every labelled
+    block when the program uses JALR) start with only x0 known. If the graph
+    cannot be built (instruction words outside blocks, branch targets inside
+    a block) every block starts with only x0 known.
+    """
+    unknown = {0: 0}
+    positions = [n for n, (kind, indices) in enumerate(blocks)
+                 if kind == 'block' and any(records[index].words for index in indices)]
+    if any(kind == 'barrier' and records[index].words for kind, index in blocks):
+        return {n: unknown for n in positions}
+    starts = {}
+    for n in positions:
+        first = next(records[index] for index in blocks[n][1] if records[index].words)
+        starts[first.address] = n
+
+    uses_jalr = any(op.name == 'jalr' for line in records for op in line.ops)
+    successors = {}
+    entry = {n: None for n in positions}
+    if positions:
+        entry[positions[0]] = unknown
+    for order, n in enumerate(positions):
+        indices = blocks[n][1]
+        if uses_jalr and records[indices[0]].label is not None:
+            entry[n] = unknown
+        last = next(records[index] for index in reversed(indices) if records[index].words)
+        op = last.ops[-1]
+        pc = last.address + 4 * (len(last.words) - 1)
+        following = positions[order + 1] if order + 1 < len(positions) else None
+        targets = []
+        if op.name in iss.BRANCH_OPS or op.name == 'jal':
+            target = (pc + op.imm) & MASK32
+            if target not in starts:
+                return {n: unknown for n in positions}
+            targets.append(starts[target])
+        if op.name == 'jal' and op.rd and following is not None:
+            entry[following] = unknown  # Return point of a call
+        elif op.name not in iss.JUMP_OPS and following is not None:
+            targets.append(following)
+        successors[n] = targets
+
+    pinned = {n for n in positions if entry[n] is unknown}
+    changed = True
+    while changed:
+        changed = False
+        for n in positions:
+            if entry[n] is None:
+                continue
+            known = dict(entry[n])
+            for index in blocks[n][1]:
+                for op in records[index].ops:
+                    propagate(op, known)
+            for successor in successors[n]:
+                if successor in pinned:
+                    continue
+                merged = known if entry[successor] is None else _meet(entry[successor], known)
+                if merged != entry[successor]:
+                    entry[successor] = merged
+                    changed = True
+    return {n: entry[n] or unknown for n in positions}
+
+
+def _sequence(records, indices, replaced):
+    """(id, op, word) entries of a block, with replaced[index] = [(op, word)] substituted."""
+    seq = []
+    for index in indices:
+        pairs = replaced.get(index) or list(zip(records[index].ops, records[index].words))
+        seq += [((index, position), op, word) for position, (op, word) in enumerate(pairs)]
+    return seq
+
+
+def _hazard_sites(seq):
+    """Uncovered dependencies in a block: {(consumer id, reg, producer id, distance)}."""
+    sites = set()
+    last_writer = {}
+    for j, (ident, op, word) in enumerate(seq):
+        for reg in scheduler._reads(op):
+            if reg in last_writer:
+                i, kind, producer = last_writer[reg]
+                if not timing_model.forwarding_covers(kind, j - i):
+                    sites.add((ident, reg, producer, j - i))
+        raw = scheduler._lui_field(op, word)
+        if raw in last_writer and j - last_writer[raw][0] in (1, 2):
+            sites.add((ident, raw, last_writer[raw][2], j - last_writer[raw][0]))
+        kind = timing_model.write_kind(op)
+        if kind:
+            last_writer[op.rd] = (j, kind, ident)
+    return sites
+
+
+def reduce_lines(lines, mul_latency=DEFAULT_MUL_LATENCY, div_latency=DEFAULT_DIV_LATENCY,
+                 source_path=None, include_dirs=()):
+    """Applies the pass to a list of source lines (.include paths as in assembler.assemble_program).
+
+    Returns (new_lines, StrengthReport); skipped lists (line, original, reason)
+    for M-extension instructions with a known operand that were left alone.
+    """
+    records = _read_lines(lines, source_path, include_dirs)
+    rewrites = []
+    skipped = []
+    texts = {}  # Line index -> replacement lines
+    blocks = _blocks(records)
+    entries = entry_constants(records, blocks)
+    block_count = 0
+    for n, (kind, indices) in enumerate(blocks):
+        if kind == 'barrier':
+            continue
+        block_count += 1
+        original = _sequence(records, indices, {})
+        original_sites = _hazard_sites(original)
+        replaced = {}
+        known = dict(entries.get(n, {0: 0}))
+        for index in indices:
+            line = records[index]
+            op = line.ops[0] if len(line.ops) == 1 else None
+            if op is not None and (op.name in timing_model.MUL_OPS or op.name in timing_model.DIV_OPS):
+                found = replacement(op, known)
+                if found is not None:
+                    new_lines, constant, reason = found
+                    instruction = assembler.LABEL_RE.sub(r'\2', line.text).strip()
+                    latency = mul_latency if op.name in timing_model.MUL_OPS else div_latency
+                    pairs = _encode(new_lines)
+                    saved = 1 + latency - len(pairs)
+                    if reason is None and saved <= 0:
+                        reason = f"no cycles saved ({len(pairs)} instruction(s) vs 1 + latency {latency})"
+                    elif reason is None:
+                        candidate = dict(replaced)
+                        candidate[index] = pairs
+                        new_seq = _sequence(records, indices, candidate)
+                        if _hazard_sites(new_seq) != original_sites or \
+                                not scheduler._boundaries_kept(new_seq, original):
+                            reason = "would change which values the pipeline forwards"
+                        else:
+                            replaced = candidate
+                            texts[index] = new_lines
+                            rewrites.append(Rewrite(line.num, instruction, constant, new_lines, saved))
+                    if reason:
+                        skipped.append((line.num, instruction, reason))
+            for op in line.ops:
+                propagate(op, known)
+
+    out = []
+    for index, line in enumerate(records):
+        if index not in texts:
+            out.append(line.raw)
+            continue
+        indent = line.raw[:len(line.raw) - len(line.raw.lstrip())]
+        if line.label is not None:
+            out.append(f"{line.label}:\n")
+        instruction = assembler.LABEL_RE.sub(r'\2', line.text).strip()
+        for position, text in enumerate(texts[index]):
+            comment = f"  # strength-reduced: {instruction}" if position == 0 else ''
+            out.append(f"{indent or '    '}{text}{comment}\n")
+    return out, StrengthReport(block_count, rewrites, skipped)
+
+
+def _final_state(lines, max_instructions, source_path=None):
+    """Registers and data memory after running the program in the ISS, or None if it does not halt."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        program = assembler.assemble_program(lines, source_path=source_path)
+    sim = iss.Simulator([int(word, 16) for word in program.text],
+                        data=[0] * (program.data_base // 4) + list(program.data))
+    return (sim.regs, sim.data_mem) if sim.run(max_instructions) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constant multiply/divide strength reduction pass")
+    parser.add_argument("sources", nargs='+', help="Assembly files (.asm)")
+    parser.add_argument("-o", "--output_file", help="Write the rewritten source (single input only)")
+    parser.add_argument("--mul-latency", type=int, default=DEFAULT_MUL_LATENCY,
+                        help=f"Extra EX cycles per MUL in the cost model (default: {DEFAULT_MUL_LATENCY})")
+    parser.add_argument("--div-latency", type=int, default=DEFAULT_DIV_LATENCY,
+                        help=f"Extra EX cycles per DIV/DIVU/REM/REMU (default: {DEFAULT_DIV_LATENCY})")
+    parser.add_argument("--max", type=int, default=1_000_000,
+                        help="Instruction limit when estimating cycles (default: 1M)")
+    args = parser.parse_args()
+    if args.output_file and len(args.sources) != 1:
+        parser.error("-o/--output_file takes a single source")
+
+    print(f"{'program':<32}{'rewrites':>10}{'words':>12}{'cycles':>18}{'saved':>8}")
+    for path in args.sources:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        new_lines, report = reduce_lines(lines, args.mul_latency, args.div_latency, path)
+        before, timing_before = scheduler._measure(lines, args.max, path, args.mul_latency, args.div_latency)
+        after, timing_after = scheduler._measure(new_lines, args.max, path, args.mul_latency, args.div_latency)
+        row = f"{path.rsplit('/', 1)[-1]:<32}{len(report.rewrites):>10}{f'{len(before)}->{len(after)}':>12}"
+        if timing_before.halted and timing_after.halted:
+            cycles = f"{timing_before.cycles}->{timing_after.cycles}"
+            row += f"{cycles:>18}{timing_before.cycles - timing_after.cycles:>8}"
+        else:
+            row += f"{'does not halt':>18}{'n/a':>8}"
+        print(row)
+        for rewrite in report.rewrites:
+            operand = "" if rewrite.constant is None else f" (operand {iss._signed(rewrite.constant)})"
+            print(f"  line {rewrite.line}: {rewrite.original}{operand} -> {'; '.join(rewrite.replacement)}"
+                  f"  [~{rewrite.saved} cycle(s) saved per execution]")
+        for line_num, original, reason in report.skipped:
+            print(f"  line {line_num}: {original} kept: {reason}")
+        if report.rewrites:
+            state_before = _final_state(lines, args.max, path)
+            state_after = _final_state(new_lines, args.max, path)
+            if state_before is not None and state_before != state_after:
+                print("  warning: the rewritten program ends with different registers or data memory in the ISS")
+
+    if args.output_file:
+        with open(args.output_file, 'w', encoding='utf-8') as f:
+            f.writelines(new_lines)
+        print(f"Rewritten source written to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# Tests for assembler.py - run with `python -m pytest assembler`
+
+import glob
+import hashlib
+import os
+
+import pytest
+
+import assembler
+import image
+import iss
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = sorted(glob.glob(os.path.join(ROOT, 'tests', 'asm_sources', '*.asm')))
+
+# SHA-256 of the .hex each test program assembled to before the opcode table,
+# pseudo-instructions, relaxation and .data support were added
+GOLDEN_HEX = {
+    'add_sub_integrated_test': '04bba7a9859be90ee269a04374c5204ea1a1412b697d5f6d153bb671d16e8a21',
+    'branch_integrated_test': '72f12c4c04baf9dfb45de4c207e74d4662ab2ddb2c8940951f0f4e15df03dcce',
+    'bubble_sort_test': 'fb5a40de850ab72f975a5ba0b69cf484d887fc0c9d8a22c06548cd3c0e824b09',
+    'convolution_test': '078d033a5aae3ca55e321d1aa42187c62a2f7163502266af3a561ff9984c3dfc',
+    'div_integrated_test': '882e3c32e253a77eb18f6bf72187e254eaca8af825838b84991e8fa43364bcbd',
+    'factorial_test': '66cbe2732f4c4eecbdf8d5e74d87a70a515f1b6b8706a120871ae48a9519b370',
+    'fft_test': '0803767530d5057d62cd925d60eb6cc0c380a12d7b206e9f924b1828f5a10ad7',
+    'fibonacci_test': '42060f2bde7c1f098f374da48eea1e6fae4f9ae82bdd91529d3cd6cd1d33c830',
+    'gcd_test': '3acb974ca0969e9c7266cb2c18ef8a8995732f85652bbe1b004710dc3387525d',
+    'hash_test': 'f012dcd7f8e9ae6ffae9d45c99e56e9e5154add71f1d3a92f6d38337d3c26391',
+    'logic_integrated_test': '9515acc4f8016ea0c0cbb08016833447a57fe25a7256d3b6416c1d33e72c3cf5',
+    'mul_integrated_test': '36725c0674b080c635b4e601b3b1f6537dcbbdd89b93f7e84e2db16f9c3886d7',
+    'prime_sieve_test': '04136c7413731ed5b9a0058d5a565341f5b872d185e223d662bdfc6f1f88c46c',
+    'shift_compare_test': 'f8533ddf2393f94732e64d3eee845991cccbd99802ed6b1ecfa2bf201713e79a',
+}
+
+
+def _program(source, data_base=0):
+    return assembler.assemble_program(source.splitlines(True), data_base)
+
+
+def _ops(words):
+    return [iss.decode(word) for word in words]
+
+
+def test_every_test_program_has_a_golden_image():
+    assert sorted(GOLDEN_HEX) == [os.path.splitext(os.path.basename(path))[0] for path in SOURCES]
+
+
+@pytest.mark.parametrize('path', SOURCES, ids=os.path.basename)
+def test_output_is_byte_identical(tmp_path, path):
+    output = tmp_path / 'out.hex'
+    assembler.assemble_file(path, str(output))
+    name = os.path.splitext(os.path.basename(path))[0]
+    assert hashlib.sha256(output.read_bytes()).hexdigest() == GOLDEN_HEX[name]
+
+
+@pytest.mark.parametrize('path', SOURCES, ids=os.path.basename)
+def test_streaming_matches_in_memory_assembly(tmp_path, path):
+    assembler.assemble_file(path, str(tmp_path / 'a.hex'))
+    assembler.assemble_file_streaming(path, str(tmp_path / 'b.hex'))
+    assert (tmp_path / 'a.hex').read_bytes() == (tmp_path / 'b.hex').read_bytes()
+
+
+# --- Pseudo-instructions
+
+@pytest.mark.parametrize('line, size', [
+    ("li x1, 5", 1),
+    ("li x1, -2048", 1),
+    ("li x1, 2048", 2),
+    ("li x1, 0x12345000", 1),
+    ("li x1, 0x12345678", 2),
+    ("li x1, 0xFFFFFFFF", 1),
+    ("la x1, near", 1),
+    ("call near", 1),
+    ("tail near", 1),
+    ("mv x1, x2", 1),
+    ("ble x1, x2, near", 1),
+    ("ret", 1),
+])
+def test_pseudo_instruction_size(line, size):
+    program = _program(f"{line}\nnear: nop\n")
+    assert program.line_sizes[1] == size
+    assert program.labels['near'] == 4 * size
+
+
+def test_li_loads_the_value():
+    values = [0, 1, -1, 2047, -2048, 2048, 0x800, 0x7FFFFFFF, -0x80000000, 0x12345FFF, 0xFFFFF800]
+    program = _program("".join(f"li x{n + 1}, {value}\n" for n, value in enumerate(values)))
+    sim = iss.Simulator([int(word, 16) for word in program.text])
+    sim.run(100)
+    assert sim.regs[1:len(values) + 1] == [value & 0xFFFFFFFF for value in values]
+
+
+def test_far_call_uses_auipc_jalr():
+    program = _program("call far\ntail far\nhalt: j halt\n.space 0x100000\nfar: ret\n")
+    assert program.line_sizes[1] == program.line_sizes[2] == 2
+    ops = _ops(int(word, 16) for word in program.text[:4])
+    assert [op.name for op in ops] == ['auipc', 'jalr', 'auipc', 'jalr']
+    assert (ops[0].rd, ops[1].rd, ops[2].rd, ops[3].rd) == (1, 1, 6, 0)
+    assert (ops[0].imm + ops[1].imm) == program.labels['far']
+    assert 8 + ops[2].imm + ops[3].imm == program.labels['far']
+
+
+def test_constant_out_of_range():
+    result = assembler.assemble("li x1, 0x100000000\n")
+    assert not result.ok
+
+
+# --- Branch relaxation
+
+def test_in_range_branch_is_not_relaxed():
+    program = _program("beq x1, x2, far\n.space 4088\nfar: nop\n")
+    assert program.relaxed == 0
+    assert _ops([int(program.text[0], 16)])[0] == iss.DecodedOp('beq', 0, 1, 2, 4092)
+
+
+def test_out_of_range_branches_are_relaxed():
+    result = assembler.assemble("beq x0, x0, far\nback: addi x1, x0, 1\nhalt: j halt\n"
+                                ".space 4096\nfar: bne x1, x0, back\nbeq x0, x0, back\n")
+    assert result.ok and result.relaxed == 3
+    ops = _ops(result.words)
+    far = result.symbols['far']
+    assert ops[0] == iss.DecodedOp('bne', 0, 0, 0, 8)
+    assert ops[1] == iss.DecodedOp('jal', 0, 0, 0, far - 4)
+    assert [op.name for op in ops[-4:]] == ['beq', 'jal', 'bne', 'jal']
+    assert far + 4 + ops[-3].imm == result.symbols['back']
+    sim = iss.Simulator(list(result.words), mem_size_words=2048)
+    assert sim.run(100) and sim.regs[1] == 1
+
+
+def test_relaxation_moves_the_labels_after_it():
+    program = _program("bnez x1, far\nmid: nop\n.space 4092\nfar: nop\n")
+    assert program.relaxed == 1
+    assert program.labels['mid'] == 8
+    assert program.labels['far'] == 8 + 4 + 4092
+
+
+# --- .data layout
+
+DATA_SOURCE = """\
+.data
+a: .byte 1, 2, 3
+b: .half 0x1234
+c: .word 0xdeadbeef, b
+s: .string "hi"
+.align 3
+d: .word 7
+e: .space 3
+f: .word c
+.text
+la x5, d
+lw x6, 0(x5)
+lw x7, 8(x5)
+halt: j halt
+"""
+
+
+def test_data_layout():
+    result = assembler.assemble(DATA_SOURCE, data_base=0x100)
+    assert result.ok
+    assert {name: result.symbols[name] for name in 'abcdefs'} == {
+        'a': 0x100, 'b': 0x104, 'c': 0x108, 's': 0x110, 'd': 0x118, 'e': 0x11C, 'f': 0x120}
+    assert list(result.data) == [0x030201, 0x1234, 0xDEADBEEF, 0x104, 0x6968, 0, 7, 0, 0x108]
+
+
+def test_data_is_preloaded_at_the_data_base():
+    result = assembler.assemble(DATA_SOURCE, data_base=0x100)
+    sim = iss.Simulator(list(result.words), data=[0] * (0x100 // 4) + list(result.data))
+    sim.run(100)
+    assert (sim.regs[5], sim.regs[6], sim.regs[7]) == (0x118, 7, 0x108)
+
+
+def test_instruction_in_data_section():
+    result = assembler.assemble(".data\naddi x1, x0, 1\n")
+    assert [(d.line, d.code) for d in result.diagnostics] == [(2, 'fatal')]
+
+
+@pytest.mark.parametrize('fmt', image.FORMATS)
+def test_data_image_round_trip(tmp_path, fmt):
+    source = tmp_path / 'prog.asm'
+    source.write_text(DATA_SOURCE)
+    output = str(tmp_path / f"prog{image.FORMAT_EXTENSIONS[fmt]}")
+    assembler.assemble_file(str(source), output, fmt=fmt, data_base=0x400)
+    sim = iss.Simulator(iss.load_program(output), data=iss.find_data(output))
+    sim.run(100)
+    assert (sim.regs[5], sim.regs[6]) == (0x418, 7)
+
+
+def test_stale_data_image_is_removed(tmp_path):
+    source = tmp_path / 'prog.asm'
+    output = str(tmp_path / 'prog.hex')
+    source.write_text(DATA_SOURCE)
+    assembler.assemble_file(str(source), output)
+    assert os.path.exists(assembler.data_image_path(output))
+    source.write_text("nop\n")
+    assembler.assemble_file(str(source), output)
+    assert not os.path.exists(assembler.data_image_path(output))
+
+
+# --- Diagnostics
+
+def test_errors_carry_their_line():
+    result = assembler.assemble("nop\nfoo x1\n")
+    assert [(d.line, d.code) for d in result.diagnostics if d.severity == 'error'] == [(2, 'placeholder')]
+    result = assembler.assemble("nop\nlabel:\nlabel:\n")
+    assert [(d.line, d.code) for d in result.diagnostics] == [(3, 'fatal')]
+
+
+@pytest.mark.parametrize('line', [".space 0x10000000", ".align 40", ".space -4"])
+def test_section_size_limits(line):
+    result = assembler.assemble(f"nop\n{line}\n")
+    assert [(d.line, d.code) for d in result.diagnostics] == [(2, 'fatal')]
+
+
+def test_strict_assemble_file_writes_nothing(tmp_path):
+    source = tmp_path / 'prog.asm'
+    output = tmp_path / 'prog.hex'
+    source.write_text("nop\nfoo x1\n")
+    assembler.assemble_file(str(source), str(output))
+    assert output.exists()
+    output.unlink()
+    with pytest.raises(ValueError, match='line 2'):
+        assembler.assemble_file(str(source), str(output), strict=True)
+    assert not output.exists()
+
+
+def test_threads_keep_their_diagnostics_apart():
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run(n):
+        source = "".join(f"addi x1, x0, {n}\nfoo x{n % 31 + 1}\n" for _ in range(200))
+        result = assembler.assemble(source)
+        return n, [(d.line, d.message) for d in result.diagnostics if d.severity == 'error']
+
+    with ThreadPoolExecutor(8) as pool:
+        for n, errors in pool.map(run, range(32)):
+            assert [line for line, _ in errors] == list(range(2, 401, 2))
+            assert all(f"foo x{n % 31 + 1}'" in message for _, message in errors)
@@ -0,0 +1,84 @@
+# Tests for batch.py - run with `python -m pytest assembler`
+
+import os
+
+import pytest
+
+import batch
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / 'src' / 'a').mkdir(parents=True)
+    (tmp_path / 'src' / 'b').mkdir()
+    (tmp_path / 'src' / 'a' / 'p.asm').write_text("addi x1, x0, 1\n")
+    (tmp_path / 'src' / 'b' / 'p.asm').write_text("addi x1, x0, 2\n")
+    (tmp_path / 'src' / 'a' / 'data.asm').write_text(".data\nv: .word 5\n.text\nlw x1, v(x0)\n")
+    return tmp_path
+
+
+def _run(tree, sources, **kwargs):
+    report = batch.batch_assemble(sources, str(tree / 'out'), str(tree / 'cache'), jobs=2, **kwargs)
+    return {os.path.relpath(source, tree / 'src'): (status, error) for source, status, _, error in report}
+
+
+def test_expand_inputs_keeps_subdirectories(tree):
+    pattern = os.path.join(str(tree / 'src'), '**', '*.asm')
+    assert [name for _, name in batch.expand_inputs([pattern])] == [
+        os.path.join('a', 'data.hex'), os.path.join('a', 'p.hex'), os.path.join('b', 'p.hex')]
+    assert batch.expand_inputs([str(tree / 'src' / 'a')]) == [
+        (str(tree / 'src' / 'a' / 'data.asm'), 'data.hex'), (str(tree / 'src' / 'a' / 'p.asm'), 'p.hex')]
+
+
+def test_cache_hits_and_rebuilds(tree):
+    sources = batch.expand_inputs([os.path.join(str(tree / 'src'), '**', '*.asm')])
+    assert set(_run(tree, sources).values()) == {('built', None)}
+    assert (tree / 'out' / 'a' / 'p.hex').read_text() == "00100093\n"
+    assert (tree / 'out' / 'b' / 'p.hex').read_text() == "00200093\n"
+    assert (tree / 'out' / 'a' / 'data_data.hex').read_text() == "00000005\n"
+    assert set(_run(tree, sources).values()) == {('hit', None)}
+
+    (tree / 'src' / 'b' / 'p.asm').write_text("addi x1, x0, 3\n")
+    statuses = _run(tree, sources)
+    assert statuses[os.path.join('b', 'p.asm')] == ('built', None)
+    assert statuses[os.path.join('a', 'p.asm')] == ('hit', None)
+    assert (tree / 'out' / 'b' / 'p.hex').read_text() == "00300093\n"
+    assert set(_run(tree, sources, force=True).values()) == {('built', None)}
+
+
+def test_include_change_invalidates_the_entry(tree):
+    (tree / 'src' / 'defs.inc').write_text(".equ V, 1\n")
+    (tree / 'src' / 'main.asm').write_text('.include "defs.inc"\naddi x1, x0, V\n')
+    sources = [str(tree / 'src' / 'main.asm')]
+    assert _run(tree, sources) == {'main.asm': ('built', None)}
+    assert _run(tree, sources) == {'main.asm': ('hit', None)}
+    (tree / 'src' / 'defs.inc').write_text(".equ V, 7\n")
+    assert _run(tree, sources) == {'main.asm': ('built', None)}
+    assert (tree / 'out' / 'main.hex').read_text() == "00700093\n"
+
+
+def test_removed_data_section_removes_the_output_image(tree):
+    sources = [str(tree / 'src' / 'a' / 'data.asm')]
+    _run(tree, sources)
+    assert (tree / 'out' / 'data_data.hex').exists()
+    (tree / 'src' / 'a' / 'data.asm').write_text("nop\n")
+    _run(tree, sources)
+    assert not (tree / 'out' / 'data_data.hex').exists()
+
+
+def test_failed_sources_are_not_cached(tree):
+    bad = tree / 'src' / 'bad.asm'
+    bad.write_text("nop\nfoo x1\n")
+    for _ in range(2):
+        status, error = _run(tree, [str(bad)])['bad.asm']
+        assert status == 'error' and 'line 2' in error
+    assert not (tree / 'out' / 'bad.hex').exists()
+    assert not [name for name in os.listdir(tree / 'cache') if name.endswith('.hex')]
+
+
+def test_duplicate_output_names_are_rejected(tree):
+    sources = [str(tree / 'src' / 'a' / 'p.asm'), str(tree / 'src' / 'b' / 'p.asm')]
+    statuses = _run(tree, sources)
+    assert [status for status, _ in statuses.values()] == ['error', 'error']
+    assert 'also written by' in statuses[os.path.join('a', 'p.asm')][1]
+    assert not (tree / 'out' / 'p.hex').exists()
@@ -0,0 +1,62 @@
+# Tests for cosim.py - run with `python -m pytest assembler`
+
+import os
+import sys
+
+import pytest
+
+import assembler
+import cosim
+import iss
+
+PROGRAM = "addi x1, x0, 1\nsw x1, 16(x0)\naddi x2, x1, 2\nhalt: j halt\n"
+TRACE = ["retire,0x00000000,1,0x00000001\n", "store,0x00000010,0x00000001\n",
+         "retire,0x00000004,0,0x00000000\n", "retire,0x00000008,2,0x00000003\n",
+         "retire,0x0000000c,0,0x00000000\n", "retire,0x0000000c,0,0x00000000\n"]
+
+
+def _compare(trace):
+    sim = iss.Simulator(list(assembler.assemble(PROGRAM).words))
+    return cosim.compare(cosim.reference_events(sim, 100), cosim.read_trace(trace))
+
+
+def test_match():
+    result = _compare(TRACE)
+    assert result.divergence is None and result.complete
+    assert (result.retired, result.stores) == (4, 1)
+
+
+def test_first_divergence():
+    trace = TRACE[:3] + ["retire,0x00000008,2,0x00000004\n"] + TRACE[4:]
+    result = _compare(trace)
+    assert result.divergence.trace_line == 4
+    assert result.divergence.expected == cosim.Retire(8, 2, 3)
+    assert result.divergence.actual == cosim.Retire(8, 2, 4)
+    assert [event.pc for event in result.divergence.history] == [0, 4]
+
+
+def test_trace_ending_early_is_incomplete():
+    result = _compare(TRACE[:2])
+    assert result.divergence is None and not result.complete
+
+
+def test_x_values_never_match():
+    result = _compare(["retire,0x00000000,1,0xxxxxxxxx\n"])
+    assert result.divergence.actual == cosim.Retire(0, 1, None)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="uses a shell script as vvp")
+def test_vvp_trace_is_read_from_its_own_file(tmp_path, monkeypatch, capsys):
+    # A stand-in for vvp that prints a trace-like $display line to stdout
+    # and writes the real trace to the +trace file
+    fake = tmp_path / 'vvp'
+    fake.write_text('#!/bin/sh\nfor a in "$@"; do case $a in +trace=*) t=${a#+trace=};; esac; done\n'
+                    'echo "retire,0x00000000,1,0xdeadbeef"\n'
+                    f"cat > \"$t\" <<'EOF'\n{''.join(TRACE)}EOF\n")
+    fake.chmod(0o755)
+    source = tmp_path / 'prog.asm'
+    source.write_text(PROGRAM)
+    monkeypatch.setenv('PATH', f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(sys, 'argv', ['cosim.py', str(source), '--vvp', 'sim'])
+    cosim.main()
+    assert capsys.readouterr().out.startswith("MATCH: 4 instructions and 1 stores")
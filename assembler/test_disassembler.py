@@ -0,0 +1,88 @@
+# Tests for disassembler.py - run with `python -m pytest assembler`
+
+import glob
+import os
+import random
+
+import pytest
+
+import assembler
+import disassembler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = sorted(glob.glob(os.path.join(ROOT, 'tests', 'asm_sources', '*.asm')))
+
+needs_numpy = pytest.mark.skipif(disassembler.np is None, reason="NumPy is not installed")
+
+
+def _assemble_text(source, path=None):
+    result = assembler.assemble(source, source_path=path)
+    assert result.ok, result.diagnostics
+    return result.words
+
+
+def _assemble(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return _assemble_text(f.read(), path)
+
+
+@pytest.mark.parametrize('path', SOURCES, ids=os.path.basename)
+@pytest.mark.parametrize('comments', [True, False])
+def test_listing_round_trip(path, comments):
+    words = _assemble(path)
+    lines = list(disassembler.listing(disassembler.decode_image(words), comments))
+    assert disassembler.verify(lines, words) is None
+
+
+def test_round_trip_of_random_words():
+    rng = random.Random(1)
+    words = [rng.getrandbits(32) for _ in range(5000)] + list(disassembler.PLACEHOLDERS) + [0]
+    for vectorized in (True, False):
+        lines = list(disassembler.listing(disassembler.decode_image(words, vectorized)))
+        assert disassembler.verify(lines, words) is None
+
+
+def test_branch_targets_become_labels():
+    words = _assemble_text("loop:\naddi x1, x1, 1\nbne x1, x2, loop\nj loop\n")
+    lines = list(disassembler.listing(disassembler.decode_image(words), comments=False))
+    assert lines == ["L_0000:", "    addi x1, x1, 1", "    bne x1, x2, L_0000", "    jal x0, L_0000"]
+
+
+def test_verify_reports_the_first_difference():
+    words = _assemble_text("addi x1, x0, 1\naddi x2, x0, 2\n")
+    lines = list(disassembler.listing(disassembler.decode_image(words)))
+    assert disassembler.verify(lines, [words[0], words[1] + 1]) == 1
+    assert disassembler.verify(lines, list(words) + [0]) == 2
+
+
+@needs_numpy
+@pytest.mark.parametrize('path', SOURCES[:4], ids=os.path.basename)
+def test_vectorized_decode_matches_iss(path):
+    words = _assemble(path)
+    fast = disassembler.decode_image(words)
+    slow = disassembler.decode_image(words, vectorized=False)
+    for fast_column, slow_column in zip(fast, slow):
+        assert fast_column.tolist() == slow_column
+
+
+@needs_numpy
+def test_analyze_is_the_same_without_numpy():
+    rng = random.Random(2)
+    words = [rng.getrandbits(32) for _ in range(2000)] + [0xDEADBEEF, 0, 0xFA11FA11]
+    fast = disassembler.analyze(disassembler.decode_image(words))
+    slow = disassembler.analyze(disassembler.decode_image(words, vectorized=False))
+    assert fast == slow
+    assert fast.problems['deadbeef'] == (1, [4 * 2000])
+
+
+@needs_numpy
+@pytest.mark.parametrize('comments', [True, False])
+def test_vectorized_listing_matches_the_python_listing(monkeypatch, comments):
+    monkeypatch.setattr(disassembler, 'CHUNK_WORDS', 1000)
+    rng = random.Random(3)
+    words = [rng.getrandbits(32) for _ in range(3000)] + list(_assemble(SOURCES[1]))
+    fast = list(disassembler.listing(disassembler.decode_image(words), comments))
+    slow = list(disassembler.listing(disassembler.decode_image(words, vectorized=False), comments))
+    assert fast == slow
+    assert ''.join(disassembler.listing_chunks(disassembler.decode_image(words), comments)) == \
+        ''.join(line + '\n' for line in slow)
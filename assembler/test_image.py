@@ -0,0 +1,83 @@
+# Tests for image.py - run with `python -m pytest assembler`
+
+from array import array
+
+import pytest
+
+import image
+
+WORDS = array('I', [0x00000013, 0xDEADBEEF, 0x00000000, 0xFFFFFFFF, 0x12345678] * 7)
+
+
+@pytest.mark.parametrize('fmt', image.FORMATS)
+@pytest.mark.parametrize('base_address', [0, 0x400, 0xFFF0, 0x1FFF8])
+def test_round_trip(tmp_path, fmt, base_address):
+    path = str(tmp_path / f"prog{image.FORMAT_EXTENSIONS[fmt]}")
+    image.write_image(path, WORDS, fmt, base_address)
+    assert image.format_for_path(path) == fmt
+    assert image.load_words(path) == array('I', bytes(base_address)) + WORDS
+
+
+@pytest.mark.parametrize('base_address', [0, 0x400, 0xFFF0])
+def test_ihex_and_img_keep_the_base_address(tmp_path, base_address):
+    ihex_path = str(tmp_path / 'prog.ihex')
+    img_path = str(tmp_path / 'prog.img')
+    image.write_ihex(ihex_path, WORDS, base_address)
+    image.write_img(img_path, WORDS, base_address)
+    assert image.load_ihex(ihex_path) == (base_address, WORDS)
+    assert image.load_img(img_path) == (base_address, WORDS)
+
+
+def test_ihex_records_do_not_cross_a_64k_boundary(tmp_path):
+    path = str(tmp_path / 'prog.ihex')
+    image.write_ihex(path, WORDS, 0xFFF8)
+    with open(path) as f:
+        records = [bytes.fromhex(line.strip()[1:]) for line in f]
+    for record in records:
+        if record[3] == 0x00:
+            assert ((record[1] << 8) | record[2]) + record[0] <= 0x10000
+    assert any(record[3] == 0x04 for record in records)
+
+
+def test_ihex_checksum_is_checked(tmp_path):
+    path = tmp_path / 'prog.ihex'
+    image.write_ihex(str(path), WORDS)
+    lines = path.read_text().splitlines()
+    lines[0] = lines[0][:-2] + ('00' if lines[0][-2:] != '00' else '01')
+    path.write_text('\n'.join(lines) + '\n')
+    with pytest.raises(ValueError, match='checksum'):
+        image.load_ihex(str(path))
+
+
+def test_hex_address_records(tmp_path):
+    path = tmp_path / 'prog.hex'
+    path.write_text("00000001\n@3\n00000002 // comment\n\n@1\n00000003\n")
+    assert image.load_hex(str(path)) == array('I', [1, 3])
+
+
+def test_bin_size_must_be_whole_words(tmp_path):
+    path = tmp_path / 'prog.bin'
+    path.write_bytes(b'\x13\x00\x00')
+    with pytest.raises(ValueError, match='multiple of 4'):
+        image.load_bin(str(path))
+
+
+def test_open_image_maps_the_payload(tmp_path):
+    path = str(tmp_path / 'prog.img')
+    image.write_img(path, WORDS, 0x400)
+    with image.open_image(path) as mapped:
+        assert mapped.base_address == 0x400
+        assert len(mapped) == len(WORDS)
+        assert list(mapped.words) == list(WORDS)
+
+
+def test_open_image_rejects_other_files(tmp_path):
+    path = str(tmp_path / 'prog.img')
+    image.write_bin(path, WORDS)
+    with pytest.raises(ValueError, match='not a version'):
+        image.open_image(path)
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError, match='Unknown image format'):
+        image.write_image(str(tmp_path / 'prog.elf'), WORDS, 'elf')
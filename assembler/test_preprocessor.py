@@ -0,0 +1,97 @@
+# Tests for preprocessor.py - run with `python -m pytest assembler`
+
+import pytest
+
+import assembler
+import preprocessor
+
+
+def test_rept_count_over_limit_is_a_diagnostic():
+    result = assembler.assemble("nop\n.rept 1000000000\nnop\n.endr\n")
+    assert not result.ok
+    assert [(d.line, d.code) for d in result.diagnostics] == [(2, 'fatal')]
+    assert 'exceeds the limit' in result.diagnostics[0].message
+
+
+def test_nested_rept_over_line_limit_is_a_diagnostic():
+    result = assembler.assemble(".rept 100000\n.rept 100000\nnop\n.endr\n.endr\n")
+    assert not result.ok
+    assert f"exceeds {preprocessor.MAX_EXPANDED_LINES} lines" in result.diagnostics[0].message
+
+
+def test_rept_within_limit():
+    result = assembler.assemble(".rept 3\naddi x1, x1, 1\n.endr\n")
+    assert result.ok
+    assert list(result.words) == [0x00108093] * 3
+
+
+def _expand(source, source_path=None, include_dirs=()):
+    return preprocessor.preprocess(source.splitlines(True), source_path, include_dirs)
+
+
+def test_rept_with_set_counter():
+    result = _expand(".equ N, 3\n.set i, 0\n.rept N\naddi x5, x0, i*4\n.set i, i+1\n.endr\n")
+    assert result.lines == ['addi x5, x0, 0', 'addi x5, x0, 4', 'addi x5, x0, 8']
+    assert result.line_numbers == [3, 3, 3]
+    assert result.contexts == ['line 4 in .rept'] * 3
+
+
+def test_irp_and_macro_arguments():
+    result = _expand(".macro push r, size=4\naddi sp, sp, -\\size\nsw \\r, 0(sp)\n.endm\n"
+                     ".irp r, x6, x7\npush \\r\n.endr\npush size=8, r=x8\n")
+    assert result.lines == ['addi sp, sp, -4', 'sw x6, 0(sp)', 'addi sp, sp, -4', 'sw x7, 0(sp)',
+                            'addi sp, sp, -8', 'sw x8, 0(sp)']
+    assert result.line_numbers == [5, 5, 5, 5, 8, 8]
+    assert result.contexts[-1] == "line 3 in macro 'push'"
+
+
+def test_local_labels_are_unique_per_expansion():
+    source = ".macro countdown reg\nl\\@: addi \\reg, \\reg, -1\nbne \\reg, x0, l\\@\n.endm\ncountdown x8\ncountdown x9\n"
+    result = assembler.assemble(source)
+    assert result.ok
+    labels = [name for name in result.symbols if name.startswith('l')]
+    assert len(labels) == 2 and result.symbols[labels[1]] == 8
+
+
+def test_include_search_path(tmp_path):
+    (tmp_path / 'inc').mkdir()
+    (tmp_path / 'inc' / 'defs.inc').write_text(".equ STEP, 4\n.include \"more.inc\"\n")
+    (tmp_path / 'inc' / 'more.inc').write_text("addi x1, x1, STEP\n")
+    source = '.include "defs.inc"\naddi x2, x0, STEP\n'
+    main = str(tmp_path / 'main.asm')
+    result = _expand(source, main, [str(tmp_path / 'inc')])
+    assert result.lines == ['addi x1, x1, 4', 'addi x2, x0, 4']
+    assert result.line_numbers == [1, 2]
+    assert preprocessor.included_files(source.splitlines(True), main, [str(tmp_path / 'inc')]) == [
+        str(tmp_path / 'inc' / 'defs.inc'), str(tmp_path / 'inc' / 'more.inc')]
+
+
+def test_recursive_include(tmp_path):
+    (tmp_path / 'self.inc').write_text('.include "self.inc"\n')
+    result = assembler.assemble('nop\n.include "self.inc"\n', source_path=str(tmp_path / 'main.asm'))
+    assert [(d.line, d.code) for d in result.diagnostics] == [(2, 'fatal')]
+    assert 'Recursive include' in result.diagnostics[0].message
+
+
+@pytest.mark.parametrize('source, line, message', [
+    (".equ x5, 1\n", 1, "Register name 'x5'"),
+    (".equ sp, 1\n", 1, "Register name 'sp'"),
+    ("a:\n.equ a, 1\n", 2, "also a label"),
+    (".equ a, 1\na:\n", 2, "also a symbol"),
+    (".macro m\nm\n.endm\nm\n", 4, "nested more than"),
+    ('.include "missing.inc"\n', 1, "not found"),
+    (".rept 2\nnop\n", 1, "without a matching '.endr'"),
+    (".endr\n", 1, "without a matching block"),
+    (".macro m a\n.endm\nm\n", 3, "Missing argument"),
+])
+def test_errors(source, line, message):
+    result = assembler.assemble(source)
+    assert [(d.line, d.code) for d in result.diagnostics] == [(line, 'fatal')]
+    assert message in result.diagnostics[0].message
+
+
+def test_diagnostics_inside_macros_name_the_body_line():
+    result = assembler.assemble(".macro m\nfoo x1\n.endm\nnop\nm\n")
+    errors = [d for d in result.diagnostics if d.severity == 'error']
+    assert [d.line for d in errors] == [5]
+    assert errors[0].message.endswith("(line 2 in macro 'm')")
@@ -0,0 +1,39 @@
+# Tests for scheduler.py - run with `python -m pytest assembler`
+
+import assembler
+import iss
+import scheduler
+from conftest import final_state
+
+
+def _block(source):
+    words = [int(word, 16) for word in assembler.assemble_program(source.splitlines(True)).text]
+    return [(ident, iss.decode(word), word) for ident, word in enumerate(words)]
+
+
+def test_same_iss_state_and_no_more_cycles(asm_program):
+    path, lines = asm_program
+    new_lines, report = scheduler.schedule_lines(lines, path)
+    assert final_state(new_lines, path) == final_state(lines, path)
+    _, before = scheduler._measure(lines, 200_000, path)
+    _, after = scheduler._measure(new_lines, 200_000, path)
+    assert after.cycles <= before.cycles
+    assert len(after.hazards) <= len(before.hazards)
+    if not report.nops_removed and not report.changed:
+        assert new_lines == lines
+
+
+def test_redundant_nops_are_removed():
+    seq = _block("addi x1, x0, 1\nnop\nnop\nnop\naddi x2, x0, 1\nadd x3, x2, x1\nj halt\nhalt: j halt\n")
+    assert scheduler.schedule_block(seq[:7]) == [0, 4, 5, 6]
+
+
+def test_nops_covering_a_load_are_kept():
+    seq = _block("lw x1, 0(x0)\nnop\nnop\nnop\naddi x2, x1, 1\n")
+    order = scheduler.schedule_block(seq)
+    assert order is None or order.index(4) - order.index(0) >= scheduler.SAFE_DISTANCE
+
+
+def test_block_with_an_existing_hazard_is_left_alone():
+    seq = _block("lw x1, 0(x0)\naddi x2, x1, 1\nnop\n")
+    assert scheduler.schedule_block(seq) is None
@@ -0,0 +1,90 @@
+# Tests for strength_reduction.py - run with `python -m pytest assembler`
+
+import random
+
+import pytest
+
+import assembler
+import iss
+import scheduler
+import strength_reduction
+from conftest import final_state
+
+OPERANDS = [0, 1, 2, 3, 7, 100, -1, -2, -7, -100, 0x7FFFFFFF, -0x80000000, 0x12345678, -0x12345678]
+CONSTANTS = [0, 1, 2, 3, 5, 7, 8, 10, 12, 255, 256, 1000, 4096, 1 << 20, 1 << 31, -1, -2, -8, -4096,
+             -(1 << 20), 0x55555555, 0xFFFFFFFF]
+
+
+def _run(lines, x1):
+    words = [int(word, 16) for word in assembler.assemble_program(
+        [f"li x1, {x1}\n"] + [f"{line}\n" for line in lines]).text]
+    sim = iss.Simulator(words)
+    sim.run(100)
+    return sim.regs[2]
+
+
+def _expected(name, x1, value):
+    return _run([f"li x3, {value}", f"{name} x2, x1, x3"], x1)
+
+
+@pytest.mark.parametrize('value', CONSTANTS)
+def test_mul_sequence(value):
+    lines = strength_reduction.mul_sequence('x2', 'x1', value & 0xFFFFFFFF)
+    for x1 in OPERANDS:
+        assert _run(lines, x1) == _expected('mul', x1, value)
+
+
+@pytest.mark.parametrize('name', ['div', 'divu', 'rem', 'remu'])
+@pytest.mark.parametrize('value', [c for c in CONSTANTS if c and (abs(c) & (abs(c) - 1)) == 0])
+def test_div_sequence(name, value):
+    lines = strength_reduction.div_sequence(name, 'x2', 'x1', value & 0xFFFFFFFF)
+    if lines is None:
+        assert name in ('divu', 'remu')  # Negative divisors are large unsigned non-powers of two
+        return
+    for x1 in OPERANDS:
+        assert _run(lines, x1) == _expected(name, x1, value)
+
+
+def test_sequences_need_a_scratch_register():
+    assert strength_reduction.mul_sequence('x1', 'x1', 7) is None
+    assert strength_reduction.div_sequence('div', 'x1', 'x1', 4) is None
+
+
+def test_default_latencies_rewrite_nothing(asm_program):
+    path, lines = asm_program
+    new_lines, report = strength_reduction.reduce_lines(lines, source_path=path)
+    assert new_lines == lines and not report.rewrites
+
+
+def test_same_iss_state_and_no_more_cycles(asm_program):
+    path, lines = asm_program
+    new_lines, report = strength_reduction.reduce_lines(lines, 4, 32, path)
+    assert final_state(new_lines, path) == final_state(lines, path)
+    _, before = scheduler._measure(lines, 200_000, path, 4, 32)
+    _, after = scheduler._measure(new_lines, 200_000, path, 4, 32)
+    assert after.cycles <= before.cycles
+    if report.rewrites and before.halted:
+        assert after.cycles < before.cycles
+
+
+def test_strength_reduction_then_scheduling(asm_program):
+    path, lines = asm_program
+    reduced, _ = strength_reduction.reduce_lines(lines, 4, 32, path)
+    scheduled, _ = scheduler.schedule_lines(reduced, path)
+    assert final_state(scheduled, path) == final_state(lines, path)
+
+
+def test_constants_propagate_into_random_programs():
+    rng = random.Random(3)
+    rewrites = 0
+    for _ in range(50):
+        lines = [f"li x{reg}, {rng.choice(CONSTANTS)}\n" for reg in range(1, 6)]
+        for _ in range(6):
+            name = rng.choice(['mul', 'div', 'divu', 'rem', 'remu', 'add'])
+            rd, rs1, rs2 = rng.randrange(6, 10), rng.randrange(1, 10), rng.randrange(1, 10)
+            lines += [f"{name} x{rd}, x{rs1}, x{rs2}\n", "nop\n", "nop\n", "nop\n"]
+        lines.append("halt: j halt\n")
+        new_lines, report = strength_reduction.reduce_lines(lines, 4, 32)
+        assert final_state(new_lines) == final_state(lines)
+        rewrites += len(report.rewrites)
+    assert rewrites > 50
@@ -0,0 +1,104 @@
+# Tests for timing_model.py - run with `python -m pytest assembler`
+
+import os
+
+import pytest
+
+import assembler
+import iss
+import regression
+import timing_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTBENCHES = regression.discover(os.path.join(ROOT, regression.SIM_DIR), os.path.join(ROOT, regression.SOURCE_DIR))
+
+# Model cycle counts of the programs the testbenches run (policy rtl, no
+# mul/div latency); a change here is a change of the modelled pipeline.
+# convolution_test does not halt, so its testbench stops it at MAX_SIM_CYCLES.
+EXPECTED_CYCLES = {
+    'tb_add_sub_test': (75, 79),
+    'tb_branch_test': (76, 116),
+    'tb_bubble_sort_test': (2663, 3067),
+    'tb_div_integrated_test': (42, 46),
+    'tb_factorial_test': (1173, 1325),
+    'tb_fft_test': (470, 486),
+    'tb_fibonacci_test': (99, 117),
+    'tb_gcd_test': (271, 395),
+    'tb_hash_test': (389, 585),
+    'tb_logic_test': (40, 44),
+    'tb_mul_test': (62, 66),
+    'tb_prime_sieve_test': (15452, 25480),
+    'tb_shift_compare_test': (53, 57),
+}
+
+
+def _words(source):
+    result = assembler.assemble(source)
+    assert result.ok, result.diagnostics
+    return list(result.words)
+
+
+@pytest.mark.parametrize('testbench', TESTBENCHES, ids=lambda tb: tb.name)
+def test_testbench_programs(testbench):
+    program = iss.load_program(testbench.source)
+    result = timing_model.simulate(program, data=iss.find_data(testbench.source))
+    budget = timing_model.read_testbench_cycles(testbench.path)
+    if testbench.name not in EXPECTED_CYCLES:
+        assert not result.halted
+        return
+    assert (result.instructions, result.cycles) == EXPECTED_CYCLES[testbench.name]
+    assert result.halted and result.deadlock is None
+    if budget is not None:
+        assert result.cycles <= budget
+
+
+def test_straight_line_fills_and_drains_the_pipeline():
+    result = timing_model.simulate(_words("addi x1, x0, 1\naddi x2, x0, 2\nhalt: j halt\n"))
+    assert (result.instructions, result.cycles) == (3, 3 + timing_model.PIPELINE_DEPTH - 1)
+    assert result.lost == {timing_model.CAUSE_FILL: 4}
+
+
+def test_taken_branch_costs_two_cycles():
+    result = timing_model.simulate(_words(
+        "addi x1, x0, 1\nbeq x0, x0, skip\naddi x3, x0, 3\nskip:\naddi x4, x0, 4\nhalt: j halt\n"))
+    assert result.lost[timing_model.CAUSE_BRANCH] == 2
+    assert result.lost_by_pc == {4: 2}
+    assert result.cycles == result.instructions + 4 + 2
+
+
+def test_load_use_policies():
+    words = _words("lw x1, 0(x0)\nadd x2, x1, x1\nhalt: j halt\n")
+    rtl = timing_model.simulate(words, policy='rtl')
+    unit = timing_model.simulate(words, policy='hazard_unit')
+    assert timing_model.CAUSE_LOAD_USE not in rtl.lost
+    assert unit.lost[timing_model.CAUSE_LOAD_USE] == 1
+    assert unit.cycles == rtl.cycles + 1
+    assert all(hazard.kind == timing_model.WRITE_LOAD for hazard in rtl.hazards + unit.hazards)
+
+
+def test_rtl_load_use_check_deadlocks_on_its_own_fields():
+    words = _words("lw x1, 0(x1)\nhalt: j halt\n")
+    assert timing_model.simulate(words, policy='rtl').deadlock == 0
+    assert timing_model.simulate(words, policy='hazard_unit').deadlock is None
+
+
+def test_mul_div_latency():
+    words = _words("addi x1, x0, 3\nmul x2, x1, x1\ndiv x3, x2, x1\nhalt: j halt\n")
+    assert timing_model.CAUSE_MULDIV not in timing_model.simulate(words).lost
+    result = timing_model.simulate(words, mul_latency=4, div_latency=32)
+    assert result.lost[timing_model.CAUSE_MULDIV] == 36
+    assert result.lost_by_pc == {4: 4, 8: 32}
+
+
+def test_validate_against_process_log(tmp_path):
+    words = _words("addi x1, x0, 1\nbeq x0, x0, skip\naddi x3, x0, 3\nskip:\naddi x4, x0, 4\nhalt: j halt\n")
+    fetch_pcs = timing_model.simulate(words, until_cycle=12).fetch_pcs
+    log = tmp_path / 'prog_process.csv'
+    log.write_text("cycle,pc\n" + "".join(f"cycle,{cycle},PC=0x{fetch_pcs[cycle]:08x},instr=0x00000013\n"
+                                          for cycle in range(0, 12, 3))
+                   + "cycle,12,PC=0xxxxxxxxx,instr=0xxxxxxxxx\n")
+    samples = timing_model.read_process_log(str(log))
+    assert [cycle for cycle, _ in samples] == [0, 3, 6, 9]
+    assert timing_model.validate(words, samples) == []
+    wrong = samples[:-1] + [(9, 0x40)]
+    assert timing_model.validate(words, wrong) == [(9, 0x40, fetch_pcs[9])]
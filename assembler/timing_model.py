@@ -0,0 +1,343 @@
+# RISC-V 32IM five-stage pipeline timing model
+# File: assembler/timing_model.py
+#
+# Cycle-approximate model of hardware/rtl/cpu_top.v driven by the dynamic
+# instruction stream of the ISS (assembler/iss.py). It reports total cycles,
+# CPI and where the lost cycles went, without running the RTL.
+#
+# Pipeline rules reproduced:
+#   - Branches and jumps resolve in EX. A taken branch, JAL or JALR flushes
+#     IF/ID and ID/EX, costing 2 cycles (cpu_top.v: if_id_flush_en/id_ex_flush_en).
+#   - forwarding_unit.v forwards the ALU result from EX/MEM (1 cycle apart) and
+#     MEM/WB (2 cycles apart). Loads and JAL/JALR link values are not
+#     forwarded correctly (the ALU result is forwarded instead), and the
+#     register file has no write-through, so a reader 3 cycles behind a writer
+#     sees the stale value. Such dependencies are reported as data hazards.
+#   - multiplier.v and divider.v are combinational (div_ready_o is always 1),
+#     so MUL/DIV add no cycles by default; --mul-latency/--div-latency model
+#     a multi-cycle unit that holds the pipeline in EX.
+#
+# Two stall policies are available:
+#   rtl          the load-use check as wired in cpu_top.v, which compares the
+#                load in ID with its own rs1/rs2 fields (a match never clears,
+#                so it is reported as a deadlock)
+#   hazard_unit  the rules of hazard_detection_unit.v: a 1-cycle stall when the
+#                load in EX writes a register read by the instruction in ID, and
+#                a flush when a not-taken branch in EX meets a JAL in ID
+#
+# Usage (from the project root):
+#   python assembler/timing_model.py tests/asm_sources/fft_test.asm
+#   python assembler/timing_model.py tests/hex_outputs/fft_test.hex \
+#       --testbench hardware/sim/tb_fft_test.v --validate tests/output/fft_process.csv
+
+import argparse
+import re
+from collections import Counter, namedtuple
+
+import assembler
+import iss
+
+POLICIES = ('rtl', 'hazard_unit')
+PIPELINE_DEPTH = 5
+
+# Lost-cycle causes
+CAUSE_FILL = 'pipeline fill/drain'
+CAUSE_BRANCH = 'taken branch flush'
+CAUSE_JUMP = 'jump flush'
+CAUSE_MISPREDICT = 'branch/JAL mispredict flush'
+CAUSE_LOAD_USE = 'load-use stall'
+CAUSE_MULDIV = 'mul/div busy'
+
+# Kinds of register writers, by the write-back source they use
+WRITE_ALU = 'alu'
+WRITE_LOAD = 'load'
+WRITE_LINK = 'link'
+
+MUL_OPS = frozenset(('mul',))
+DIV_OPS = frozenset(('div', 'divu', 'rem', 'remu'))
+
+Hazard = namedtuple('Hazard', 'pc reg producer_pc distance kind')
+# lost_by_pc maps the pc of the instruction responsible for a stall or flush
+# (the branch/jump, the multi-cycle mul/div, the load's consumer) to its lost cycles
+TimingResult = namedtuple('TimingResult',
+                          'instructions cycles cpi lost hazards deadlock halted fetch_pcs lost_by_pc')
+
+# Slot in a pipeline stage: on_path is False for wrong-path fetches
+_Slot = namedtuple('_Slot', 'pc op word taken next_pc on_path')
+
+
+def source_registers(op):
+    """Architectural source registers read by a decoded op."""
+    name = op.name
+    if name in iss._R_EXPR or name in iss.BRANCH_OPS or name in iss.STORE_OPS:
+        return (op.rs1, op.rs2)
+    if name in iss._I_EXPR or name in iss.LOAD_OPS or name == 'jalr':
+        return (op.rs1,)
+    return ()
+
+
+def write_kind(op):
+    """How the result of `op` reaches the register file, or None if it writes nothing."""
+    if op.name is None or op.rd == 0 or op.name in iss.BRANCH_OPS or op.name in iss.STORE_OPS:
+        return None
+    if op.name in iss.LOAD_OPS:
+        return WRITE_LOAD
+    if op.name in iss.JUMP_OPS:
+        return WRITE_LINK
+    return WRITE_ALU
+
+
+def forwarding_covers(kind, distance):
+    """True if a reader `distance` EX-cycles after a writer of `kind` gets the new value."""
+    if distance >= 4:
+        return True  # Written back before the reader's register read in ID
+    if distance in (1, 2):
+        return kind == WRITE_ALU  # EX/MEM and MEM/WB forward the ALU result only
+    return False  # distance 3: written back in the same cycle the reader is decoded
+
+
+def _raw_fields(word):
+    return (word >> 7) & 0x1F, (word >> 15) & 0x1F, (word >> 20) & 0x1F
+
+
+def simulate(program, policy='rtl', mul_latency=0, div_latency=0,
+             max_instructions=1_000_000, until_cycle=None, data=None):
+    """Runs the pipeline model over the program's dynamic instruction stream.
+
+    If until_cycle is given, the fetch pc of every cycle up to it is recorded
+    (the halt loop keeps executing once the program has finished), which is
+    what the testbenches log in *_process.csv.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy '{policy}', expected one of {POLICIES}")
+    sim = iss.Simulator(program, data=data)
+    trace = sim.trace(max_instructions)
+    ops = sim.ops
+    words = sim.program
+
+    lost = Counter()
+    lost_by_pc = Counter()
+    hazards = []
+    fetch_pcs = [] if until_cycle is not None else None
+    last_writer = {}  # reg -> (ex_cycle, kind, pc)
+
+    pending = next(trace, None)  # Next correct-path instruction to fetch
+    halt_slot = None
+    retired = 0
+    fetched = 0
+    on_path = True
+    if_pc = 0
+    id_s = ex_s = mem_s = wb_s = None
+    busy = 0  # Remaining extra EX cycles of a multi-cycle mul/div
+    ex_checked = None  # Slot whose first EX cycle has been handled (it stays in EX while busy)
+    deadlock = None
+    cycle = 0
+
+    while True:
+        if fetch_pcs is not None:
+            if cycle >= until_cycle:
+                break
+            fetch_pcs.append(if_pc)
+
+        # --- WB / retire
+        if wb_s is not None and wb_s.on_path:
+            retired += 1
+            if fetch_pcs is None and pending is None and retired == fetched:
+                cycle += 1  # The last instruction leaves WB at the end of this cycle
+                break
+
+        # --- EX: data hazards, checked on the first EX cycle of each instruction
+        if ex_s is not None and ex_s.on_path and ex_s is not ex_checked:
+            ex_checked = ex_s
+            op = ex_s.op
+            for reg in source_registers(op):
+                writer = last_writer.get(reg) if reg else None
+                if writer is not None:
+                    distance = cycle - writer[0]
+                    if not forwarding_covers(writer[1], distance):
+                        hazards.append(Hazard(ex_s.pc, reg, writer[2], distance, writer[1]))
+            if op.name == 'lui':
+                # LUI forces the register read to x0, but the forwarding unit
+                # still matches the raw rs1 field and can inject a value into it.
+                raw_rs1 = _raw_fields(ex_s.word)[1]
+                writer = last_writer.get(raw_rs1) if raw_rs1 else None
+                if writer is not None and cycle - writer[0] in (1, 2):
+                    hazards.append(Hazard(ex_s.pc, raw_rs1, writer[2], cycle - writer[0], 'lui-forward'))
+            kind = write_kind(op)
+            if kind:
+                last_writer[op.rd] = (cycle, kind, ex_s.pc)
+            if op.name in MUL_OPS:
+                busy = mul_latency
+            elif op.name in DIV_OPS:
+                busy = div_latency
+
+        # --- Hazard unit decisions for the next cycle
+        redirect = None
+        stall = False
+        if busy:
+            busy -= 1
+            lost[CAUSE_MULDIV] += 1
+            lost_by_pc[ex_s.pc] += 1
+            wb_s, mem_s = mem_s, None
+            cycle += 1
+            continue
+        if ex_s is not None and ex_s.on_path and ex_s.taken:
+            redirect = ex_s.next_pc
+            if pending is not None:  # A flush behind the final (halt) jump costs nothing
+                lost[CAUSE_JUMP if ex_s.op.name in iss.JUMP_OPS else CAUSE_BRANCH] += 2
+                lost_by_pc[ex_s.pc] += 2
+        elif policy == 'hazard_unit' and ex_s is not None and ex_s.on_path \
+                and ex_s.op.name in iss.BRANCH_OPS and id_s is not None and id_s.op.name == 'jal':
+            # hazard_detection_unit predicts "taken" from the JAL sitting in ID
+            redirect = ex_s.pc + 4
+            lost[CAUSE_MISPREDICT] += 2
+            lost_by_pc[ex_s.pc] += 2
+        if id_s is not None:
+            id_rd, id_rs1, id_rs2 = _raw_fields(id_s.word)
+            if policy == 'rtl':
+                if (id_s.word & 0x7F) == assembler.OPCODE_LOAD and id_rd != 0 and id_rd in (id_rs1, id_rs2):
+                    if redirect is None:
+                        deadlock = id_s.pc
+                        break
+            elif ex_s is not None and ex_s.op.name in iss.LOAD_OPS and ex_s.op.rd != 0 \
+                    and ex_s.op.rd in (id_rs1, id_rs2) and redirect is None:
+                stall = True
+                lost[CAUSE_LOAD_USE] += 1
+                lost_by_pc[id_s.pc] += 1
+
+        # --- Advance the pipeline
+        wb_s = mem_s
+        mem_s = ex_s
+        if redirect is not None:
+            ex_s = None
+            id_s = None
+            if_pc = redirect
+            on_path = True
+        elif stall:
+            ex_s = None
+        else:
+            ex_s = id_s
+            # IF: fetch the next correct-path instruction if the pc matches it
+            if on_path and pending is not None and pending[0] == if_pc:
+                pc, op, taken, next_pc = pending
+                id_s = _Slot(pc, op, words[pc >> 2], taken, next_pc, True)
+                fetched += 1
+                pending = next(trace, None)
+                if pending is None and sim.halted and next_pc == pc:
+                    halt_slot = id_s
+                if taken:
+                    on_path = False  # Sequential fetches after this are wrong-path
+            elif on_path and pending is None and halt_slot is not None and halt_slot.pc == if_pc \
+                    and fetch_pcs is not None:
+                id_s = halt_slot._replace(on_path=True)  # Keep spinning in the halt loop
+                on_path = False
+            else:
+                index = if_pc >> 2
+                op = ops[index] if index < len(ops) else iss.DecodedOp(None, 0, 0, 0, 0)
+                word = words[index] if index < len(words) else 0
+                id_s = _Slot(if_pc, op, word, False, if_pc + 4, False)
+            if_pc += 4
+        cycle += 1
+
+    instructions = sim.instret
+    cycles = cycle
+    if fetch_pcs is None and deadlock is None:
+        lost[CAUSE_FILL] = cycles - instructions - sum(lost.values())
+    cpi = cycles / instructions if instructions else 0.0
+    return TimingResult(instructions, cycles, cpi, dict(lost), hazards, deadlock, sim.halted, fetch_pcs,
+                        dict(lost_by_pc))
+
+
+def read_testbench_cycles(tb_path):
+    """Returns MAX_SIM_CYCLES from a tb_*.v file, or None if it is not declared."""
+    with open(tb_path, 'r', encoding='utf-8') as f:
+        match = re.search(r"localparam\s+MAX_SIM_CYCLES\s*=\s*(\d+)", f.read())
+    return int(match.group(1)) if match else None
+
+
+def read_process_log(csv_path):
+    """Parses the 'cycle,N,PC=0x...' samples written by the testbenches."""
+    samples = []
+    pattern = re.compile(r"^cycle,(\d+),PC=0x([0-9a-fA-FxXzZ]+)")
+    with open(csv_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = pattern.match(line)
+            if match and all(c in '0123456789abcdefABCDEF' for c in match.group(2)):
+                samples.append((int(match.group(1)), int(match.group(2), 16)))
+    return samples
+
+
+def validate(program, samples, policy='rtl', data=None):
+    """Compares the model's fetch pc against testbench samples; returns the mismatches."""
+    if not samples:
+        return []
+    last_cycle = max(cycle for cycle, _ in samples) + 1
+    result = simulate(program, policy=policy, until_cycle=last_cycle, data=data)
+    fetch_pcs = result.fetch_pcs
+    return [(cycle, pc, fetch_pcs[cycle] if cycle < len(fetch_pcs) else None)
+            for cycle, pc in samples
+            if cycle >= len(fetch_pcs) or fetch_pcs[cycle] != pc]
+
+
+def print_report(result):
+    status = "halted" if result.halted else "instruction limit reached"
+    print(f"instructions: {result.instructions} ({status})")
+    print(f"cycles:       {result.cycles}")
+    print(f"CPI:          {result.cpi:.3f}")
+    print("lost cycles:")
+    for cause, count in sorted(result.lost.items(), key=lambda item: -item[1]):
+        print(f"  {cause:<30}{count:>8}")
+    if result.deadlock is not None:
+        print(f"DEADLOCK: load at pc 0x{result.deadlock:08x} matches its own rs1/rs2 field "
+              f"(cpu_top.v load-use check never clears)")
+    if result.hazards:
+        sites = Counter(result.hazards)
+        print(f"data hazards not covered by forwarding: {len(result.hazards)} at {len(sites)} site(s)")
+        for hazard, count in sorted(sites.items())[:20]:
+            print(f"  pc 0x{hazard.pc:08x} reads x{hazard.reg} written by pc 0x{hazard.producer_pc:08x} "
+                  f"({hazard.kind}) {hazard.distance} cycle(s) earlier, {count}x")
+        if len(sites) > 20:
+            print(f"  ... {len(sites) - 20} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Five-stage pipeline timing model")
+    parser.add_argument("program", help="Program image (.hex) or assembly source (.asm)")
+    parser.add_argument("--data", help="Data-memory image to preload (default: as in iss.py)")
+    parser.add_argument("--policy", choices=POLICIES, default='rtl',
+                        help="Stall rules: as wired in cpu_top.v (rtl) or as in hazard_detection_unit.v")
+    parser.add_argument("--mul-latency", type=int, default=0, help="Extra EX cycles per MUL (default: 0)")
+    parser.add_argument("--div-latency", type=int, default=0,
+                        help="Extra EX cycles per DIV/DIVU/REM/REMU (default: 0)")
+    parser.add_argument("--max", type=int, default=1_000_000, help="Instruction limit (default: 1M)")
+    parser.add_argument("--testbench", help="tb_*.v file; checks the program finishes within MAX_SIM_CYCLES")
+    parser.add_argument("--validate", metavar="PROCESS_CSV",
+                        help="Compare fetch pcs against a testbench *_process.csv log")
+    args = parser.parse_args()
+
+    program = iss.load_program(args.program)
+    data = iss.load_data(args.data) if args.data else iss.find_data(args.program)
+    result = simulate(program, policy=args.policy, mul_latency=args.mul_latency,
+                      div_latency=args.div_latency, max_instructions=args.max, data=data)
+    print_report(result)
+
+    if args.testbench:
+        budget = read_testbench_cycles(args.testbench)
+        if budget is not None:
+            if not result.halted:
+                verdict = "program does not halt, the testbench stops it"
+            else:
+                verdict = "fits" if result.cycles <= budget else "DOES NOT FIT"
+            print(f"testbench MAX_SIM_CYCLES: {budget} ({verdict})")
+
+    if args.validate:
+        samples = read_process_log(args.validate)
+        mismatches = validate(program, samples, policy=args.policy, data=data)
+        print(f"validation: {len(samples) - len(mismatches)}/{len(samples)} sampled fetch pcs match")
+        for cycle, expected, modelled in mismatches[:10]:
+            modelled_text = f"0x{modelled:08x}" if modelled is not None else "n/a"
+            print(f"  cycle {cycle}: testbench 0x{expected:08x}, model {modelled_text}")
+
+
+if __name__ == "__main__":
+    main()
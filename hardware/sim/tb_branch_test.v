@@ -73,6 +73,7 @@ module tb_branch_test;
     end
     
     // 測試程序
+    integer data_fd;
     initial begin
         // 初始化
         rst_n = 0;
@@ -84,6 +85,12 @@ module tb_branch_test;
         for (integer i = 0; i < 1024; i = i + 1) begin
             data_memory[i] = 32'h00000000;
         end
+        // 若組譯器輸出了資料段映像（.data），預先載入資料記憶體
+        data_fd = $fopen("./tests/hex_outputs/branch_integrated_test_data.hex", "r");
+        if (data_fd != 0) begin
+            $fclose(data_fd);
+            $readmemh("./tests/hex_outputs/branch_integrated_test_data.hex", data_memory);
+        end
         
         // 重置釋放
         #20;
@@ -185,8 +192,29 @@ module tb_branch_test;
     
     // 產生波形檔案
     initial begin
-        $dumpfile("tests/output/tb_branch_test.vcd");
-        $dumpvars(0, tb_branch_test);
+        if (!$test$plusargs("novcd")) begin  // 回歸測試以 +novcd 略過波形
+            $dumpfile("tests/output/tb_branch_test.vcd");
+            $dumpvars(0, tb_branch_test);
+        end
+    end
+
+    // 退休指令追蹤：以 +trace=<檔案> 執行時，記錄每條到達 WB 的指令與每次資料寫入（供 assembler/cosim.py 比對）
+    integer fp_trace;
+    reg [8*256-1:0] trace_path;
+    initial begin
+        fp_trace = 0;
+        if ($value$plusargs("trace=%s", trace_path))
+            fp_trace = $fopen(trace_path, "w");
+    end
+    always @(posedge clk) begin
+        if (rst_n && fp_trace) begin
+            if (u_cpu.mem_wb_pc_plus_4 != 32'b0) // 清除與停頓產生的氣泡 PC+4 為 0
+                $fdisplay(fp_trace, "retire,0x%h,%0d,0x%h", u_cpu.mem_wb_pc_plus_4 - 32'd4,
+                          u_cpu.mem_wb_reg_write ? u_cpu.mem_wb_rd_addr : 5'd0,
+                          (u_cpu.mem_wb_reg_write && u_cpu.mem_wb_rd_addr != 5'd0) ? u_cpu.mem_wb_data : 32'h0);
+            if (d_mem_wen == 4'b1111)
+                $fdisplay(fp_trace, "store,0x%h,0x%h", d_mem_addr, d_mem_wdata);
+        end
     end
 
 endmodule 
\ No newline at end of file
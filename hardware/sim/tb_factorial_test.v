@@ -43,6 +43,7 @@ module tb_factorial_test;
     // 指令記憶體（類似 ROM）
     reg [31:0] instr_mem [0:MEM_SIZE_WORDS-1];
     integer i;
+    integer data_fd;
     initial begin
         // 從 .hex 檔案載入指令（例如，由組譯器產生）
         // 重要：確保此路徑相對於執行 vvp 的位置是正確的（通常是專案根目錄）
@@ -52,6 +53,12 @@ module tb_factorial_test;
         for (i = 0; i < MEM_SIZE_WORDS; i = i + 1) begin
             data_mem[i] = 32'b0;
         end
+        // 若組譯器輸出了資料段映像（.data），預先載入資料記憶體
+        data_fd = $fopen("./tests/hex_outputs/factorial_test_data.hex", "r");
+        if (data_fd != 0) begin
+            $fclose(data_fd);
+            $readmemh("./tests/hex_outputs/factorial_test_data.hex", data_mem);
+        end
     end
 
     // 指令記憶體讀取邏輯（組合邏輯）
@@ -161,8 +168,29 @@ module tb_factorial_test;
 
     // 波形輸出
     initial begin
-        $dumpfile("tests/output/tb_factorial_test.vcd");
-        $dumpvars(0, tb_factorial_test);
+        if (!$test$plusargs("novcd")) begin  // 回歸測試以 +novcd 略過波形
+            $dumpfile("tests/output/tb_factorial_test.vcd");
+            $dumpvars(0, tb_factorial_test);
+        end
+    end
+
+    // 退休指令追蹤：以 +trace=<檔案> 執行時，記錄每條到達 WB 的指令與每次資料寫入（供 assembler/cosim.py 比對）
+    integer fp_trace;
+    reg [8*256-1:0] trace_path;
+    initial begin
+        fp_trace = 0;
+        if ($value$plusargs("trace=%s", trace_path))
+            fp_trace = $fopen(trace_path, "w");
+    end
+    always @(posedge clk) begin
+        if (rst_n && fp_trace) begin
+            if (u_cpu.mem_wb_pc_plus_4 != 32'b0) // 清除與停頓產生的氣泡 PC+4 為 0
+                $fdisplay(fp_trace, "retire,0x%h,%0d,0x%h", u_cpu.mem_wb_pc_plus_4 - 32'd4,
+                          u_cpu.mem_wb_reg_write ? u_cpu.mem_wb_rd_addr : 5'd0,
+                          (u_cpu.mem_wb_reg_write && u_cpu.mem_wb_rd_addr != 5'd0) ? u_cpu.mem_wb_data : 32'h0);
+            if (d_mem_wen == 4'b1111)
+                $fdisplay(fp_trace, "store,0x%h,0x%h", d_mem_addr, d_mem_wdata);
+        end
     end
 
 endmodule 
\ No newline at end of file
@@ -0,0 +1,141 @@
+// RISC-V 32IM CPU 差分模糊測試平台（由 assembler/fuzz.py 驅動）
+// 檔案：hardware/sim/tb_fuzz.v
+//
+// 一次編譯、一次執行處理一整批程式：
+//   vvp tb_fuzz.vvp +batch=<目錄> +count=<N> [+max_cycles=<週期數>]
+// 依序載入 <目錄>/prog_<i>.hex（與 prog_<i>_data.hex，若存在），重置 CPU 後執行到
+// 最後一個字組（停機迴圈）到達 WB 或 max_cycles 為止，再把暫存器與非零資料記憶體
+// 寫入 <目錄>/rtl_state.csv：
+//   program,<i>,<是否停機>,<週期數>
+//   reg,<n>,0x<值>          x1..x31
+//   mem,<字組索引>,0x<值>   非零的資料記憶體字組
+
+`timescale 1ns / 1ps
+
+module tb_fuzz;
+
+    // 參數
+    localparam CLK_PERIOD = 10; // 時脈週期（納秒）
+    localparam MEM_SIZE_WORDS = 1024; // 記憶體大小（字組數），與 assembler/iss.py 相同
+
+    // 測試平台信號
+    reg         clk;
+    reg         rst_n;
+
+    // 待測裝置（DUT）介面信號
+    wire [31:0] i_mem_addr;
+    reg  [31:0] i_mem_rdata;
+
+    wire [31:0] d_mem_addr;
+    wire [31:0] d_mem_wdata;
+    wire [3:0]  d_mem_wen;
+    reg  [31:0] d_mem_rdata;
+
+    wire [1023:0] regs_flat;
+
+    // 實例化 CPU
+    cpu_top u_cpu (
+        .clk            (clk),
+        .rst_n          (rst_n),
+        .i_mem_addr     (i_mem_addr),
+        .i_mem_rdata    (i_mem_rdata),
+        .d_mem_addr     (d_mem_addr),
+        .d_mem_wdata    (d_mem_wdata),
+        .d_mem_wen      (d_mem_wen),
+        .d_mem_rdata    (d_mem_rdata),
+        .regs_flat      (regs_flat)
+    );
+
+    // 記憶體模型（與 tb_*_test.v 相同）
+    reg [31:0] instr_mem [0:MEM_SIZE_WORDS-1];
+    reg [31:0] data_mem [0:MEM_SIZE_WORDS-1];
+
+    always @(*) begin
+        if (i_mem_addr < 4*MEM_SIZE_WORDS) begin
+            i_mem_rdata = instr_mem[i_mem_addr / 4];
+        end else begin
+            i_mem_rdata = 32'hdeadbeef; // 超出邊界，回傳可識別的無效指令
+        end
+    end
+
+    always @(*) begin
+        if (d_mem_addr < 4*MEM_SIZE_WORDS) begin
+            d_mem_rdata = data_mem[d_mem_addr / 4];
+        end else begin
+            d_mem_rdata = 32'hxxxxxxxx; // 超出邊界
+        end
+    end
+
+    always @(posedge clk) begin
+        if (rst_n && d_mem_wen == 4'b1111 && d_mem_addr < 4*MEM_SIZE_WORDS) begin
+            data_mem[d_mem_addr / 4] <= d_mem_wdata;
+        end
+    end
+
+    // 時脈產生
+    initial begin
+        clk = 0;
+        forever #(CLK_PERIOD / 2) clk = ~clk;
+    end
+
+    // 批次執行
+    reg [8*256-1:0] batch_dir;
+    reg [8*300-1:0] path;
+    integer count, max_cycles, prog, cycle, i, fd, fp_state;
+    reg [31:0] halt_pc;
+    reg halted;
+    initial begin
+        rst_n = 0;
+        if (!$value$plusargs("batch=%s", batch_dir)) begin
+            $display("tb_fuzz: +batch=<目錄> 未指定");
+            $finish;
+        end
+        if (!$value$plusargs("count=%d", count)) count = 1;
+        if (!$value$plusargs("max_cycles=%d", max_cycles)) max_cycles = 20000;
+        $sformat(path, "%0s/rtl_state.csv", batch_dir);
+        fp_state = $fopen(path, "w");
+
+        for (prog = 0; prog < count; prog = prog + 1) begin
+            // 重置 CPU 並載入下一個程式；未載入的指令字組保持為 x
+            rst_n = 0;
+            for (i = 0; i < MEM_SIZE_WORDS; i = i + 1) begin
+                instr_mem[i] = 32'hxxxxxxxx;
+                data_mem[i] = 32'b0;
+            end
+            $sformat(path, "%0s/prog_%0d.hex", batch_dir, prog);
+            $readmemh(path, instr_mem);
+            $sformat(path, "%0s/prog_%0d_data.hex", batch_dir, prog);
+            fd = $fopen(path, "r");
+            if (fd != 0) begin
+                $fclose(fd);
+                $readmemh(path, data_mem);
+            end
+            halt_pc = 0;
+            for (i = 0; i < MEM_SIZE_WORDS; i = i + 1) begin
+                if (instr_mem[i] !== 32'hxxxxxxxx) halt_pc = 4 * i; // 最後一個字組是停機迴圈
+            end
+            repeat (5) @(posedge clk);
+            @(negedge clk);
+            rst_n = 1;
+
+            // 停機迴圈到達 WB 時，之前的指令都已寫回
+            halted = 0;
+            for (cycle = 0; cycle < max_cycles && !halted; cycle = cycle + 1) begin
+                @(posedge clk);
+                if (u_cpu.mem_wb_pc_plus_4 == halt_pc + 4) halted = 1;
+            end
+            @(negedge clk);
+
+            $fdisplay(fp_state, "program,%0d,%0d,%0d", prog, halted, cycle);
+            for (i = 1; i < 32; i = i + 1) begin
+                $fdisplay(fp_state, "reg,%0d,0x%h", i, regs_flat[i*32 +: 32]);
+            end
+            for (i = 0; i < MEM_SIZE_WORDS; i = i + 1) begin
+                if (data_mem[i] !== 32'b0) $fdisplay(fp_state, "mem,%0d,0x%h", i, data_mem[i]);
+            end
+        end
+        $fclose(fp_state);
+        $finish;
+    end
+
+endmodule